@@ -9,18 +9,28 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from src.data_fetcher import fetch_nasa_power, load_sample_data
-from src.modeling import train_simple_regressor, forecast_hours, train_arima_model
+from src.modeling import train_simple_regressor, forecast_hours, train_arima_model, train_gradient_boosting
 from src.multi_hour_optimizer import optimize_battery_schedule
+from src.demand import fit_demand_profiles, DemandProfiles, DEMAND_COLUMN
+from src.stochastic_optimizer import optimize_battery_schedule_stochastic
 from src.csv_handler import parse_csv_upload
-from src.db import insert_forecast, insert_schedule, load_recent_forecasts, load_recent_schedules
+from src.db import insert_forecast, insert_schedule
+from src.history import page_forecasts, page_schedules, mse_series
+from src.accuracy import record_actuals, load_accuracy
+from src.feature_store import FeatureStore
+from src.pipeline import STATE_DIR
+from src import metrics, shared_store
 
 st.set_page_config(page_title="AmplifyAI - Solar & Battery Intelligence", layout="wide")
 
+metrics.enable()
+
 st.title("AmplifyAI")
 st.caption("Precision Energy Intelligence — Multi-hour solar forecasting and battery optimization")
 
-@st.cache_data
-def load_and_train_model():
+TRAINING_KEY = 'app:training'
+
+def train_default_model():
     try:
         df_nasa = fetch_nasa_power()
         if df_nasa is not None and len(df_nasa) > 5:
@@ -36,10 +46,27 @@ def load_and_train_model():
     features = ['hour', 'ghi', 'temp_c', 'cloud_pct']
     model, mse = train_simple_regressor(df, features, 'output_kwh')
     
-    return model, df, mse, data_source
+    arrays, meta = shared_store.pack_frame(df)
+    arrays['model'] = shared_store.pack_object(model)
+    return arrays, {**meta, 'mse': float(mse), 'data_source': data_source}
+
+@st.cache_resource
+def load_and_train_model():
+    # Every server process on the host shares one read-only copy of the training frame and model
+    entry = shared_store.get_or_publish(TRAINING_KEY, train_default_model)
+    return entry.load_object('model'), entry.frame(), entry.meta['mse'], entry.meta['data_source']
 
 model, df, mse, data_source = load_and_train_model()
 
+@st.cache_resource
+def load_gbm_model(df):
+    return train_gradient_boosting(df, ['hour', 'ghi', 'temp_c', 'cloud_pct'], 'output_kwh', time_budget_s=5.0)
+
+@st.cache_resource
+def load_feature_store():
+    # The pipeline's store: dated uploads are kept per location
+    return FeatureStore(os.path.join(STATE_DIR, 'features'))
+
 st.sidebar.header("Configuration")
 st.sidebar.info(f"**Data Source:** {data_source}")
 st.sidebar.metric("Model MSE", f"{mse:.4f}")
@@ -55,7 +82,24 @@ if uploaded_file is not None:
     else:
         st.sidebar.error(f"CSV Error: {error}")
 
-tab1, tab2, tab3 = st.tabs(["Forecast", "Optimize", "History"])
+HISTORY_PAGE_SIZE = 25
+HISTORY_MAX_POINTS = 500
+
+def history_pager(cursors, next_cursor, key):
+    """Newer/Older buttons over a stack of keyset cursors kept in session state"""
+    col1, col2, col3 = st.columns([1, 1, 6])
+    with col1:
+        if st.button("Newer", disabled=len(cursors) == 1, key=f'{key}_newer'):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if st.button("Older", disabled=next_cursor is None, key=f'{key}_older'):
+            cursors.append(next_cursor)
+            st.rerun()
+    with col3:
+        st.caption(f"Page {len(cursors)}")
+
+tab1, tab2, tab3, tab4 = st.tabs(["Forecast", "Optimize", "History", "Diagnostics"])
 
 with tab1:
     st.header("24-Hour Solar Forecast")
@@ -66,7 +110,8 @@ with tab1:
         horizon_hours = st.slider("Forecast Horizon (hours)", 6, 48, 24)
     
     with col2:
-        model_type = st.selectbox("Model", ["linear", "arima", "prophet"])
+        model_type = st.selectbox("Model", ["linear", "gbm", "arima", "prophet"],
+                                  format_func=lambda x: {"gbm": "gradient boosting"}.get(x, x))
     
     with col3:
         lat = st.number_input("Latitude", value=15.3647, format="%.4f")
@@ -74,15 +119,30 @@ with tab1:
     with col4:
         lon = st.number_input("Longitude", value=75.1234, format="%.4f")
     
+    if uploaded_file is not None and df_uploaded is not None:
+        # Uploaded production scores any stored forecasts covering the same timestamps
+        record_actuals(lat, lon, df_uploaded)
+        if 'timestamp' in df_uploaded.columns:
+            # Only dated uploads extend lag history (hour-only files would be re-anchored
+            # to a new day on every use), under a site of their own location
+            try:
+                load_feature_store().append(f'upload_{lat:.4f}_{lon:.4f}', df_uploaded)
+            except Exception as e:
+                st.sidebar.warning(f"Could not add upload to the feature store: {e}")
+    
     if st.button("Refresh Forecast", type="primary"):
         st.cache_data.clear()
+        load_and_train_model.clear()
+        shared_store.discard(TRAINING_KEY)
         st.rerun()
     
-    forecast_data = forecast_hours(model, df, ['hour', 'ghi', 'temp_c', 'cloud_pct'], n_hours=horizon_hours, model_type=model_type)
+    forecast_model, forecast_mse = (load_gbm_model(df) if model_type == 'gbm' else (model, mse))
+    forecast_data = forecast_hours(forecast_model, df, ['hour', 'ghi', 'temp_c', 'cloud_pct'], n_hours=horizon_hours, model_type=model_type, location=(lat, lon))
     
-    insert_forecast(lat, lon, model_type, forecast_data, mse)
+    insert_forecast(lat, lon, model_type, forecast_data, forecast_mse)
     
     forecast_df = pd.DataFrame({
+        'Time': pd.to_datetime(forecast_data['timestamps']),
         'Hour': forecast_data['hours'],
         'Mean Forecast (kWh)': forecast_data['mean'],
         'Uncertainty (kWh)': forecast_data['std']
@@ -91,7 +151,7 @@ with tab1:
     forecast_df['Upper Bound'] = forecast_df['Mean Forecast (kWh)'] + forecast_df['Uncertainty (kWh)']
     forecast_df['Lower Bound'] = forecast_df['Lower Bound'].clip(lower=0)
     
-    base_chart = alt.Chart(forecast_df).encode(x=alt.X('Hour:Q', title='Hour of Day'))
+    base_chart = alt.Chart(forecast_df).encode(x=alt.X('Time:T', title='Time'))
     
     line = base_chart.mark_line(color='#1f77b4', strokeWidth=3).encode(
         y=alt.Y('Mean Forecast (kWh):Q', title='Solar Production (kWh)')
@@ -108,7 +168,7 @@ with tab1:
     
     col1, col2 = st.columns([3, 1])
     with col1:
-        st.dataframe(forecast_df[['Hour', 'Mean Forecast (kWh)', 'Uncertainty (kWh)']], width='stretch')
+        st.dataframe(forecast_df[['Time', 'Mean Forecast (kWh)', 'Uncertainty (kWh)']], width='stretch')
     with col2:
         csv = forecast_df.to_csv(index=False)
         st.download_button(label="Download CSV", data=csv, file_name=f"solar_forecast_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv", mime="text/csv")
@@ -136,22 +196,46 @@ with tab2:
         objective = st.selectbox("Optimization Objective", ["minimize_unmet", "maximize_self_consumption", "balanced"], index=0, format_func=lambda x: {"minimize_unmet": "Minimize Unmet Demand", "maximize_self_consumption": "Maximize Self-Consumption", "balanced": "Balanced Approach"}[x])
     
     opt_horizon = st.slider("Optimization Horizon (hours)", 6, 24, 24)
-    constant_demand = st.number_input("Expected Demand per Hour (kWh)", value=5.0, min_value=0.1)
+    shapes = (['learned'] if DEMAND_COLUMN in df.columns and df[DEMAND_COLUMN].notna().any() else []) + ['flat', 'residential']
+    col1, col2 = st.columns(2)
+    with col1:
+        demand_shape = st.selectbox("Demand Profile", shapes, format_func=lambda x: {"learned": "Learned from uploaded load history", "residential": "Typical residential (morning/evening peaks)", "flat": "Flat"}[x])
+    with col2:
+        demand_level = st.number_input("Average Demand per Hour (kWh)", value=5.0, min_value=0.1, disabled=demand_shape == 'learned')
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        stochastic = st.checkbox("Plan against forecast uncertainty", value=False, help="Optimize the next action against sampled forecast scenarios instead of the mean forecast")
+    with col2:
+        n_scenarios = st.slider("Scenarios", 20, 300, 100, 10, disabled=not stochastic)
     
     if st.button("Run Optimization", type="primary"):
-        forecast_data = forecast_hours(model, df, ['hour', 'ghi', 'temp_c', 'cloud_pct'], n_hours=opt_horizon, model_type='linear')
+        forecast_data = forecast_hours(model, df, ['hour', 'ghi', 'temp_c', 'cloud_pct'], n_hours=opt_horizon, model_type='linear', location=(lat, lon))
         forecast_kwh = forecast_data['mean']
-        demand_kwh = [constant_demand] * opt_horizon
+        step_h = forecast_data['step_minutes'] / 60.0
+        if demand_shape == 'learned':
+            demand_profiles = fit_demand_profiles(df, site_col=None)
+        else:
+            demand_profiles = DemandProfiles.typical(['app'], demand_level, demand_shape)
+        demand_kwh = demand_profiles.for_forecast(forecast_data)
         
         with st.spinner("Optimizing battery schedule..."):
-            result = optimize_battery_schedule(forecast_kwh=forecast_kwh, demand_kwh=demand_kwh, battery_capacity_kwh=battery_capacity, initial_soc_kwh=initial_soc, charge_rate_max=charge_rate, discharge_rate_max=discharge_rate, roundtrip_eff=efficiency, objective=objective)
+            battery_params = dict(battery_capacity_kwh=battery_capacity, initial_soc_kwh=initial_soc, charge_rate_max=charge_rate, discharge_rate_max=discharge_rate, roundtrip_eff=efficiency, objective=objective, step_hours=step_h)
+            if stochastic:
+                result = optimize_battery_schedule_stochastic(forecast_kwh, forecast_data['std'], demand_kwh, n_scenarios=n_scenarios, **battery_params)
+            else:
+                result = optimize_battery_schedule(forecast_kwh=forecast_kwh, demand_kwh=demand_kwh, **battery_params)
         
         if result['status'] == 'success':
             st.success("Optimization completed successfully")
+            if stochastic:
+                unmet = np.array(result['scenario_unmet'])
+                st.caption(f"Planned against {result['n_scenarios']} scenarios — unmet demand: {unmet.mean():.2f} kWh expected, {np.percentile(unmet, 90):.2f} kWh at P90. The schedule below shares the first action with every scenario and then follows the scenario closest to the mean forecast.")
             
             schedule_df = pd.DataFrame({
+                'Time': pd.to_datetime(forecast_data['timestamps']),
                 'Hour': forecast_data['hours'],
-                'Forecast (kWh)': forecast_kwh,
+                'Forecast (kWh)': result['scenario_pv'] if stochastic else forecast_kwh,
                 'Demand (kWh)': demand_kwh,
                 'Charge (kWh)': result['charge'],
                 'Discharge (kWh)': result['discharge'],
@@ -159,17 +243,17 @@ with tab2:
                 'Action': result['actions']
             })
             
-            soc_chart = alt.Chart(schedule_df).mark_line(color='#2ca02c', strokeWidth=3, point=True).encode(x=alt.X('Hour:Q', title='Hour of Day'), y=alt.Y('SOC (kWh):Q', title='Battery State of Charge (kWh)', scale=alt.Scale(domain=[0, battery_capacity]))).properties(width=800, height=300, title='Battery State of Charge Over Time')
+            soc_chart = alt.Chart(schedule_df).mark_line(color='#2ca02c', strokeWidth=3, point=True).encode(x=alt.X('Time:T', title='Time'), y=alt.Y('SOC (kWh):Q', title='Battery State of Charge (kWh)', scale=alt.Scale(domain=[0, battery_capacity]))).properties(width=800, height=300, title='Battery State of Charge Over Time')
             st.altair_chart(soc_chart, use_container_width=None)
             
-            charge_discharge_df = schedule_df[['Hour', 'Charge (kWh)', 'Discharge (kWh)']].melt(id_vars=['Hour'], var_name='Action Type', value_name='Energy (kWh)')
-            bar_chart = alt.Chart(charge_discharge_df).mark_bar().encode(x=alt.X('Hour:Q', title='Hour of Day'), y=alt.Y('Energy (kWh):Q'), color=alt.Color('Action Type:N', scale=alt.Scale(domain=['Charge (kWh)', 'Discharge (kWh)'], range=['#2ca02c', '#d62728']))).properties(width=800, height=250, title='Charge & Discharge Schedule')
+            charge_discharge_df = schedule_df[['Time', 'Charge (kWh)', 'Discharge (kWh)']].melt(id_vars=['Time'], var_name='Action Type', value_name='Energy (kWh)')
+            bar_chart = alt.Chart(charge_discharge_df).mark_bar().encode(x=alt.X('Time:T', title='Time'), y=alt.Y('Energy (kWh):Q'), color=alt.Color('Action Type:N', scale=alt.Scale(domain=['Charge (kWh)', 'Discharge (kWh)'], range=['#2ca02c', '#d62728']))).properties(width=800, height=250, title='Charge & Discharge Schedule')
             st.altair_chart(bar_chart, use_container_width=None)
             
             st.subheader("Recommended Actions")
             for idx, row in schedule_df.iterrows():
                 if row['Charge (kWh)'] > 0.1 or row['Discharge (kWh)'] > 0.1:
-                    with st.expander(f"Hour {row['Hour']}: {row['Action']}"):
+                    with st.expander(f"{row['Time']:%a %H:%M}: {row['Action']}"):
                         st.write(f"**Forecast:** {row['Forecast (kWh)']:.2f} kWh")
                         st.write(f"**Demand:** {row['Demand (kWh)']:.2f} kWh")
                         st.write(f"**Battery SOC:** {row['SOC (kWh)']:.2f} kWh")
@@ -189,38 +273,95 @@ with tab2:
 with tab3:
     st.header("Performance History")
     
-    forecasts = load_recent_forecasts(10)
-    schedules = load_recent_schedules(5)
+    st.subheader("Forecast Runs")
+    forecast_cursors = st.session_state.setdefault('forecast_cursors', [None])
+    forecast_page, forecast_next = page_forecasts(HISTORY_PAGE_SIZE, before_id=forecast_cursors[-1])
     
-    if forecasts:
-        st.subheader("Recent Forecasts")
+    if forecast_page:
         forecast_history_df = pd.DataFrame([
-            {'Timestamp': f['timestamp'][:10], 'Model': f['model'], 'MSE': f['mse']}
-            for f in forecasts
+            {'ID': f['id'], 'Timestamp': f['timestamp'][:16].replace('T', ' '), 'Model': f['model'], 'MSE': f['mse'],
+             'Steps Scored': f"{f['matched_steps'] or 0}/{f['n_steps']}" if f['n_steps'] else '—'}
+            for f in forecast_page
         ])
-        st.dataframe(forecast_history_df, width='stretch')
+        st.dataframe(forecast_history_df, width='stretch', hide_index=True)
+        history_pager(forecast_cursors, forecast_next, 'forecast')
         
-        mse_data = pd.DataFrame([
-            {'Date': f['timestamp'][:10], 'MSE': f['mse']}
-            for f in forecasts
-        ])
-        mse_chart = alt.Chart(mse_data).mark_line(point=True).encode(
-            x='Date:N', y='MSE:Q'
-        ).properties(width=800, height=300, title='Forecast Accuracy Trend (MSE)')
+        # Streamed from the DB and LTTB-decimated server-side so the chart spec stays small
+        mse_data = mse_series(max_points=HISTORY_MAX_POINTS)
+        mse_chart = alt.Chart(mse_data).mark_line(point=len(mse_data) <= 100).encode(
+            x=alt.X('timestamp:T', title='Run Time'), y=alt.Y('mse:Q', title='MSE'), color=alt.Color('model:N', title='Model')
+        ).properties(width=800, height=300, title='Training MSE Trend')
         st.altair_chart(mse_chart, use_container_width=None)
     else:
         st.info("No forecast history yet. Generate forecasts to see history.")
     
-    if schedules:
-        st.subheader("Recent Battery Schedules")
+    accuracy = load_accuracy()
+    if accuracy:
+        st.subheader("Forecast vs Actual Accuracy")
+        accuracy_df = pd.DataFrame(accuracy)
+        totals_df = pd.DataFrame(load_accuracy(by_step=False)).rename(columns={'model': 'Model', 'n': 'Steps Scored', 'mae': 'MAE (kWh)', 'rmse': 'RMSE (kWh)', 'bias': 'Bias (kWh)'})
+        st.dataframe(totals_df, width='stretch')
+        accuracy_long = accuracy_df.melt(id_vars=['model', 'horizon_step'], value_vars=['mae', 'rmse', 'bias'], var_name='Metric', value_name='kWh')
+        accuracy_chart = alt.Chart(accuracy_long).mark_line(point=True).encode(
+            x=alt.X('horizon_step:Q', title='Steps Ahead'), y='kWh:Q', color='model:N', strokeDash='Metric:N'
+        ).properties(width=800, height=300, title='Forecast Error by Horizon Step')
+        st.altair_chart(accuracy_chart, use_container_width=None)
+    
+    schedule_cursors = st.session_state.setdefault('schedule_cursors', [None])
+    schedule_page, schedule_next = page_schedules(HISTORY_PAGE_SIZE, before_id=schedule_cursors[-1])
+    if schedule_page:
+        st.subheader("Battery Schedules")
         schedule_history_df = pd.DataFrame([
-            {'Timestamp': s['timestamp'][:10], 'Horizon': s['horizon'], 'Objective': s['objective']}
-            for s in schedules
+            {'ID': s['id'], 'Timestamp': s['timestamp'][:16].replace('T', ' '), 'Horizon': s['horizon'], 'Objective': s['objective'],
+             'Charge (kWh)': s['summary'].get('total_charge'), 'Discharge (kWh)': s['summary'].get('total_discharge')}
+            for s in schedule_page
         ])
-        st.dataframe(schedule_history_df, width='stretch')
+        st.dataframe(schedule_history_df, width='stretch', hide_index=True)
+        history_pager(schedule_cursors, schedule_next, 'schedule')
     else:
         st.info("No schedule history yet. Run optimizations to see history.")
 
+with tab4:
+    st.header("Diagnostics")
+    st.caption("Latency and error counters for this server process since it started.")
+    
+    rows = metrics.registry.snapshot()
+    latencies = [r for r in rows if r['type'] == 'histogram']
+    counters = [r for r in rows if r['type'] == 'counter']
+    
+    if latencies:
+        latency_df = pd.DataFrame([
+            {
+                'Metric': r['name'].removesuffix('_seconds'),
+                'Labels': ', '.join(f"{k}={v}" for k, v in r['labels'].items()),
+                'Calls': r['count'],
+                'Mean (ms)': r['mean'] * 1000,
+                'p50 (ms)': r['p50'] * 1000,
+                'p95 (ms)': r['p95'] * 1000,
+                'p99 (ms)': r['p99'] * 1000,
+                'Total (s)': r['sum'],
+            }
+            for r in latencies
+        ])
+        latency_df['Series'] = latency_df['Metric'] + latency_df['Labels'].map(lambda l: f" [{l}]" if l else "")
+        st.subheader("Latency")
+        st.dataframe(latency_df.drop(columns=['Series']), width='stretch')
+        p95_chart = alt.Chart(latency_df).mark_bar(color='#1f77b4').encode(
+            x=alt.X('p95 (ms):Q'), y=alt.Y('Series:N', sort='-x', title=None)
+        ).properties(width=800, height=max(150, 25 * len(latency_df)), title='p95 Latency by Call')
+        st.altair_chart(p95_chart, use_container_width=None)
+    else:
+        st.info("No instrumented calls recorded yet.")
+    
+    if counters:
+        st.subheader("Counters")
+        st.dataframe(pd.DataFrame([
+            {'Counter': r['name'], 'Labels': ', '.join(f"{k}={v}" for k, v in r['labels'].items()), 'Value': r['value']}
+            for r in counters
+        ]), width='stretch')
+    
+    st.download_button(label="Download Prometheus Metrics", data=metrics.registry.to_prometheus(), file_name="amplifyai_metrics.prom", mime="text/plain")
+
 st.sidebar.markdown("---")
 st.sidebar.markdown("### About AmplifyAI")
 st.sidebar.markdown("""
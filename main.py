@@ -2,9 +2,12 @@ import logging
 import sys
 import argparse
 
+import pandas as pd
+
 from src.data_fetcher import fetch_nasa_power, load_sample_data
 from src.modeling import train_simple_regressor, predict_next
 from src.optimizer import simple_battery_opt
+from src.demand import fit_demand_profiles, DemandProfiles, DEMAND_COLUMN
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 log = logging.getLogger('AmplifyAI')
@@ -13,7 +16,7 @@ def build_features_from_row(row):
     return [row['hour'], row['ghi'], row['temp_c'], row['cloud_pct']]
 
 
-def run_cli():
+def run_cli(demand_shape='flat'):
     """Phase 1 CLI mode - single hour forecast and optimization"""
     log.info('AmplifyAI starting…')
 
@@ -48,7 +51,12 @@ def run_cli():
 
     pred = predict_next(model, build_features_from_row(next_row))
 
-    expected_demand = 5.0
+    # Next-hour demand from the dataset's load history, else 5 kWh/h on average following `demand_shape`
+    if DEMAND_COLUMN in df.columns and df[DEMAND_COLUMN].notna().any():
+        expected_demand = float(fit_demand_profiles(df, site_col=None).forecast(1)[0, 0])
+    else:
+        next_ts = pd.Timestamp.now().normalize() + pd.Timedelta(hours=next_hour)
+        expected_demand = float(DemandProfiles.typical(['cli'], 5.0, demand_shape).forecast(1, start=next_ts)[0, 0])
     deficit = expected_demand - pred
 
     print("\n" + "="*50)
@@ -79,6 +87,55 @@ def run_cli():
     print("="*50 + "\n")
 
 
+def run_daemon(sites_path=None, interval_s=900, max_ticks=None, metrics_port=None, metrics_file=None, nwp_path=None,
+               poll_s=None):
+    """Scheduled pipeline mode - ingest, train, forecast and optimize every site"""
+    from src import metrics
+    from src.pipeline import PipelineRunner, load_sites, DEFAULT_SITE
+    from src.drift import DriftMonitor
+
+    if metrics_port or metrics_file:
+        metrics.enable()
+    if metrics_port:
+        metrics.start_http_server(metrics_port)
+
+    sites = load_sites(sites_path) if sites_path else [dict(DEFAULT_SITE)]
+    log.info(f'AmplifyAI pipeline starting for {len(sites)} site(s), every {interval_s}s')
+    runner = PipelineRunner(sites, metrics_path=metrics_file, nwp_path=nwp_path,
+                            drift=DriftMonitor() if poll_s else None)
+    try:
+        runner.run_forever(interval_s=interval_s, max_ticks=max_ticks, poll_s=poll_s)
+    except KeyboardInterrupt:
+        log.info('Pipeline stopped.')
+
+
+def run_retention_job(keep_days=None):
+    """Roll history older than the retention window into daily/weekly aggregates and compact the DB"""
+    from src.retention import run_retention, RAW_RETENTION_DAYS
+
+    report = run_retention(keep_days=keep_days or RAW_RETENTION_DAYS)
+    if report['error']:
+        log.error(f"Retention failed: {report['error']}")
+        sys.exit(1)
+
+
+def run_batch_job(path, out='-', fmt='jsonl', workers=4, horizon_hours=None, nwp_path=None):
+    """Train, forecast and optimize every site in a directory or manifest, streaming results"""
+    from src.batch import discover_sites, run_batch
+
+    try:
+        sites = discover_sites(path)
+    except (OSError, ValueError) as e:
+        log.error(f'Could not read batch sites from {path}: {e}')
+        sys.exit(1)
+    if not sites:
+        log.error(f'No site datasets found in {path}')
+        sys.exit(1)
+    summary = run_batch(sites, out=out, fmt=fmt, max_workers=workers, horizon_hours=horizon_hours, nwp_path=nwp_path)
+    if summary['failed']:
+        sys.exit(1)
+
+
 def run_streamlit():
     """Phase 2 Streamlit UI mode - multi-hour forecast and optimization"""
     import subprocess
@@ -93,6 +150,12 @@ def main():
 Examples:
   python main.py             # Launch Streamlit UI (default)
   python main.py --cli       # Run CLI mode (Phase 1)
+  python main.py --daemon --sites sites.yaml --interval 900
+                             # Run the scheduled pipeline
+  python main.py --retention --keep-days 30
+                             # Roll up and compact old history (e.g. nightly cron)
+  python main.py --batch data/sites --out results.jsonl --workers 8
+                             # Forecast and optimize a directory of per-site files
   python main.py --help      # Show this help message
         '''
     )
@@ -103,10 +166,124 @@ Examples:
         help='Run in CLI mode (Phase 1 single-hour forecast)'
     )
     
+    parser.add_argument(
+        '--demand-shape',
+        choices=('flat', 'residential'),
+        default='flat',
+        help='Daily demand shape for --cli when the data has no load history (default: flat 5 kWh/h)'
+    )
+    
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        help='Run the scheduled ingest/train/forecast/optimize pipeline'
+    )
+    
+    parser.add_argument(
+        '--retention',
+        action='store_true',
+        help='Roll up history older than --keep-days and compact the database, then exit'
+    )
+    
+    parser.add_argument(
+        '--keep-days',
+        type=int,
+        default=None,
+        help='Days of full-resolution history kept by --retention (default: 30)'
+    )
+    
+    parser.add_argument(
+        '--batch',
+        metavar='PATH',
+        default=None,
+        help='Forecast and optimize every site in a directory of CSV/Parquet files or a YAML/CSV manifest, then exit'
+    )
+    
+    parser.add_argument(
+        '--out',
+        default='-',
+        help='Output file for --batch results (default: stdout)'
+    )
+    
+    parser.add_argument(
+        '--format',
+        choices=('jsonl', 'csv', 'parquet'),
+        default='jsonl',
+        help='--batch output: one JSON line per site, or one csv/parquet row per site and step (default: jsonl)'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=4,
+        help='Sites processed concurrently in --batch mode (default: 4)'
+    )
+    
+    parser.add_argument(
+        '--horizon',
+        type=int,
+        default=None,
+        help='Forecast horizon in hours for --batch mode (default: each site\'s horizon_hours, 24)'
+    )
+    
+    parser.add_argument(
+        '--nwp',
+        metavar='DIR',
+        default=None,
+        help='Gridded weather-forecast run directory (grid.json + .npy arrays) used as forecast inputs in --daemon and --batch modes'
+    )
+    
+    parser.add_argument(
+        '--sites',
+        default=None,
+        help='YAML file with a `sites:` list for --daemon mode'
+    )
+    
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=900,
+        help='Seconds between pipeline ticks in --daemon mode (default: 900)'
+    )
+    
+    parser.add_argument(
+        '--poll',
+        type=float,
+        default=None,
+        help='Check sensor telemetry against each forecast/schedule every N seconds in --daemon mode and re-run drifted sites between ticks'
+    )
+    
+    parser.add_argument(
+        '--ticks',
+        type=int,
+        default=None,
+        help='Stop --daemon mode after this many ticks'
+    )
+    
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=None,
+        help='Serve Prometheus metrics on this port in --daemon mode'
+    )
+    
+    parser.add_argument(
+        '--metrics-file',
+        default=None,
+        help='Write Prometheus metrics to this file after every --daemon tick'
+    )
+    
     args = parser.parse_args()
     
     if args.cli:
-        run_cli()
+        run_cli(args.demand_shape)
+    elif args.daemon:
+        run_daemon(args.sites, args.interval, args.ticks, args.metrics_port, args.metrics_file, args.nwp,
+                   args.poll)
+    elif args.retention:
+        run_retention_job(args.keep_days)
+    elif args.batch:
+        run_batch_job(args.batch, args.out, args.format, args.workers, args.horizon, args.nwp)
     else:
         run_streamlit()
 
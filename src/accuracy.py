@@ -0,0 +1,186 @@
+"""
+Forecast-vs-actual accuracy tracking.
+
+As realized production arrives (uploaded CSVs, pipeline datasets or
+resampled telemetry), it is matched by timestamp to stored forecasts whose
+horizon overlaps it. Each newly matched step is written into the forecast's
+`actual_json` and its error is folded into the `forecast_accuracy` rollup
+(running n, Σerr, Σ|err|, Σerr² per model, location and horizon step) with an
+UPSERT, so nothing is ever recomputed over full history and dashboard reads
+only touch the small rollup table.
+
+Errors are forecast minus actual: positive bias means over-forecasting.
+"""
+import json
+import math
+import sqlite3
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from . import db
+from . import metrics
+from .timeseries import to_step, step_hours
+
+log = logging.getLogger('amplifyai.accuracy')
+
+LOCATION_DECIMALS = 4
+
+
+def actuals_from_power(readings, step='1h', power_col='pv_power_kw', time_col='timestamp'):
+    """
+    Energy per forecast step from instantaneous PV power telemetry.
+
+    Mean power over each step (labelled at its start) times the step length.
+    """
+    step = to_step(step)
+    df = pd.DataFrame({'timestamp': pd.to_datetime(readings[time_col]), 'power': readings[power_col]})
+    mean_kw = df.set_index('timestamp')['power'].resample(step, label='left', closed='left').mean().dropna()
+    return pd.DataFrame({'timestamp': mean_kw.index, 'output_kwh': mean_kw.to_numpy() * step_hours(step)})
+
+
+def _actual_lookup(actuals, value_col):
+    if isinstance(actuals, pd.Series):
+        stamps, values = actuals.index, actuals.to_numpy(dtype=float)
+    elif 'timestamp' in actuals.columns:
+        stamps, values = actuals['timestamp'], actuals[value_col].to_numpy(dtype=float)
+    else:
+        return {}  # hour-only frames carry no real dates to match against
+    stamps = pd.to_datetime(stamps)
+    keep = np.isfinite(values)
+    return {ts.isoformat(): float(v) for ts, v in zip(stamps[keep], values[keep])}
+
+
+@metrics.timed('db', op='record_actuals')
+def record_actuals(lat, lon, actuals, value_col='output_kwh', db_path=None):
+    """
+    Match realized production at a location to stored forecasts and update error rollups.
+
+    Args:
+        lat, lon: Location the forecasts were stored under
+        actuals: DataFrame with 'timestamp' and `value_col`, or a Series indexed by timestamp;
+            values are energy per forecast step (kWh)
+        value_col: Column holding realized production
+        db_path: Database file (default `db.DB_PATH`)
+
+    Returns:
+        Number of forecast steps newly matched (steps matched earlier are never counted twice)
+    """
+    lookup = _actual_lookup(actuals, value_col)
+    if not lookup:
+        return 0
+    first, last = min(lookup), max(lookup)
+    lat_r, lon_r = round(float(lat), LOCATION_DECIMALS), round(float(lon), LOCATION_DECIMALS)
+
+    try:
+        db_path = db_path or db.DB_PATH
+        db.init_db(db_path)
+        conn = sqlite3.connect(db_path)
+        try:
+            # take the write lock before reading so concurrent callers for the same
+            # location cannot both match the same unmatched steps
+            conn.execute('BEGIN IMMEDIATE')
+            c = conn.cursor()
+            rows = c.execute('''SELECT id, model_used, payload, forecast_json, actual_json, matched_steps
+                                FROM forecast_history
+                                WHERE horizon_end >= ? AND horizon_start <= ? AND matched_steps < n_steps
+                                  AND ROUND(location_lat, 4) = ? AND ROUND(location_lon, 4) = ?''',
+                             (first, last, lat_r, lon_r)).fetchall()
+
+            sums = {}  # (model, step) -> [n, Σerr, Σ|err|, Σerr²]
+            updates = []
+            for row_id, model, payload, forecast_json, actual_json, matched in rows:
+                forecast = db.decode_forecast_row(payload, forecast_json, as_lists=True)
+                stamps, mean = forecast.get('timestamps', []), forecast.get('mean', [])
+                actual = json.loads(actual_json) if actual_json else [None] * len(mean)
+                newly = 0
+                for i, ts in enumerate(stamps):
+                    if actual[i] is not None or ts not in lookup:
+                        continue
+                    actual[i] = lookup[ts]
+                    err = float(mean[i]) - actual[i]
+                    acc = sums.setdefault((model, i), [0, 0.0, 0.0, 0.0])
+                    acc[0] += 1
+                    acc[1] += err
+                    acc[2] += abs(err)
+                    acc[3] += err * err
+                    newly += 1
+                if newly:
+                    updates.append((json.dumps(actual), matched + newly, row_id))
+
+            now = datetime.now().isoformat()
+            c.executemany('UPDATE forecast_history SET actual_json = ?, matched_steps = ? WHERE id = ?', updates)
+            c.executemany('''INSERT INTO forecast_accuracy
+                             (model_used, location_lat, location_lon, horizon_step, n, sum_err, sum_abs_err, sum_sq_err, updated_at)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                             ON CONFLICT (model_used, location_lat, location_lon, horizon_step) DO UPDATE SET
+                                 n = n + excluded.n,
+                                 sum_err = sum_err + excluded.sum_err,
+                                 sum_abs_err = sum_abs_err + excluded.sum_abs_err,
+                                 sum_sq_err = sum_sq_err + excluded.sum_sq_err,
+                                 updated_at = excluded.updated_at''',
+                          [(model, lat_r, lon_r, step, *acc, now) for (model, step), acc in sums.items()])
+            conn.commit()
+        finally:
+            conn.close()
+        matched_total = sum(acc[0] for acc in sums.values())
+        metrics.count('forecast_steps_matched_total', matched_total)
+        return matched_total
+    except Exception as e:
+        db._record_error('record_actuals', e)
+        return 0
+
+
+def _stats(n, sum_err, sum_abs, sum_sq):
+    return {
+        'n': int(n),
+        'mae': sum_abs / n,
+        'rmse': math.sqrt(sum_sq / n),
+        'bias': sum_err / n,
+    }
+
+
+@metrics.timed('db', op='load_accuracy')
+def load_accuracy(model=None, lat=None, lon=None, by_step=True, db_path=None):
+    """
+    Error metrics from the rollup table (cost independent of forecast history length).
+
+    Args:
+        model: Restrict to one model
+        lat, lon: Restrict to one location
+        by_step: One row per (model, horizon step); otherwise one row per model
+        db_path: Database file (default `db.DB_PATH`)
+
+    Returns:
+        list of dicts with 'model', 'horizon_step' (when by_step), 'n', 'mae', 'rmse', 'bias'
+    """
+    where, params = [], []
+    if model is not None:
+        where.append('model_used = ?')
+        params.append(model)
+    if lat is not None and lon is not None:
+        where.extend(['location_lat = ?', 'location_lon = ?'])
+        params.extend([round(float(lat), LOCATION_DECIMALS), round(float(lon), LOCATION_DECIMALS)])
+    group = 'model_used, horizon_step' if by_step else 'model_used'
+    try:
+        db_path = db_path or db.DB_PATH
+        db.init_db(db_path)
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute(f'''SELECT {group}, SUM(n), SUM(sum_err), SUM(sum_abs_err), SUM(sum_sq_err)
+                                FROM forecast_accuracy
+                                {'WHERE ' + ' AND '.join(where) if where else ''}
+                                GROUP BY {group} ORDER BY {group}''', params).fetchall()
+        conn.close()
+    except Exception as e:
+        db._record_error('load_accuracy', e)
+        return []
+
+    out = []
+    for row in rows:
+        if by_step:
+            out.append({'model': row[0], 'horizon_step': row[1], **_stats(*row[2:])})
+        else:
+            out.append({'model': row[0], **_stats(*row[1:])})
+    return out
@@ -0,0 +1,275 @@
+"""
+Battery dispatch backtesting against historical generation and demand.
+
+Policies plan on a forecast (perfect foresight unless a forecast column is
+given) and are then executed against what actually happened:
+
+- 'rule': the simple_battery_opt greedy rule, reacting to each step's actual
+  surplus or deficit; the whole fleet is dispatched in one vectorized pass.
+- 'lp': optimize_battery_schedule re-solved once per day over a rolling
+  horizon; sites run in parallel and identical day solves are cached.
+
+Usage:
+    python -m src.backtest --sites 20 --days 365 --policy rule --policy lp
+"""
+import os
+import time
+import pickle
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import metrics
+from .optimizer import vectorized_dispatch
+from .multi_hour_optimizer import optimize_battery_schedule
+from .timeseries import ensure_timestamps, infer_step, step_hours
+
+log = logging.getLogger('amplifyai.backtest')
+
+POLICIES = ('rule', 'lp')
+
+DEFAULT_BATTERY = {
+    'battery_capacity_kwh': 50.0,
+    'initial_soc_kwh': 20.0,
+    'charge_rate_max': 10.0,
+    'discharge_rate_max': 10.0,
+    'roundtrip_eff': 0.9,
+}
+
+CACHE_DECIMALS = 3  # kWh rounding of solve inputs for cache keys
+
+
+class DaySolveCache:
+    """Thread-safe memo of per-day LP solutions, optionally persisted as a pickle."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    self._entries = pickle.load(f)
+            except Exception as e:
+                log.warning(f"Ignoring unreadable backtest cache {path}: {e}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(*parts):
+        h = hashlib.sha1()
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                h.update(np.round(part, CACHE_DECIMALS).tobytes())
+            else:
+                h.update(repr(part).encode())
+        return h.hexdigest()
+
+    def get_or_solve(self, key, solve):
+        with self._lock:
+            plan = self._entries.get(key)
+            if plan is not None:
+                self.hits += 1
+                return plan
+            self.misses += 1
+        plan = solve()
+        with self._lock:
+            self._entries[key] = plan
+        return plan
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with self._lock, open(tmp, 'wb') as f:
+            pickle.dump(self._entries, f)
+        os.replace(tmp, self.path)
+
+
+def _site_arrays(history, forecast_col=None):
+    """Split a long-format history into per-site (pv, demand, forecast, step_h) arrays."""
+    missing = {'site_id', 'output_kwh', 'demand_kwh'} - set(history.columns)
+    if missing:
+        raise ValueError(f"History is missing columns: {', '.join(sorted(missing))}")
+    sites = {}
+    for site_id, g in history.groupby('site_id', observed=True, sort=True):
+        g = ensure_timestamps(g.drop(columns='site_id'))
+        pv = g['output_kwh'].to_numpy(dtype=float)
+        forecast = g[forecast_col].to_numpy(dtype=float) if forecast_col else pv
+        sites[site_id] = (pv, g['demand_kwh'].to_numpy(dtype=float), forecast, step_hours(infer_step(g)))
+    return sites
+
+
+def _execute(plan_charge, plan_discharge, pv, demand, soc, battery, step_h):
+    """Apply a planned schedule to actual PV/demand; returns (charge, discharge, soc_end)."""
+    cap = battery['battery_capacity_kwh']
+    eff = battery['roundtrip_eff']
+    ch_max = battery['charge_rate_max'] * step_h
+    dis_max = battery['discharge_rate_max'] * step_h
+    n = len(pv)
+    charge = np.zeros(n)
+    discharge = np.zeros(n)
+    net = demand - pv
+    for t in range(n):
+        if net[t] > 0:
+            discharge[t] = d = min(plan_discharge[t], net[t], dis_max, soc)
+            soc -= d
+        elif net[t] < 0:
+            charge[t] = c = min(plan_charge[t], -net[t], ch_max, (cap - soc) / eff)
+            soc += eff * c
+    return charge, discharge, soc
+
+
+def _lp_site(pv, demand, forecast, step_h, battery, horizon_hours, engine, cache):
+    """Rolling daily LP for one site: plan `horizon_hours` ahead, execute the first day."""
+    day = int(round(24 / step_h))
+    horizon = max(day, int(round(horizon_hours / step_h)))
+    n = len(pv)
+    charge = np.zeros(n)
+    discharge = np.zeros(n)
+    soc = float(battery['initial_soc_kwh'])
+    params = tuple(sorted(battery.items()))
+
+    for start in range(0, n, day):
+        window = slice(start, min(n, start + horizon))
+        f_win, d_win = forecast[window], demand[window]
+        key = DaySolveCache.key(f_win, d_win, round(soc, CACHE_DECIMALS), params, step_h, engine)
+
+        def solve():
+            plan = optimize_battery_schedule(
+                f_win.tolist(), d_win.tolist(),
+                battery_capacity_kwh=battery['battery_capacity_kwh'], initial_soc_kwh=soc,
+                charge_rate_max=battery['charge_rate_max'], discharge_rate_max=battery['discharge_rate_max'],
+                roundtrip_eff=battery['roundtrip_eff'], engine=engine, step_hours=step_h)
+            return np.asarray(plan['charge']), np.asarray(plan['discharge'])
+
+        plan_charge, plan_discharge = cache.get_or_solve(key, solve)
+        span = slice(start, min(n, start + day))
+        k = span.stop - span.start
+        charge[span], discharge[span], soc = _execute(
+            plan_charge[:k], plan_discharge[:k], pv[span], demand[span], soc, battery, step_h)
+    return charge, discharge
+
+
+def _site_report(pv, demand, charge, discharge):
+    deficit = np.clip(demand - pv, 0, None)
+    surplus = np.clip(pv - demand, 0, None)
+    unmet = float((deficit - discharge).sum())
+    total_demand = float(demand.sum())
+    return {
+        'demand_kwh': total_demand,
+        'pv_kwh': float(pv.sum()),
+        'unmet_kwh': unmet,
+        'curtailed_kwh': float((surplus - charge).sum()),
+        'throughput_kwh': float(charge.sum() + discharge.sum()),
+        'served_pct': 100.0 * (1 - unmet / total_demand) if total_demand > 0 else 100.0,
+    }
+
+
+def run_backtest(history, policy='rule', battery=None, forecast_col=None, horizon_hours=48,
+                 engine='pulp', max_workers=4, cache=None):
+    """
+    Replay a fleet's history through a dispatch policy.
+
+    Args:
+        history: Long-format DataFrame with site_id, timestamp (or hour), output_kwh, demand_kwh
+        policy: 'rule' or 'lp'
+        battery: Battery parameters (keys as in DEFAULT_BATTERY), shared by all sites
+        forecast_col: Column the LP plans on; None plans on actual output (perfect foresight)
+        horizon_hours: LP look-ahead; the first day of each solve is executed
+        engine: optimize_battery_schedule engine for 'lp' ('pulp' or 'sparse')
+        max_workers: Sites solved concurrently for 'lp'
+        cache: DaySolveCache to reuse day solves across runs (a fresh one by default)
+
+    Returns:
+        dict with 'policy', per-site 'sites' reports, fleet 'totals', 'compute_s',
+        'solves' and 'cache_hits'
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy: {policy}")
+    battery = {**DEFAULT_BATTERY, **(battery or {})}
+    cache = cache if cache is not None else DaySolveCache()
+    sites = _site_arrays(history, forecast_col)
+    hits0, misses0 = cache.hits, cache.misses
+
+    t0 = time.perf_counter()
+    with metrics.timer('backtest', policy=policy):
+        results = {}
+        if policy == 'rule':
+            lengths = {len(pv) for pv, _, _, _ in sites.values()}
+            steps = {step_h for _, _, _, step_h in sites.values()}
+            groups = [list(sites)] if len(lengths) == 1 and len(steps) == 1 else [[s] for s in sites]
+            for ids in groups:
+                step_h = sites[ids[0]][3]
+                out = vectorized_dispatch(
+                    np.stack([sites[s][0] for s in ids]), np.stack([sites[s][1] for s in ids]),
+                    battery_capacity_kwh=battery['battery_capacity_kwh'], soc_kwh=battery['initial_soc_kwh'],
+                    roundtrip_eff=battery['roundtrip_eff'], charge_rate_max=battery['charge_rate_max'],
+                    discharge_rate_max=battery['discharge_rate_max'], step_hours=step_h)
+                for i, s in enumerate(ids):
+                    results[s] = (out['charge'][i], out['discharge'][i])
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = {s: pool.submit(_lp_site, pv, demand, forecast, step_h, battery, horizon_hours,
+                                          engine, cache)
+                           for s, (pv, demand, forecast, step_h) in sites.items()}
+                results = {s: f.result() for s, f in futures.items()}
+    compute_s = time.perf_counter() - t0
+
+    reports = {s: _site_report(sites[s][0], sites[s][1], *results[s]) for s in sites}
+    totals = {k: sum(r[k] for r in reports.values())
+              for k in ('demand_kwh', 'pv_kwh', 'unmet_kwh', 'curtailed_kwh', 'throughput_kwh')}
+    totals['served_pct'] = 100.0 * (1 - totals['unmet_kwh'] / totals['demand_kwh']) if totals['demand_kwh'] > 0 else 100.0
+    cache.save()
+    return {
+        'policy': policy,
+        'sites': reports,
+        'totals': totals,
+        'compute_s': compute_s,
+        'solves': cache.misses - misses0,
+        'cache_hits': cache.hits - hits0,
+    }
+
+
+def format_report(reports):
+    lines = [f"{'policy':<8} {'served %':>9} {'unmet kWh':>12} {'curtailed kWh':>14} {'throughput kWh':>15} "
+             f"{'compute s':>10} {'solves':>7} {'hits':>6}"]
+    for r in reports:
+        t = r['totals']
+        lines.append(f"{r['policy']:<8} {t['served_pct']:>9.2f} {t['unmet_kwh']:>12.1f} {t['curtailed_kwh']:>14.1f} "
+                     f"{t['throughput_kwh']:>15.1f} {r['compute_s']:>10.2f} {r['solves']:>7} {r['cache_hits']:>6}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    from .synthetic import generate_fleet
+
+    parser = argparse.ArgumentParser(description='Backtest battery dispatch policies on synthetic fleet history')
+    parser.add_argument('--sites', type=int, default=20)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--policy', action='append', choices=POLICIES, help='Policy to run (repeatable; default: all)')
+    parser.add_argument('--engine', default='sparse', choices=('pulp', 'sparse'), help="LP engine (default: 'sparse')")
+    parser.add_argument('--horizon', type=int, default=48, help='LP look-ahead in hours (default: 48)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--cache', help='Pickle file to persist day solves between runs')
+    args = parser.parse_args(argv)
+
+    history = generate_fleet(args.sites, periods=24 * args.days, seed=args.seed)
+    cache = DaySolveCache(args.cache)
+    reports = [run_backtest(history, policy, horizon_hours=args.horizon, engine=args.engine,
+                            max_workers=args.workers, cache=cache)
+               for policy in (args.policy or POLICIES)]
+    print(format_report(reports))
+
+
+if __name__ == '__main__':
+    main()
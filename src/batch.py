@@ -0,0 +1,280 @@
+"""
+Batch mode: train, forecast and optimize a whole fleet of per-site datasets.
+
+Sites come from a directory of per-site files (CSV, Parquet or Feather; the
+file stem is the site id) or from a YAML/CSV manifest of site definitions
+whose `source` points at each file. Sites run in parallel and each result is
+written as soon as the site finishes, so only the sites in flight are ever
+held in memory. A site that fails is written as a `failed` record and the
+batch carries on.
+
+Usage:
+    python main.py --batch synthetic_data/sites --out results.jsonl
+    python main.py --batch fleet.yaml --format parquet --out results.parquet --workers 8
+"""
+import os
+import sys
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from .csv_handler import _validate_frame
+from .modeling import train_simple_regressor, forecast_hours
+from .multi_hour_optimizer import optimize_battery_schedule
+from .pipeline import DEFAULT_SITE, FEATURES, TARGET, site_demand
+from .nwp import open_gridded_forecast
+from . import metrics
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+log = logging.getLogger('amplifyai.batch')
+
+READERS = {
+    '.csv': pd.read_csv,
+    '.parquet': pd.read_parquet,
+    '.feather': pd.read_feather,
+}
+FORMATS = ('jsonl', 'csv', 'parquet')
+MANIFEST_EXTENSIONS = ('.yaml', '.yml', '.csv')
+# Per-step columns of the csv/parquet output; failed sites get one row with only status and error set
+COLUMNS = {
+    'site_id': 'string', 'status': 'string', 'error': 'string', 'step': 'Int32', 'timestamp': 'string',
+    'forecast_kwh': 'float64', 'forecast_std': 'float64', 'demand_kwh': 'float64', 'charge_kwh': 'float64',
+    'discharge_kwh': 'float64', 'soc_kwh': 'float64', 'unmet_kwh': 'float64', 'mse': 'float64',
+}
+
+
+def _manifest_sites(path):
+    if path.endswith('.csv'):
+        entries = pd.read_csv(path).to_dict('records')
+    else:
+        with open(path, 'r') as f:
+            entries = (yaml.safe_load(f) or {}).get('sites') or []
+    base = os.path.dirname(os.path.abspath(path))
+    sites = []
+    for entry in entries:
+        # Blank CSV cells fall back to the defaults
+        entry = {k: v for k, v in entry.items() if not (isinstance(v, float) and np.isnan(v))}
+        source = entry.pop('path', None) or entry.get('source')
+        if not source:
+            raise ValueError(f"Manifest entry without a source: {entry}")
+        source = os.path.join(base, str(source))
+        sites.append({**DEFAULT_SITE, **entry, 'source': source,
+                      'site_id': str(entry.get('site_id') or os.path.splitext(os.path.basename(source))[0])})
+    return sites
+
+
+def discover_sites(path):
+    """
+    Site definitions for a batch run.
+
+    Args:
+        path: Directory of per-site data files, or a YAML (`sites:` list) / CSV manifest
+            whose `source` (or `path`) column points at each site's file, relative to the manifest
+
+    Returns:
+        list of site dicts with DEFAULT_SITE filled in
+    """
+    if os.path.isdir(path):
+        names = sorted(n for n in os.listdir(path)
+                       if os.path.splitext(n)[1].lower() in READERS and not n.startswith('.'))
+        return [{**DEFAULT_SITE, 'site_id': os.path.splitext(n)[0], 'source': os.path.join(path, n)}
+                for n in names]
+    if path.lower().endswith(MANIFEST_EXTENSIONS):
+        return _manifest_sites(path)
+    raise ValueError(f"Expected a directory or a .yaml/.csv manifest, got {path}")
+
+
+def read_site_frame(path):
+    """Load and validate one site's training data; raises ValueError when it is unusable."""
+    reader = READERS.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        raise ValueError(f"Unsupported file type: {path}")
+    df, error = _validate_frame(reader(path))
+    if error:
+        raise ValueError(error)
+    return df
+
+
+def _floats(values):
+    return [float(v) for v in values]
+
+
+def process_site(site, horizon_hours=None, exogenous=None):
+    """Train, forecast the full horizon and optimize one site. Never raises: failures come back as records."""
+    t0 = time.perf_counter()
+    record = {'site_id': site['site_id'], 'source': site['source']}
+    try:
+        df = read_site_frame(site['source'])
+        model, mse = train_simple_regressor(df, FEATURES, TARGET)
+        horizon_hours = horizon_hours or site['horizon_hours']
+        forecast = forecast_hours(model, df, FEATURES, n_hours=horizon_hours,
+                                  location=(site['lat'], site['lon'], site.get('tz_offset_hours')),
+                                  exogenous=exogenous)
+        step_h = forecast['step_minutes'] / 60.0
+        demand_kwh = site_demand(site, forecast, df)
+        schedule = optimize_battery_schedule(
+            forecast['mean'], demand_kwh, battery_capacity_kwh=site['battery_capacity_kwh'],
+            initial_soc_kwh=float(site['initial_soc_kwh']), charge_rate_max=site['charge_rate_max'],
+            discharge_rate_max=site['discharge_rate_max'], roundtrip_eff=site['roundtrip_eff'],
+            objective=site['objective'], step_hours=step_h)
+        record.update({
+            'status': 'ok',
+            'rows': len(df),
+            'mse': float(mse),
+            'horizon_hours': horizon_hours,
+            'step_minutes': forecast['step_minutes'],
+            'timestamps': forecast['timestamps'],
+            'forecast_kwh': forecast['mean'],
+            'forecast_std': forecast['std'],
+            'demand_kwh': _floats(demand_kwh),
+            'optimizer_status': schedule.get('status'),
+            'charge': _floats(schedule['charge']),
+            'discharge': _floats(schedule['discharge']),
+            'soc': _floats(schedule['soc']),
+            'unmet_demand': _floats(schedule['unmet_demand']),
+            'summary': {'total_charge': float(sum(schedule['charge'])),
+                        'total_discharge': float(sum(schedule['discharge'])),
+                        'total_unmet': float(sum(schedule['unmet_demand'])),
+                        'final_soc': float(schedule['soc'][-1])},
+        })
+    except Exception as e:
+        log.warning(f"[{site['site_id']}] Batch site failed: {e}")
+        record.update({'status': 'failed', 'error': f'{type(e).__name__}: {e}'})
+    record['seconds'] = time.perf_counter() - t0
+    metrics.count('batch_sites_total', status=record['status'])
+    return record
+
+
+def _step_frame(record):
+    """Long per-step rows for the columnar outputs."""
+    if record['status'] != 'ok':
+        frame = pd.DataFrame({'site_id': [record['site_id']], 'status': [record['status']],
+                              'error': [record.get('error')]})
+    else:
+        n = len(record['forecast_kwh'])
+        frame = pd.DataFrame({
+            'site_id': [record['site_id']] * n, 'status': ['ok'] * n, 'error': [None] * n,
+            'step': np.arange(n), 'timestamp': record['timestamps'],
+            'forecast_kwh': record['forecast_kwh'], 'forecast_std': record['forecast_std'],
+            'demand_kwh': record['demand_kwh'], 'charge_kwh': record['charge'],
+            'discharge_kwh': record['discharge'], 'soc_kwh': record['soc'],
+            'unmet_kwh': record['unmet_demand'], 'mse': record['mse'],
+        })
+    return frame.reindex(columns=list(COLUMNS)).astype(COLUMNS)
+
+
+class _JsonlSink:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, record):
+        self.f.write(json.dumps(record) + '\n')
+        self.f.flush()
+
+
+class _CsvSink:
+    def __init__(self, f):
+        self.f = f
+        self.header = True
+
+    def write(self, record):
+        _step_frame(record).to_csv(self.f, index=False, header=self.header)
+        self.header = False
+        self.f.flush()
+
+
+class _ParquetSink:
+    """One row group per site, so the file grows as sites finish."""
+
+    def __init__(self, path):
+        empty = pd.DataFrame(columns=list(COLUMNS)).astype(COLUMNS)
+        self.schema = pa.Schema.from_pandas(empty, preserve_index=False)
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, record):
+        self.writer.write_table(pa.Table.from_pandas(_step_frame(record), schema=self.schema, preserve_index=False))
+
+    def close(self):
+        self.writer.close()
+
+
+def _open_sink(out, fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown batch output format: {fmt}")
+    if fmt == 'parquet':
+        if not PYARROW_AVAILABLE:
+            raise ImportError("Parquet output needs pyarrow; use --format csv or jsonl")
+        if out in (None, '-'):
+            raise ValueError("Parquet output needs a file path (--out)")
+        return _ParquetSink(out), None
+    f = sys.stdout if out in (None, '-') else open(out, 'w', newline='')
+    sink = _JsonlSink(f) if fmt == 'jsonl' else _CsvSink(f)
+    return sink, (f if f is not sys.stdout else None)
+
+
+def run_batch(sites, out='-', fmt='jsonl', max_workers=4, horizon_hours=None, nwp_path=None):
+    """
+    Process every site in parallel, writing each result as soon as its site finishes.
+
+    Args:
+        sites: Site dicts (see discover_sites)
+        out: Output path, or '-' for stdout (jsonl and csv only)
+        fmt: 'jsonl' (one record per site), 'csv' or 'parquet' (one row per site and forecast step)
+        max_workers: Sites processed concurrently
+        horizon_hours: Override every site's `horizon_hours`
+        nwp_path: Gridded weather run (see src.nwp) interpolated for all sites up front
+
+    Returns:
+        dict with 'sites', 'ok', 'failed' (site ids) and 'wall_s'
+    """
+    sites = list(sites)
+    grid = open_gridded_forecast(nwp_path) if nwp_path else None
+    weather = grid.site_exogenous(sites) if grid is not None else {}
+    sink, f = _open_sink(out, fmt)
+    t0 = time.perf_counter()
+    summary = {'sites': 0, 'ok': 0, 'failed': []}
+
+    def emit(future):
+        record = future.result()
+        sink.write(record)
+        summary['sites'] += 1
+        if record['status'] == 'ok':
+            summary['ok'] += 1
+        else:
+            summary['failed'].append(record['site_id'])
+
+    try:
+        # Keep a bounded window in flight so a large fleet never piles up finished results
+        window = 2 * max_workers
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = set()
+            for site in sites:
+                pending.add(pool.submit(process_site, site, horizon_hours, weather.get(site['site_id'])))
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        emit(future)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    emit(future)
+    finally:
+        if hasattr(sink, 'close'):
+            sink.close()
+        if f is not None:
+            f.close()
+
+    summary['wall_s'] = time.perf_counter() - t0
+    log.info(f"Batch finished: {summary['ok']}/{summary['sites']} sites ok in {summary['wall_s']:.1f}s"
+             + (f" (failed: {', '.join(summary['failed'])})" if summary['failed'] else ''))
+    return summary
@@ -0,0 +1,297 @@
+"""
+Performance benchmarks for the forecasting, optimization, storage and ingest hot paths.
+
+Usage:
+    python -m src.benchmark                          # run full suite, print table
+    python -m src.benchmark --quick                  # smallest size of each case only
+    python -m src.benchmark --save benchmarks/baseline.json
+    python -m src.benchmark --baseline benchmarks/baseline.json --tolerance 0.25
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from . import db
+from .modeling import train_simple_regressor, train_gradient_boosting, forecast_hours, forecast_fleet
+from .multi_hour_optimizer import optimize_battery_schedule
+from .optimizer import vectorized_dispatch
+from .site_optimizer import optimize_site_schedule
+from .stochastic_optimizer import optimize_battery_schedule_stochastic
+from .csv_handler import parse_csv_upload
+from .history import page_forecasts, mse_series
+from .sensors.cleaning import TelemetryCleaner
+from .demand import fit_demand_profiles
+from .drift import DriftMonitor
+from .synthetic import generate_fleet, generate_site_frame, generate_telemetry, prefill_forecast_history
+
+FEATURES = ['hour', 'ghi', 'temp_c', 'cloud_pct']
+SEED = 42
+
+
+def _training_frame(n_rows):
+    return generate_site_frame(n_rows, seed=SEED)
+
+
+def _setup_forecast(horizon):
+    df = _training_frame(200)
+    model, _ = train_simple_regressor(df, FEATURES, 'output_kwh')
+    return lambda: forecast_hours(model, df, FEATURES, n_hours=horizon)
+
+
+def _setup_forecast_fleet(n_sites):
+    df = _training_frame(200)
+    model, _ = train_simple_regressor(df, FEATURES, 'output_kwh')
+
+    def run():
+        for _ in range(n_sites):
+            forecast_hours(model, df, FEATURES, n_hours=24)
+    return run
+
+
+def _setup_forecast_fleet_gbm(n_sites):
+    # Shared gradient boosting model, whole fleet × horizon predicted in one call
+    model, _ = train_gradient_boosting(_training_frame(5000), FEATURES, 'output_kwh')
+    frames = {f'site_{i}': generate_site_frame(48, seed=SEED + i) for i in range(n_sites)}
+    return lambda: forecast_fleet(model, frames, FEATURES, n_hours=24)
+
+
+def _setup_optimize(horizon):
+    rng = np.random.default_rng(SEED)
+    hours = np.arange(horizon) % 24
+    forecast = np.clip(np.sin((hours - 6) * np.pi / 12), 0, None) * 8 + rng.normal(0, 0.3, horizon).clip(0)
+    demand = 4 + 2 * rng.random(horizon)
+    return lambda: optimize_battery_schedule(forecast.tolist(), demand.tolist())
+
+
+def _setup_site_optimize(steps):
+    # 5-minute steps, three battery strings, grid-connected with prices
+    rng = np.random.default_rng(SEED)
+    step_h = 5 / 60
+    hours = (np.arange(steps) * step_h) % 24
+    pv = np.clip(np.sin((hours - 6) * np.pi / 12), 0, None) * 8 * step_h
+    demand = (3 + 2 * rng.random(steps)) * step_h
+    batteries = [{'capacity_kwh': 30}, {'capacity_kwh': 50}, {'capacity_kwh': 100, 'initial_soc_kwh': 50}]
+    return lambda: optimize_site_schedule(pv, demand, batteries, step_hours=step_h, grid_import_max_kw=5,
+                                          grid_export_max_kw=5, import_price=0.2, export_price=0.05,
+                                          objective='minimize_cost')
+
+
+def _setup_stochastic(n_scenarios):
+    hours = np.arange(24)
+    forecast = np.clip(np.sin((hours - 6) * np.pi / 12), 0, None) * 8
+    return lambda: optimize_battery_schedule_stochastic(forecast, 0.15 * forecast + 0.1, [5.0] * 24,
+                                                        n_scenarios=n_scenarios, seed=SEED)
+
+
+def _setup_dispatch(n_sites):
+    # Rule-based dispatch for a fleet over a full year of hourly steps
+    rng = np.random.default_rng(SEED)
+    hours = np.arange(8760) % 24
+    pv = np.clip(np.sin((hours - 6) * np.pi / 12), 0, None) * 8 * rng.uniform(0.5, 1.5, (n_sites, 1))
+    demand = 4 + 2 * rng.random((n_sites, 8760))
+    return lambda: vectorized_dispatch(pv, demand, battery_capacity_kwh=50, soc_kwh=20,
+                                       charge_rate_max=10, discharge_rate_max=10)
+
+
+def _setup_db_insert(n_rows, db_path):
+    forecast = {'hours': list(range(24)), 'mean': [3.0] * 24, 'std': [0.4] * 24}
+
+    def run():
+        for _ in range(n_rows):
+            db.insert_forecast(15.36, 75.12, 'linear', forecast, 0.01, db_path=db_path)
+    return run
+
+
+def _setup_db_load(n_rows, db_path):
+    prefill_forecast_history(n_rows, db_path, seed=SEED)
+    return lambda: db.load_recent_forecasts(n_rows, db_path=db_path)
+
+
+def _setup_history_view(n_rows, db_path):
+    # One History tab render: first table page plus the decimated MSE chart
+    prefill_forecast_history(n_rows, db_path, seed=SEED)
+
+    def run():
+        page_forecasts(25, db_path=db_path)
+        mse_series(max_points=500, db_path=db_path)
+    return run
+
+
+def _setup_clean_telemetry(n_sites):
+    # One hour of 1 Hz inverter telemetry per site, cleaned as a single backfill chunk
+    frame = generate_telemetry(n_sites, seconds=3600, seed=SEED)['inverter']
+    return lambda: TelemetryCleaner().clean_frame(frame)
+
+
+def _setup_demand_profiles(n_sites):
+    # 30 days of hourly load per site: fit every profile, then a 48 h demand matrix for the fleet
+    history = generate_fleet(n_sites, periods=24 * 30, seed=SEED)[['site_id', 'timestamp', 'demand_kwh']]
+    return lambda: fit_demand_profiles(history).forecast(48)
+
+
+def _setup_drift(n_sites):
+    # One hour of 1 Hz inverter and BMS telemetry per site, checked against a flat 24 h plan
+    telemetry = generate_telemetry(n_sites, seconds=3600, seed=SEED)
+    frame = telemetry['inverter'][['site_id', 'ts', 'pv_power_kw']].assign(soc_kwh=telemetry['bms']['soc_kwh'].to_numpy())
+    future = pd.date_range('2024-06-01', periods=24, freq='h')
+    forecast = {'timestamps': [t.isoformat() for t in future], 'mean': [5.0] * 24, 'std': [0.85] * 24,
+                'step_minutes': 60.0}
+    schedule = {'soc': [20.0] * 24}
+
+    def run():
+        monitor = DriftMonitor()
+        for site_id in frame['site_id'].unique():
+            monitor.set_plan(site_id, forecast, schedule, capacity_kwh=50.0)
+        monitor.observe_frame(frame)
+    return run
+
+
+def _setup_csv(n_rows):
+    payload = _training_frame(n_rows).to_csv(index=False).encode('utf-8')
+    return lambda: parse_csv_upload(io.BytesIO(payload))
+
+
+# name -> (setup(size[, db_path]) -> callable, sizes, quick size, throughput unit, uses temp DB)
+CASES = {
+    'forecast_hours': (_setup_forecast, [24, 168, 720], 24, 'hours', False),
+    'forecast_fleet': (_setup_forecast_fleet, [1, 10, 50], 1, 'sites', False),
+    'forecast_fleet_gbm': (_setup_forecast_fleet_gbm, [10, 100, 500], 10, 'sites', False),
+    'optimize_battery_schedule': (_setup_optimize, [24, 48, 96], 24, 'steps', False),
+    'optimize_site_schedule': (_setup_site_optimize, [288, 2016], 288, 'steps', False),
+    'optimize_stochastic': (_setup_stochastic, [20, 100, 300], 20, 'scenarios', False),
+    'vectorized_dispatch': (_setup_dispatch, [50, 500], 50, 'sites', False),
+    'insert_forecast': (_setup_db_insert, [10, 100], 10, 'rows', True),
+    'load_recent_forecasts': (_setup_db_load, [100, 1000, 5000], 100, 'rows', True),
+    'history_view': (_setup_history_view, [10000, 100000], 10000, 'rows', True),
+    'clean_telemetry': (_setup_clean_telemetry, [10, 100], 10, 'sites', False),
+    'demand_profiles': (_setup_demand_profiles, [10, 100, 1000], 10, 'sites', False),
+    'drift_telemetry': (_setup_drift, [10, 100], 10, 'sites', False),
+    'parse_csv_upload': (_setup_csv, [1000, 10000, 100000], 1000, 'rows', False),
+}
+
+
+def measure(fn, units, repeat=3):
+    """Time `fn` (best and median of `repeat`), then record its tracemalloc peak in one extra run."""
+    fn()  # warm-up
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    best = min(times)
+    return {
+        'wall_s': best,
+        'wall_median_s': float(np.median(times)),
+        'peak_mem_kb': peak / 1024.0,
+        'throughput': units / best if best > 0 else float('inf'),
+    }
+
+
+def run_case(name, size, repeat=3):
+    setup, _, _, _, uses_db = CASES[name]
+    np.random.seed(SEED)
+    if not uses_db:
+        return measure(setup(size), size, repeat)
+    # DB cases get their own file passed explicitly, so nothing else in the process is redirected
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        return measure(setup(size, os.path.join(tmp_dir, 'bench.db')), size, repeat)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def run_suite(cases=None, quick=False, repeat=3):
+    """Run the selected cases over their sizes. Returns {'meta': ..., 'results': {case: {size: metrics}}}."""
+    results = {}
+    for name in cases or CASES:
+        _, sizes, quick_size, _, _ = CASES[name]
+        results[name] = {str(size): run_case(name, size, repeat) for size in ([quick_size] if quick else sizes)}
+    meta = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    return {'meta': meta, 'results': results}
+
+
+def compare(current, baseline, tolerance=0.25, metric='wall_s'):
+    """
+    Compare two suite runs.
+
+    Returns a list of regressions: (case, size, baseline value, current value, ratio)
+    for every case/size present in both runs whose metric grew by more than `tolerance`.
+    """
+    regressions = []
+    for name, sizes in current['results'].items():
+        for size, metrics in sizes.items():
+            base = baseline.get('results', {}).get(name, {}).get(size)
+            if not base or base.get(metric, 0) <= 0:
+                continue
+            ratio = metrics[metric] / base[metric]
+            if ratio > 1 + tolerance:
+                regressions.append((name, size, base[metric], metrics[metric], ratio))
+    return regressions
+
+
+def format_results(run):
+    lines = [f"{'case':<28}{'size':>8}{'wall ms':>12}{'peak KiB':>12}{'throughput':>16}"]
+    for name, sizes in run['results'].items():
+        unit = CASES[name][3]
+        for size, m in sizes.items():
+            lines.append(f"{name:<28}{size:>8}{m['wall_s'] * 1000:>12.2f}{m['peak_mem_kb']:>12.1f}"
+                         f"{m['throughput']:>12.0f} {unit}/s")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AmplifyAI hot-path benchmarks')
+    parser.add_argument('--case', action='append', choices=sorted(CASES), help='Run only this case (repeatable)')
+    parser.add_argument('--quick', action='store_true', help='Run only the smallest size of each case')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed repetitions per size (default: 3)')
+    parser.add_argument('--save', help='Write results as JSON to this path')
+    parser.add_argument('--baseline', help='Compare against a stored baseline JSON')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown vs baseline (default: 0.25)')
+    args = parser.parse_args(argv)
+
+    run = run_suite(args.case, quick=args.quick, repeat=args.repeat)
+    print(format_results(run))
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f"\nResults saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(run, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for name, size, base, cur, ratio in regressions:
+                print(f"  {name}[{size}]: {base * 1000:.2f} ms -> {cur * 1000:.2f} ms ({ratio:.2f}x)")
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance:.0%} vs {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Compact, versioned binary encoding for forecast and schedule payloads.
+
+Layout (little-endian):
+
+    header  '<4sBBBx'  magic b'AMPB', format version, kind, flags
+    body    '<qiHI'    axis start (epoch seconds), axis step (seconds, 0 = no axis),
+                       array table length, meta length
+            table      ASCII 'name:count,name:count,...'
+            meta       UTF-8 JSON of the remaining scalar fields (may be empty)
+            padding    to a 4-byte boundary
+            arrays     float32, back to back in table order
+
+The body is zlib-compressed when FLAG_ZLIB is set (only when that makes it
+smaller). Numeric series are stored as float32 and decoded with
+`np.frombuffer`, i.e. as read-only views into the payload buffer. Anything
+that can be re-derived is not stored: a regular forecast time axis becomes
+(start, step), from which 'timestamps', 'hours' and 'step_minutes' are
+recomputed, and schedule 'actions' strings are regenerated with
+describe_actions on decode.
+"""
+import re
+import json
+import zlib
+import struct
+import functools
+
+import numpy as np
+
+MAGIC = b'AMPB'
+VERSION = 1
+KIND_FORECAST = 1
+KIND_SCHEDULE = 2
+
+FLAG_ZLIB = 0x01
+FLAG_ACTIONS = 0x02         # schedule had describe_actions() strings
+FLAG_ACTIONS_FAILED = 0x04  # schedule had the optimization-failed placeholder
+
+HEADER = struct.Struct('<4sBBBx')
+BODY_HEADER = struct.Struct('<qiHI')
+FLOAT32 = np.dtype('<f4')
+
+FAILED_ACTION = 'Hold (optimization failed)'
+
+_NAIVE_ISO = re.compile(r'^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d$')
+
+
+def is_encoded(blob):
+    """True if `blob` is a payload produced by this module."""
+    return isinstance(blob, (bytes, bytearray, memoryview)) and bytes(blob[:4]) == MAGIC
+
+
+def _is_series(value):
+    if isinstance(value, np.ndarray):
+        return value.ndim == 1 and value.dtype.kind in 'biuf'
+    return (isinstance(value, (list, tuple))
+            and all(isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, bool) for v in value))
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _pack(kind, flags, arrays, meta, axis=(0, 0)):
+    table = ','.join(f'{name}:{len(values)}' for name, values in arrays).encode('ascii')
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8') if meta else b''
+    head = BODY_HEADER.pack(axis[0], axis[1], len(table), len(meta_bytes)) + table + meta_bytes
+    data = b''.join(np.ascontiguousarray(values, dtype=FLOAT32).tobytes() for _, values in arrays)
+    body = head + b'\x00' * (-len(head) % 4) + data
+    packed = zlib.compress(body)
+    if len(packed) < len(body):
+        body = packed
+        flags |= FLAG_ZLIB
+    return HEADER.pack(MAGIC, VERSION, kind, flags) + body
+
+
+@functools.lru_cache(maxsize=256)
+def _layout(table):
+    """[(name, start, stop)] float32 index ranges for an array table."""
+    layout, pos = [], 0
+    for entry in table.decode('ascii').split(',') if table else ():
+        name, count = entry.split(':')
+        layout.append((name, pos, pos + int(count)))
+        pos += int(count)
+    return layout
+
+
+def _unpack(blob, expected_kind):
+    magic, version, kind, flags = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Not an encoded payload")
+    if version > VERSION:
+        raise ValueError(f"Unsupported payload version {version} (this build reads up to {VERSION})")
+    if kind != expected_kind:
+        raise ValueError(f"Payload kind {kind} does not match expected kind {expected_kind}")
+    body = zlib.decompress(memoryview(blob)[HEADER.size:]) if flags & FLAG_ZLIB else memoryview(blob)[HEADER.size:]
+    start, step, table_len, meta_len = BODY_HEADER.unpack_from(body)
+    offset = BODY_HEADER.size + table_len
+    layout = _layout(bytes(body[BODY_HEADER.size:offset]))
+    meta = json.loads(bytes(body[offset:offset + meta_len])) if meta_len else {}
+    offset += meta_len
+    data = np.frombuffer(body, dtype=FLOAT32, offset=offset + -offset % 4)
+    return flags, (start, step), {name: data[lo:hi] for name, lo, hi in layout}, meta
+
+
+def _regular_axis(stamps):
+    """(start epoch s, step s) when `stamps` are naive ISO strings on a regular grid, else None."""
+    if len(stamps) < 1 or not all(isinstance(s, str) and _NAIVE_ISO.match(s) for s in (stamps[0], stamps[-1])):
+        return None
+    try:
+        axis = np.array(stamps, dtype='datetime64[s]')
+    except ValueError:
+        return None
+    steps = np.diff(axis).astype(np.int64)
+    step = int(steps[0]) if len(steps) else 3600
+    if step <= 0 or (len(steps) and not (steps == step).all()):
+        return None
+    start = int(axis[0].astype(np.int64))
+    if derive_timestamps((start, step), len(stamps), as_strings=True) != list(stamps):
+        return None
+    return start, step
+
+
+def _axis_seconds(axis, n):
+    start, step = axis
+    return np.arange(start, start + n * step, step, dtype=np.int64)[:n]
+
+
+def derive_timestamps(axis, n, as_strings=False):
+    """Time axis (start epoch s, step s) as datetime64[s], or as Timestamp.isoformat() strings."""
+    stamps = _axis_seconds(axis, n).view('datetime64[s]')
+    return np.datetime_as_string(stamps, unit='s').tolist() if as_strings else stamps
+
+
+def derive_hours(axis, n):
+    """Fractional hour of day for each step of a time axis (as timeseries.hour_of_day)."""
+    return (_axis_seconds(axis, n) % 86400 // 60) / 60.0
+
+
+def encode_forecast(forecast):
+    """
+    Encode a forecast_hours result (or any dict of numeric series and scalars).
+
+    A regular naive time axis is stored as its start and step, and 'hours' and
+    'step_minutes' are dropped when they match it; anything else is kept.
+    """
+    stamps = forecast.get('timestamps')
+    axis = _regular_axis(list(stamps)) if stamps is not None and len(stamps) else None
+    arrays, meta = [], {}
+    for key, value in forecast.items():
+        if axis and key == 'timestamps':
+            continue
+        if axis and key == 'hours' and np.allclose(value, derive_hours(axis, len(value))):
+            continue
+        if axis and key == 'step_minutes' and value * 60 == axis[1]:
+            continue
+        if _is_series(value):
+            arrays.append((key, value))
+        else:
+            meta[key] = _jsonable(value)
+    return _pack(KIND_FORECAST, 0, arrays, meta, axis or (0, 0))
+
+
+def decode_forecast(blob, as_lists=False):
+    """
+    Decode a forecast payload.
+
+    By default numeric series are read-only float32 views into the payload and
+    'timestamps' is a datetime64[s] array; with `as_lists` everything is plain
+    Python lists and ISO strings, exactly as the JSON format had it.
+    """
+    _, axis, out, meta = _unpack(blob, KIND_FORECAST)
+    if axis[1]:
+        n = len(out['mean']) if 'mean' in out else 0
+        out['timestamps'] = derive_timestamps(axis, n, as_strings=as_lists)
+        out.setdefault('hours', derive_hours(axis, n))
+        meta.setdefault('step_minutes', axis[1] / 60.0)
+    if as_lists:
+        out = {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in out.items()}
+    return {**out, **meta}
+
+
+def encode_schedule(schedule):
+    """
+    Encode an optimize_battery_schedule-style result.
+
+    The per-step 'actions' strings are not stored, only whether they came from
+    describe_actions or are the optimization-failed placeholder.
+    """
+    flags, arrays, meta = 0, [], {}
+    for key, value in schedule.items():
+        if key == 'actions':
+            failed = len(value) > 0 and all(a == FAILED_ACTION for a in value)
+            flags |= FLAG_ACTIONS_FAILED if failed else FLAG_ACTIONS
+        elif _is_series(value):
+            arrays.append((key, value))
+        else:
+            meta[key] = _jsonable(value)
+    return _pack(KIND_SCHEDULE, flags, arrays, meta)
+
+
+def decode_schedule(blob, as_lists=False):
+    """Decode a schedule payload, regenerating 'actions' from charge/discharge when they were present."""
+    from .multi_hour_optimizer import describe_actions
+
+    flags, _, out, meta = _unpack(blob, KIND_SCHEDULE)
+    if as_lists:
+        out = {k: v.tolist() for k, v in out.items()}
+    if flags & FLAG_ACTIONS_FAILED:
+        meta['actions'] = [FAILED_ACTION] * len(out.get('charge', []))
+    elif flags & FLAG_ACTIONS:
+        meta['actions'] = describe_actions(out.get('charge', []), out.get('discharge', []))
+    return {**out, **meta}
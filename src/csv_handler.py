@@ -1,26 +1,41 @@
 import pandas as pd
 import io
 
+from .timeseries import ensure_timestamps
+
 REQUIRED_COLUMNS = {'hour', 'ghi', 'temp_c', 'cloud_pct', 'output_kwh'}
+VALUE_COLUMNS = REQUIRED_COLUMNS - {'hour'}
+TIME_COLUMNS = {'hour', 'timestamp'}
+OPTIONAL_COLUMNS = ['demand_kwh']  # kept when present, e.g. load history for demand profiles
+
+def _validate_frame(df):
+    """Shared checks for uploaded frames; `timestamp` may stand in for `hour`"""
+    if len(df) < 5:
+        return None, "CSV must have at least 5 rows"
+
+    missing = VALUE_COLUMNS - set(df.columns)
+    if not TIME_COLUMNS & set(df.columns):
+        missing = missing | {'hour'}
+    if missing:
+        return None, f"Missing columns: {', '.join(sorted(missing))}"
+
+    columns = [c for c in ('timestamp', 'hour') if c in df.columns] + sorted(VALUE_COLUMNS) + \
+        [c for c in OPTIONAL_COLUMNS if c in df.columns]
+    df = df[columns]
+
+    if 'timestamp' in df.columns:
+        df = ensure_timestamps(df)
+
+    if df.isnull().any().any():
+        df = df.fillna(df.mean(numeric_only=True))
+
+    return df, None
 
 def validate_csv(file_content):
     """Validate uploaded CSV file"""
     try:
         df = pd.read_csv(io.StringIO(file_content.decode('utf-8')))
-        
-        if len(df) < 5:
-            return None, "CSV must have at least 5 rows"
-        
-        missing = REQUIRED_COLUMNS - set(df.columns)
-        if missing:
-            return None, f"Missing columns: {', '.join(missing)}"
-        
-        df = df[list(REQUIRED_COLUMNS)]
-        
-        if df.isnull().any().any():
-            df = df.fillna(df.mean(numeric_only=True))
-        
-        return df, None
+        return _validate_frame(df)
     except Exception as e:
         return None, str(e)
 
@@ -28,19 +43,6 @@ def parse_csv_upload(uploaded_file):
     """Parse uploaded CSV file from Streamlit"""
     try:
         df = pd.read_csv(uploaded_file)
-        
-        if len(df) < 5:
-            return None, "CSV must have at least 5 rows"
-        
-        missing = REQUIRED_COLUMNS - set(df.columns)
-        if missing:
-            return None, f"Missing columns: {', '.join(missing)}"
-        
-        df = df[list(REQUIRED_COLUMNS)]
-        
-        if df.isnull().any().any():
-            df = df.fillna(df.mean(numeric_only=True))
-        
-        return df, None
+        return _validate_frame(df)
     except Exception as e:
         return None, str(e)
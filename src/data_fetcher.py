@@ -1,9 +1,17 @@
 import os
+import math
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 import pandas as pd
 import requests
 from io import StringIO
 import logging
 
+from . import metrics
+from .solar import get_solar_table
+
 try:
     from .sensors.ingest import ingest_latest
     SENSORS_AVAILABLE = True
@@ -12,69 +20,159 @@ except ImportError:
 
 log = logging.getLogger('amplifyai.data_fetcher')
 
-def fetch_nasa_power(lat=15.3647, lon=75.1234):
+POWER_PARAMETERS = ('ALLSKY_SFC_SW_DWN', 'T2M', 'CLD_FRAC')
+SOLAR_CELL_DEG = 1.0           # ALLSKY_SFC_SW_DWN and CLD_FRAC: 1° cells bounded at whole degrees
+MET_CELL_DEG = (0.5, 0.625)    # T2M: MERRA-2 cells centred on its lat/lon grid points
+CACHE_TTL_S = 3600.0
+NEGATIVE_TTL_S = 60.0          # failed cells are not retried for this long (one tick's fan-out)
+CACHE_SIZE = 512
+
+def power_cell(lat, lon):
+    """Key of the region in which every requested POWER parameter comes from the same grid cells."""
+    dlat, dlon = MET_CELL_DEG
+    return (math.floor(lat / SOLAR_CELL_DEG), math.floor(lon / SOLAR_CELL_DEG),
+            math.floor((lat + 90.0) / dlat + 0.5), math.floor((lon + 180.0) / dlon + 0.5))
+
+def cell_point(cell):
+    """Centre of a power_cell region, the coordinate sent upstream for every site in it."""
+    slat, slon, mlat, mlon = cell
+    dlat, dlon = MET_CELL_DEG
+    lat_lo = max(slat * SOLAR_CELL_DEG, -90.0 + (mlat - 0.5) * dlat)
+    lat_hi = min((slat + 1) * SOLAR_CELL_DEG, -90.0 + (mlat + 0.5) * dlat)
+    lon_lo = max(slon * SOLAR_CELL_DEG, -180.0 + (mlon - 0.5) * dlon)
+    lon_hi = min((slon + 1) * SOLAR_CELL_DEG, -180.0 + (mlon + 0.5) * dlon)
+    return round((lat_lo + lat_hi) / 2, 4), round((lon_lo + lon_hi) / 2, 4)
+
+def _request_power(lat, lon, start, end):
+    """One upstream POWER request; the hourly parameter dicts, or None."""
     try:
         url = (
             'https://power.larc.nasa.gov/api/temporal/hourly/point'
-            '?parameters=ALLSKY_SFC_SW_DWN,T2M,CLD_FRAC'
+            f'?parameters={",".join(POWER_PARAMETERS)}'
             '&community=RE'
             f'&longitude={lon}&latitude={lat}'
-            '&start=20240601&end=20240601'
+            f'&start={start}&end={end}'
             '&format=JSON'
         )
+        metrics.count('fetch_nasa_power_requests_total')
         r = requests.get(url, timeout=10)
         if r.status_code != 200:
             raise Exception('Non-200 response')
         
-        data = r.json()
-        params = data.get('properties', {}).get('parameter', {})
-        
-        if not params:
-            return None
-        
-        ghi_data = params.get('ALLSKY_SFC_SW_DWN', {})
-        temp_data = params.get('T2M', {})
-        cloud_data = params.get('CLD_FRAC', {})
-        
-        if not (ghi_data and temp_data and cloud_data):
+        params = r.json().get('properties', {}).get('parameter', {})
+        if not all(params.get(p) for p in POWER_PARAMETERS):
             return None
-        
-        hours = []
-        ghi_vals = []
-        temp_vals = []
-        cloud_vals = []
-        output_vals = []
-        
-        for hour_key in sorted(ghi_data.keys()):
-            hour = int(hour_key) % 100
-            if 6 <= hour <= 18:
-                ghi = ghi_data.get(hour_key, 0)
-                temp = temp_data.get(hour_key, 20)
-                cloud = cloud_data.get(hour_key, 50)
-                
-                output = max(0, ghi / 250.0)
-                
-                hours.append(hour)
-                ghi_vals.append(ghi)
-                temp_vals.append(temp)
-                cloud_vals.append(cloud * 100)
-                output_vals.append(output)
-        
-        if len(hours) < 5:
+        return params
+    
+    except Exception as e:
+        metrics.count('fetch_nasa_power_errors_total')
+        log.debug(f"NASA POWER fetch failed: {e}")
+        return None
+
+class PowerFetcher:
+    """
+    NASA POWER client that goes upstream once per grid cell and date range.
+
+    Sites in the same cell share one cached response, parsed per site. A request
+    for a key that is already in flight waits for that request instead of issuing
+    its own, so upstream traffic scales with unique cells, not with sites. A failed
+    cell is remembered for `negative_ttl_s`, so an outage is not retried by every site
+    in the same pass.
+    """
+
+    def __init__(self, ttl_s=CACHE_TTL_S, max_entries=CACHE_SIZE, negative_ttl_s=NEGATIVE_TTL_S):
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = negative_ttl_s
+        self.max_entries = max_entries
+        self._cache = OrderedDict()   # (cell, start, end) -> (expires, params)
+        self._inflight = {}           # (cell, start, end) -> Future
+        self._lock = threading.Lock()
+
+    def params(self, lat, lon, start, end):
+        """Raw hourly parameter dicts for the cell containing (lat, lon), or None."""
+        key = (power_cell(lat, lon), start, end)
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None and hit[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                metrics.count('fetch_nasa_power_cache_hits_total', result='ok' if hit[1] is not None else 'failed')
+                return hit[1]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            metrics.count('fetch_nasa_power_coalesced_total')
+            return future.result()
+
+        params = None
+        try:
+            params = _request_power(*cell_point(key[0]), start, end)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                # Failures are cached briefly: long enough to cover one fan-out, short enough to recover
+                ttl = self.ttl_s if params is not None else self.negative_ttl_s
+                if ttl > 0:
+                    self._cache[key] = (time.monotonic() + ttl, params)
+                    while len(self._cache) > self.max_entries:
+                        self._cache.popitem(last=False)
+            future.set_result(params)
+        return params
+
+    def fetch(self, lat, lon, start, end):
+        """Site frame as returned by parse_power_hourly, or None."""
+        params = self.params(lat, lon, start, end)
+        if params is None:
             return None
-        
-        df = pd.DataFrame({
-            'hour': hours,
-            'ghi': ghi_vals,
-            'temp_c': temp_vals,
-            'cloud_pct': cloud_vals,
-            'output_kwh': output_vals
-        })
-        
-        return df
+        return parse_power_hourly(params['ALLSKY_SFC_SW_DWN'], params['T2M'], params['CLD_FRAC'], lat, lon)
+
+    def fetch_many(self, coords, start, end, max_workers=8):
+        """Frames for many (lat, lon) sites, requesting every unique cell concurrently."""
+        coords = list(coords)
+        cells = {}
+        for lat, lon in coords:
+            cells.setdefault(power_cell(lat, lon), (lat, lon))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(lambda c: self.params(c[0], c[1], start, end), cells.values()))
+        return [self.fetch(lat, lon, start, end) for lat, lon in coords]
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+_fetcher = PowerFetcher()
+
+@metrics.timed('fetch_nasa_power')
+def fetch_nasa_power(lat=15.3647, lon=75.1234, start='20240601', end='20240601'):
+    """Hourly POWER data for a site; requests are shared with every site in the same grid cell."""
+    return _fetcher.fetch(lat, lon, start, end)
+
+def fetch_nasa_power_many(coords, start='20240601', end='20240601', max_workers=8):
+    """fetch_nasa_power for many (lat, lon) sites, with one upstream request per unique grid cell."""
+    return _fetcher.fetch_many(coords, start, end, max_workers)
+
+def parse_power_hourly(ghi_data, temp_data, cloud_data, lat=15.3647, lon=75.1234):
+    """Build a timestamped daylight frame from NASA POWER `YYYYMMDDHH`-keyed series (local solar time)"""
+    keys = sorted(ghi_data.keys())
+    df = pd.DataFrame({
+        'timestamp': pd.to_datetime(keys, format='%Y%m%d%H'),
+        'ghi': pd.Series(ghi_data).reindex(keys).to_numpy(dtype=float),
+        'temp_c': pd.Series(temp_data).reindex(keys).fillna(20).to_numpy(dtype=float),
+        'cloud_pct': pd.Series(cloud_data).reindex(keys).fillna(50).to_numpy(dtype=float) * 100,
+    })
+    # POWER marks missing values with -999
+    df = df[(df['ghi'] > -900) & (df['temp_c'] > -900) & (df['cloud_pct'] > -900)]
+    df['hour'] = df['timestamp'].dt.hour
+    # Daylight from the site's solar table; POWER hourly timestamps are local solar time
+    table = get_solar_table(lat, lon, lon / 15.0)
+    df = df[table.lookup(df['timestamp'], 'daylight')]
+    df['output_kwh'] = (df['ghi'] / 250.0).clip(lower=0)
     
-    except Exception:
+    if len(df) < 5:
         return None
+    
+    return df[['timestamp', 'hour', 'ghi', 'temp_c', 'cloud_pct', 'output_kwh']].reset_index(drop=True)
 
 def load_sample_data(path='sample_data/solar_sample.csv'):
     return pd.read_csv(path)
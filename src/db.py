@@ -1,16 +1,56 @@
 import sqlite3
 import json
+import logging
 from datetime import datetime
 import os
 
+from . import codec
+from . import metrics
+
+log = logging.getLogger('amplifyai.db')
+
 DB_PATH = 'amplifyai.db'
 
-def init_db():
-    """Initialize database with required tables"""
+def _record_error(op, exc):
+    """Count and log a swallowed DB error; lock timeouts are tracked separately as contention"""
+    metrics.count('db_errors_total', op=op)
+    if isinstance(exc, sqlite3.OperationalError) and 'locked' in str(exc):
+        metrics.count('db_lock_contention_total', op=op)
+    log.warning(f"{op} failed: {exc}")
+
+# Columns added after the original schema; created on existing databases by init_db
+FORECAST_MATCH_COLUMNS = {
+    'horizon_start': 'TEXT',
+    'horizon_end': 'TEXT',
+    'n_steps': 'INTEGER',
+    'matched_steps': 'INTEGER DEFAULT 0',
+}
+
+# Binary payloads (src/codec.py); rows written before it keep their *_json text
+PAYLOAD_COLUMNS = {'payload': 'BLOB'}
+
+def _ensure_columns(c, table, columns):
+    """Add any missing columns to an existing table"""
+    existing = {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+    for name, decl in columns.items():
+        if name not in existing:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {name} {decl}')
+
+_initialized = set()
+
+@metrics.timed('db', op='init_db')
+def init_db(db_path=None):
+    """Initialize database with required tables (once per database file per process; default DB_PATH)"""
+    db_path = db_path or DB_PATH
+    if db_path in _initialized and os.path.exists(db_path):
+        return
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(db_path)
         c = conn.cursor()
         
+        # Lets retention hand freed pages back in small steps (only takes effect on new files)
+        c.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        
         c.execute('''CREATE TABLE IF NOT EXISTS forecast_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             timestamp TEXT,
@@ -23,6 +63,24 @@ def init_db():
             created_at TEXT
         )''')
         
+        _ensure_columns(c, 'forecast_history', {**FORECAST_MATCH_COLUMNS, **PAYLOAD_COLUMNS})
+        c.execute('CREATE INDEX IF NOT EXISTS idx_forecast_horizon_end ON forecast_history (horizon_end)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_forecast_created_at ON forecast_history (created_at)')
+        
+        # Running forecast error sums per model, location and horizon step (see src/accuracy.py)
+        c.execute('''CREATE TABLE IF NOT EXISTS forecast_accuracy (
+            model_used TEXT,
+            location_lat REAL,
+            location_lon REAL,
+            horizon_step INTEGER,
+            n INTEGER,
+            sum_err REAL,
+            sum_abs_err REAL,
+            sum_sq_err REAL,
+            updated_at TEXT,
+            PRIMARY KEY (model_used, location_lat, location_lon, horizon_step)
+        )''')
+        
         c.execute('''CREATE TABLE IF NOT EXISTS battery_schedule_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             timestamp TEXT,
@@ -33,60 +91,128 @@ def init_db():
             created_at TEXT
         )''')
         
+        _ensure_columns(c, 'battery_schedule_history', PAYLOAD_COLUMNS)
+        c.execute('CREATE INDEX IF NOT EXISTS idx_schedule_created_at ON battery_schedule_history (created_at)')
+        
+        # Daily and weekly aggregates of history rows past the retention window (see src/retention.py)
+        c.execute('''CREATE TABLE IF NOT EXISTS forecast_rollup (
+            period TEXT,
+            period_start TEXT,
+            model_used TEXT,
+            location_lat REAL,
+            location_lon REAL,
+            runs INTEGER,
+            mse_n INTEGER,
+            sum_mse REAL,
+            min_mse REAL,
+            max_mse REAL,
+            steps INTEGER,
+            sum_forecast_kwh REAL,
+            matched_steps INTEGER,
+            sum_err REAL,
+            sum_abs_err REAL,
+            sum_sq_err REAL,
+            updated_at TEXT,
+            PRIMARY KEY (period, period_start, model_used, location_lat, location_lon)
+        )''')
+        
+        c.execute('''CREATE TABLE IF NOT EXISTS schedule_rollup (
+            period TEXT,
+            period_start TEXT,
+            objective TEXT,
+            runs INTEGER,
+            sum_horizon INTEGER,
+            sum_charge REAL,
+            sum_discharge REAL,
+            sum_final_soc REAL,
+            updated_at TEXT,
+            PRIMARY KEY (period, period_start, objective)
+        )''')
+        
         conn.commit()
         conn.close()
+        _initialized.add(db_path)
     except Exception as e:
-        pass
+        _record_error('init_db', e)
 
-def insert_forecast(lat, lon, model_used, forecast_data, mse):
-    """Insert forecast record into database"""
+def decode_forecast_row(payload, forecast_json, as_lists=False):
+    """Forecast dict from a row's binary payload, falling back to legacy JSON text"""
+    if payload is not None:
+        return codec.decode_forecast(payload, as_lists=as_lists)
+    return json.loads(forecast_json) if forecast_json else {}
+
+def decode_schedule_row(payload, schedule_json, as_lists=False):
+    """Schedule dict from a row's binary payload, falling back to legacy JSON text"""
+    if payload is not None:
+        return codec.decode_schedule(payload, as_lists=as_lists)
+    return json.loads(schedule_json) if schedule_json else {}
+
+@metrics.timed('db', op='insert_forecast')
+def insert_forecast(lat, lon, model_used, forecast_data, mse, db_path=None):
+    """Insert forecast record into database (default DB_PATH); returns the new row id (None on failure)"""
     try:
-        init_db()
-        conn = sqlite3.connect(DB_PATH)
+        db_path = db_path or DB_PATH
+        init_db(db_path)
+        conn = sqlite3.connect(db_path)
         c = conn.cursor()
         
         timestamp = datetime.now().isoformat()
-        forecast_json = json.dumps(forecast_data)
+        payload = codec.encode_forecast(forecast_data)
+        stamps = forecast_data.get('timestamps') or [None]
         
         c.execute('''INSERT INTO forecast_history 
-                     (timestamp, location_lat, location_lon, model_used, forecast_json, mse, created_at)
-                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                  (timestamp, lat, lon, model_used, forecast_json, mse, timestamp))
+                     (timestamp, location_lat, location_lon, model_used, payload, mse, created_at,
+                      horizon_start, horizon_end, n_steps, matched_steps)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)''',
+                  (timestamp, lat, lon, model_used, payload, mse, timestamp,
+                   stamps[0], stamps[-1], len(forecast_data.get('mean', []))))
+        row_id = c.lastrowid
         
         conn.commit()
         conn.close()
-    except Exception:
-        pass
+        return row_id
+    except Exception as e:
+        _record_error('insert_forecast', e)
+        return None
 
-def insert_schedule(horizon_hours, objective, schedule_data, summary):
-    """Insert battery schedule record into database"""
+@metrics.timed('db', op='insert_schedule')
+def insert_schedule(horizon_hours, objective, schedule_data, summary, db_path=None):
+    """Insert battery schedule record into database (default DB_PATH)"""
     try:
-        init_db()
-        conn = sqlite3.connect(DB_PATH)
+        db_path = db_path or DB_PATH
+        init_db(db_path)
+        conn = sqlite3.connect(db_path)
         c = conn.cursor()
         
         timestamp = datetime.now().isoformat()
-        schedule_json = json.dumps(schedule_data)
+        payload = codec.encode_schedule(schedule_data)
         summary_json = json.dumps(summary)
         
         c.execute('''INSERT INTO battery_schedule_history 
-                     (timestamp, horizon_hours, objective, schedule_json, summary_json, created_at)
+                     (timestamp, horizon_hours, objective, payload, summary_json, created_at)
                      VALUES (?, ?, ?, ?, ?, ?)''',
-                  (timestamp, horizon_hours, objective, schedule_json, summary_json, timestamp))
+                  (timestamp, horizon_hours, objective, payload, summary_json, timestamp))
         
         conn.commit()
         conn.close()
-    except Exception:
-        pass
+    except Exception as e:
+        _record_error('insert_schedule', e)
 
-def load_recent_forecasts(limit=10):
-    """Load recent forecasts from database"""
+@metrics.timed('db', op='load_recent_forecasts')
+def load_recent_forecasts(limit=10, db_path=None, as_lists=True):
+    """
+    Load recent forecasts from database (default DB_PATH).
+
+    Forecasts are plain lists and ISO timestamp strings for every row, binary or legacy
+    JSON; `as_lists=False` returns binary rows as read-only arrays instead.
+    """
     try:
-        init_db()
-        conn = sqlite3.connect(DB_PATH)
+        db_path = db_path or DB_PATH
+        init_db(db_path)
+        conn = sqlite3.connect(db_path)
         c = conn.cursor()
         
-        c.execute('''SELECT timestamp, model_used, forecast_json, mse, created_at 
+        c.execute('''SELECT timestamp, model_used, forecast_json, mse, created_at, payload 
                      FROM forecast_history 
                      ORDER BY created_at DESC LIMIT ?''', (limit,))
         
@@ -98,23 +224,26 @@ def load_recent_forecasts(limit=10):
             forecasts.append({
                 'timestamp': row[0],
                 'model': row[1],
-                'forecast': json.loads(row[2]),
+                'forecast': decode_forecast_row(row[5], row[2], as_lists=as_lists),
                 'mse': row[3],
                 'created_at': row[4]
             })
         
         return forecasts
-    except Exception:
+    except Exception as e:
+        _record_error('load_recent_forecasts', e)
         return []
 
-def load_recent_schedules(limit=5):
-    """Load recent battery schedules from database"""
+@metrics.timed('db', op='load_recent_schedules')
+def load_recent_schedules(limit=5, db_path=None, as_lists=True):
+    """Load recent battery schedules from database (default DB_PATH); lists unless `as_lists=False`"""
     try:
-        init_db()
-        conn = sqlite3.connect(DB_PATH)
+        db_path = db_path or DB_PATH
+        init_db(db_path)
+        conn = sqlite3.connect(db_path)
         c = conn.cursor()
         
-        c.execute('''SELECT timestamp, horizon_hours, objective, schedule_json, summary_json, created_at 
+        c.execute('''SELECT timestamp, horizon_hours, objective, schedule_json, summary_json, created_at, payload 
                      FROM battery_schedule_history 
                      ORDER BY created_at DESC LIMIT ?''', (limit,))
         
@@ -127,11 +256,12 @@ def load_recent_schedules(limit=5):
                 'timestamp': row[0],
                 'horizon': row[1],
                 'objective': row[2],
-                'schedule': json.loads(row[3]),
+                'schedule': decode_schedule_row(row[6], row[3], as_lists=as_lists),
                 'summary': json.loads(row[4]),
                 'created_at': row[5]
             })
         
         return schedules
-    except Exception:
+    except Exception as e:
+        _record_error('load_recent_schedules', e)
         return []
@@ -0,0 +1,177 @@
+"""
+Per-site demand forecasting from historical load.
+
+Each site's load is a weekday × hour-of-day profile in kW. Weekday/hour cells
+with few observations are shrunk towards the same hour on the same day type
+(weekday or weekend). The forecast is scaled by how far recent load sits above
+or below the profile, an adjustment that fades out over the horizon. Fitting
+and forecasting are vectorized over sites × steps, so a fleet's demand matrix
+comes out of a single pass and can be refreshed every planning cycle.
+"""
+import numpy as np
+import pandas as pd
+
+from .timeseries import to_step, step_hours, ensure_timestamps
+
+DEMAND_COLUMN = 'demand_kwh'
+PRIOR_WEIGHT = 2.0        # observations a weekday/hour cell needs to outweigh its day-type/hour mean
+RECENT_HOURS = 24.0       # window for the recent-level adjustment
+LEVEL_BOUNDS = (0.5, 2.0)
+LEVEL_DECAY_HOURS = 24.0  # e-folding time of the recent-level adjustment over the horizon
+
+_NS_HOUR = 3600 * 10**9
+_NS_DAY = 24 * _NS_HOUR
+_HOURS = np.arange(24) + 0.5
+# Hourly multipliers (mean 1) for sites without load history
+SHAPES = {
+    'flat': np.ones(24),
+    'residential': 0.6 + 0.5 * np.exp(-0.5 * ((_HOURS - 7.5) / 1.5) ** 2)
+                   + 0.9 * np.exp(-0.5 * ((_HOURS - 19.5) / 2.0) ** 2),
+}
+SHAPES = {name: shape / shape.mean() for name, shape in SHAPES.items()}
+
+
+def _weekday_hour(ns):
+    """Weekday (Monday=0) and hour of day for int64 nanosecond timestamps."""
+    days = ns // _NS_DAY
+    return (days + 3) % 7, (ns - days * _NS_DAY) // _NS_HOUR  # 1970-01-01 was a Thursday
+
+
+class DemandProfiles:
+    """
+    Weekday × hour load profiles for a set of sites.
+
+    Attributes:
+        site_ids: Site ids, in row order of the arrays below
+        profile_kw: (n_sites, 7, 24) mean load in kW by weekday (Monday=0) and hour
+        level: (n_sites,) recent load relative to the profile
+        next_start: (n_sites,) datetime64 of the step after each site's last observation, if known
+    """
+
+    def __init__(self, site_ids, profile_kw, level=None, next_start=None):
+        self.site_ids = list(site_ids)
+        self.profile_kw = np.asarray(profile_kw, dtype=float)
+        self.level = np.ones(len(self.site_ids)) if level is None else np.asarray(level, dtype=float)
+        self.next_start = next_start
+        self._index = {s: i for i, s in enumerate(self.site_ids)}
+
+    @classmethod
+    def typical(cls, site_ids, mean_kw, shape='residential'):
+        """Profiles for sites without load history: a standard daily shape scaled to `mean_kw` (scalar or per site)."""
+        if shape not in SHAPES:
+            raise ValueError(f"Unknown demand shape: {shape}")
+        mean_kw = np.broadcast_to(np.asarray(mean_kw, dtype=float), (len(site_ids),))
+        profile = mean_kw[:, None, None] * np.broadcast_to(SHAPES[shape], (7, 24))[None]
+        return cls(site_ids, profile)
+
+    def _rows(self, site_ids):
+        if site_ids is None:
+            return np.arange(len(self.site_ids))
+        try:
+            return np.array([self._index[s] for s in site_ids], dtype=int)
+        except KeyError as e:
+            raise KeyError(f"No demand profile for site {e.args[0]!r}") from None
+
+    def forecast(self, n_steps, step='1h', start=None, site_ids=None):
+        """
+        Demand matrix for many sites in one vectorized pass.
+
+        Args:
+            n_steps: Steps per site
+            step: Step size ('15min', '1h', minutes or Timedelta)
+            start: Timestamp of the first step, one shared or one per site;
+                defaults to the step after each site's last observation
+            site_ids: Sites (rows) to forecast; defaults to all
+
+        Returns:
+            (n_sites, n_steps) array of demand in kWh per step
+        """
+        rows = self._rows(site_ids)
+        step = to_step(step)
+        if start is None:
+            if self.next_start is None:
+                raise ValueError("start is required for profiles not fitted on timestamped history")
+            start = self.next_start[rows]
+        start_ns = pd.DatetimeIndex(np.atleast_1d(start)).as_unit('ns').asi8
+        start_ns = np.broadcast_to(start_ns, (len(rows),))
+        ns = start_ns[:, None] + np.arange(n_steps, dtype=np.int64)[None, :] * step.value
+        weekday, hour = _weekday_hour(ns)
+        kw = self.profile_kw[rows[:, None], weekday, hour]
+        lead_h = np.arange(n_steps) * step_hours(step)
+        level = 1.0 + (self.level[rows, None] - 1.0) * np.exp(-lead_h / LEVEL_DECAY_HOURS)[None, :]
+        return kw * level * step_hours(step)
+
+    def for_forecast(self, forecast, site_id=None):
+        """Per-step demand (kWh) aligned with a forecast_hours result, ready for optimize_battery_schedule."""
+        site_ids = None if site_id is None else [site_id]
+        if site_id is None and len(self.site_ids) != 1:
+            raise ValueError("site_id is required when profiles cover several sites")
+        matrix = self.forecast(len(forecast['mean']), pd.Timedelta(minutes=forecast['step_minutes']),
+                               start=pd.Timestamp(forecast['timestamps'][0]), site_ids=site_ids)
+        return matrix[0].tolist()
+
+
+def fit_demand_profiles(history, value_col=DEMAND_COLUMN, site_col='site_id', prior_weight=PRIOR_WEIGHT,
+                        recent_hours=RECENT_HOURS):
+    """
+    Learn weekday × hour load profiles for every site in a history table.
+
+    Args:
+        history: DataFrame with `timestamp` (or `hour`), `value_col` as kWh per step and,
+            for several sites, `site_col` (long format, as from generate_fleet)
+        value_col: Load column, energy per row's time step
+        site_col: Site id column; when absent the whole frame is one site, 'default'
+        prior_weight: Pseudo-observations of the day-type/hour mean added to every weekday/hour cell
+        recent_hours: Trailing window per site for the recent-level adjustment
+
+    Returns:
+        DemandProfiles
+    """
+    df = history if 'timestamp' in history.columns else ensure_timestamps(history)
+    df = df[df[value_col].notna()]
+    if df.empty:
+        raise ValueError(f"No {value_col} history to fit demand profiles on")
+    if site_col in df.columns:
+        codes, site_ids = pd.factorize(df[site_col], sort=True)
+        site_ids = list(site_ids)
+    else:
+        codes, site_ids = np.zeros(len(df), dtype=np.int64), ['default']
+    n = len(site_ids)
+    ns = pd.DatetimeIndex(df['timestamp']).as_unit('ns').asi8
+    energy = df[value_col].to_numpy(dtype=float)
+
+    # Each site's sampling interval converts energy per row to mean kW
+    order = np.lexsort((ns, codes))
+    gaps = np.diff(ns[order]).astype(float)
+    gaps[codes[order][1:] != codes[order][:-1]] = np.nan
+    site_step_ns = pd.Series(np.concatenate([[np.nan], gaps])).groupby(codes[order]).median().reindex(
+        range(n)).to_numpy()
+    site_step_ns = np.where(site_step_ns > 0, site_step_ns, _NS_HOUR)
+    kw = energy / (site_step_ns[codes] / _NS_HOUR)
+
+    weekday, hour = _weekday_hour(ns)
+    cell = (codes * 7 + weekday) * 24 + hour
+    cell_sum = np.bincount(cell, kw, minlength=n * 168).reshape(n, 7, 24)
+    cell_n = np.bincount(cell, minlength=n * 168).reshape(n, 7, 24)
+    site_mean = np.bincount(codes, kw, minlength=n) / np.bincount(codes, minlength=n)
+    # Sparse cells lean on the same hour of the same day type (weekday or weekend), then of any day
+    hour_sum, hour_n = cell_sum.sum(axis=1), cell_n.sum(axis=1)
+    hour_mean = np.where(hour_n > 0, hour_sum / np.maximum(hour_n, 1), site_mean[:, None])
+    prior = np.empty_like(cell_sum)
+    for days in (slice(0, 5), slice(5, 7)):
+        type_sum, type_n = cell_sum[:, days].sum(axis=1), cell_n[:, days].sum(axis=1)
+        prior[:, days] = np.where(type_n > 0, type_sum / np.maximum(type_n, 1), hour_mean)[:, None, :]
+    profile = (cell_sum + prior_weight * prior) / (cell_n + prior_weight)
+
+    # Recent load against what the profile expected over the same steps
+    last_ns = np.full(n, np.iinfo(np.int64).min)
+    np.maximum.at(last_ns, codes, ns)
+    recent = ns > last_ns[codes] - int(recent_hours * _NS_HOUR)
+    expected = profile.reshape(-1)[cell]
+    actual_recent = np.bincount(codes, kw * recent, minlength=n)
+    expected_recent = np.bincount(codes, expected * recent, minlength=n)
+    level = np.where(expected_recent > 0, actual_recent / np.where(expected_recent > 0, expected_recent, 1.0), 1.0)
+    level = np.clip(level, *LEVEL_BOUNDS)
+
+    next_start = (last_ns + site_step_ns.astype(np.int64)).astype('datetime64[ns]')
+    return DemandProfiles(site_ids, profile, level, next_start)
@@ -0,0 +1,261 @@
+"""
+Telemetry drift detection: re-run a site's forecast or schedule only when its telemetry says so.
+
+Incoming `pv_power_kw` and `soc_kwh` readings are compared with the site's active
+plan: the forecast PV power for the step containing the reading, and the
+scheduled state of charge interpolated between step boundaries. Each (site,
+field) residual is scaled (PV by the forecast standard deviation, SOC by a
+fraction of battery capacity) and tracked with O(1) state:
+
+- an EWMA of the residual, which catches a sustained level shift
+- a two-sided CUSUM (slack `cusum_k`), which catches a small persistent bias
+
+A site is queued once either statistic crosses its threshold and stays across
+it for `debounce_s` of telemetry time. PV drift queues a re-forecast, which also
+re-optimizes; its event carries `pv_ratio`, the observed/forecast PV level
+over the crossing, so the re-forecast is corrected by what the telemetry saw.
+SOC drift queues a re-optimization from the observed state of charge. A site
+fires at most once per `cooldown_s`, and `drain` hands out queued sites at no
+more than `max_per_minute` (token bucket of `burst`).
+
+Readings are pushed one at a time (`observe`, for live polls) or as frame
+chunks (`observe_frame`, for high-rate telemetry), which are first averaged into
+`window_s` windows per site. Telemetry and plan timestamps are on the same
+(site-local) clock; readings outside the plan's horizon are ignored.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+
+log = logging.getLogger('amplifyai.drift')
+
+NS = 1_000_000_000
+# Telemetry field -> stage re-run when it drifts
+FIELD_STAGES = {'pv_power_kw': 'forecast', 'soc_kwh': 'optimize'}
+
+
+def _to_ns(timestamps):
+    return pd.DatetimeIndex(pd.to_datetime(timestamps)).as_unit('ns').asi8
+
+
+class _Plan:
+    """Expected PV power and SOC over one forecast horizon."""
+
+    def __init__(self, forecast, schedule=None, initial_soc_kwh=None, soc_scale=None):
+        step_h = forecast.get('step_minutes', 60.0) / 60.0
+        step_ns = int(round(step_h * 3600 * NS))
+        self.t = _to_ns(forecast['timestamps'])
+        self.end = self.t[-1] + step_ns
+        self.pv_kw = np.asarray(forecast['mean'], dtype=float) / step_h
+        std = forecast.get('std')
+        self.pv_std_kw = (np.asarray(std, dtype=float) / step_h if std is not None
+                          else np.zeros_like(self.pv_kw))
+        self.soc_t = self.soc = None
+        if schedule and schedule.get('soc'):
+            soc = np.asarray(schedule['soc'], dtype=float)
+            # Scheduled SOC is end-of-step; the first knot is the SOC the schedule started from
+            start = soc[0] if initial_soc_kwh is None else float(initial_soc_kwh)
+            self.soc = np.concatenate([[start], soc])
+            self.soc_t = np.concatenate([self.t[:1], self.t[:len(soc)] + step_ns])
+        self.soc_scale = soc_scale
+
+    def expected(self, field, ts, pv_floor_kw):
+        """(expected value, residual scale) arrays for readings at int64 ns `ts`; NaN outside the plan."""
+        inside = (ts >= self.t[0]) & (ts < self.end)
+        if field == 'pv_power_kw':
+            i = np.clip(np.searchsorted(self.t, ts, side='right') - 1, 0, len(self.t) - 1)
+            expected = np.where(inside, self.pv_kw[i], np.nan)
+            return expected, np.maximum(self.pv_std_kw[i], pv_floor_kw)
+        if self.soc is None or not self.soc_scale:
+            return np.full(len(ts), np.nan), np.ones(len(ts))
+        expected = np.interp(ts, self.soc_t, self.soc, left=np.nan, right=np.nan)
+        return expected, np.full(len(ts), self.soc_scale)
+
+
+class _Stat:
+    """Streaming residual statistics for one (site, field)."""
+    __slots__ = ('ewma', 'pos', 'neg', 'n', 'since', 'm', 'observed', 'expected')
+
+    def __init__(self):
+        self.ewma = self.pos = self.neg = 0.0
+        self.m = 0
+        self.observed = self.expected = 0.0   # `m` readings and plan values summed since `since`
+        self.n = 0
+        self.since = None   # ns timestamp the current threshold crossing started
+
+
+class DriftMonitor:
+    """
+    Queues sites whose telemetry drifts away from their active forecast or schedule.
+
+    Args:
+        alpha: Weight of the newest residual in the EWMA
+        ewma_threshold: EWMA level (in residual scale units) that counts as drift
+        cusum_k: CUSUM slack per reading; residuals smaller than this never accumulate
+        cusum_h: CUSUM decision threshold
+        warmup: Readings needed after a new plan before drift can be declared
+        debounce_s: How long a crossing must persist before the site is queued
+        cooldown_s: Minimum telemetry time between two triggers for one site
+        max_per_minute, burst: Token bucket limiting how many queued sites `drain` releases
+        window_s: Averaging window applied by observe_frame
+        pv_floor_kw: Smallest PV residual scale (the forecast std can be ~0 at night)
+        soc_tolerance: SOC residual scale as a fraction of battery capacity
+    """
+
+    def __init__(self, alpha=0.2, ewma_threshold=3.0, cusum_k=0.5, cusum_h=8.0, warmup=3, debounce_s=180.0,
+                 cooldown_s=900.0, max_per_minute=10.0, burst=20, window_s=60.0, pv_floor_kw=0.1,
+                 soc_tolerance=0.05):
+        self.alpha = alpha
+        self.ewma_threshold = ewma_threshold
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.warmup = warmup
+        self.debounce_ns = int(debounce_s * NS)
+        self.cooldown_ns = int(cooldown_s * NS)
+        self.max_per_minute = max_per_minute
+        self.burst = burst
+        self.window_ns = int(window_s * NS)
+        self.pv_floor_kw = pv_floor_kw
+        self.soc_tolerance = soc_tolerance
+        self._plans = {}
+        self._stats = {}
+        self._soc = {}
+        self._last_fired = {}
+        self._queue = OrderedDict()
+        self._tokens = float(burst)
+        self._refilled_at = None
+        self._lock = threading.RLock()
+
+    def set_plan(self, site_id, forecast, schedule=None, initial_soc_kwh=None, capacity_kwh=None):
+        """Make a new forecast (and schedule) the site's active plan, restarting its statistics."""
+        soc_scale = self.soc_tolerance * capacity_kwh if capacity_kwh else None
+        plan = _Plan(forecast, schedule, initial_soc_kwh, soc_scale)
+        with self._lock:
+            self._plans[site_id] = plan
+            for field in FIELD_STAGES:
+                self._stats.pop((site_id, field), None)
+
+    def has_plan(self, site_id):
+        return site_id in self._plans
+
+    @property
+    def pending(self):
+        """Number of queued sites."""
+        return len(self._queue)
+
+    def observe(self, site_id, ts, pv_power_kw=None, soc_kwh=None):
+        """Check one reading (either field may be None). Returns True if the site is queued afterwards."""
+        t = np.array([pd.Timestamp(ts).value], dtype=np.int64)
+        values = {'pv_power_kw': pv_power_kw, 'soc_kwh': soc_kwh}
+        with self._lock:
+            for field, value in values.items():
+                if value is not None:
+                    self._observe(site_id, field, t, np.array([float(value)]))
+            return site_id in self._queue
+
+    def observe_frame(self, df, site_col='site_id', time_col='ts'):
+        """
+        Check a long-format telemetry chunk (one row per site and timestamp, with
+        `pv_power_kw` and/or `soc_kwh` columns), averaged per site into window_s windows.
+
+        Returns the number of sites newly queued by this chunk.
+        """
+        fields = [f for f in FIELD_STAGES if f in df.columns]
+        if df.empty or not fields:
+            return 0
+        ts = _to_ns(df[time_col])
+        windows = pd.DataFrame({'site': np.asarray(df[site_col]), 'w': ts // max(self.window_ns, 1), 'ts': ts,
+                                **{f: df[f].to_numpy(dtype=float) for f in fields}})
+        means = windows.groupby(['site', 'w'], sort=True).mean()
+        with self._lock:
+            queued = len(self._queue)
+            for site_id, g in means.groupby(level=0, sort=False):
+                if site_id not in self._plans:
+                    continue
+                t = g['ts'].to_numpy().astype(np.int64)
+                for field in fields:
+                    self._observe(site_id, field, t, g[field].to_numpy())
+            return len(self._queue) - queued
+
+    def _observe(self, site_id, field, ts, values):
+        if field == 'soc_kwh' and np.isfinite(values).any():
+            self._soc[site_id] = float(values[np.isfinite(values)][-1])
+        plan = self._plans.get(site_id)
+        if plan is None:
+            return
+        expected, scale = plan.expected(field, ts, self.pv_floor_kw)
+        residuals = (values - expected) / scale
+        stat = self._stats.get((site_id, field))
+        if stat is None:
+            stat = self._stats[(site_id, field)] = _Stat()
+        for t, r, v, e in zip(ts.tolist(), residuals.tolist(), values.tolist(), expected.tolist()):
+            if r != r:   # NaN: no reading, or outside the plan
+                continue
+            stat.ewma += self.alpha * (r - stat.ewma)
+            stat.pos = max(0.0, stat.pos + r - self.cusum_k)
+            stat.neg = max(0.0, stat.neg - r - self.cusum_k)
+            stat.n += 1
+            score = max(abs(stat.ewma) / self.ewma_threshold, max(stat.pos, stat.neg) / self.cusum_h)
+            if stat.n < self.warmup or score <= 1.0:
+                stat.since = None
+                continue
+            if stat.since is None:
+                stat.since = t
+                stat.m, stat.observed, stat.expected = 0, 0.0, 0.0
+            stat.m += 1
+            stat.observed += v
+            stat.expected += e
+            if t - stat.since >= self.debounce_ns and self._fire(site_id, field, t, score, self._level(field, stat)):
+                stat = self._stats[(site_id, field)] = _Stat()
+
+    def _level(self, field, stat):
+        """Observed/forecast PV ratio over a PV crossing, or None where the forecast is ~0."""
+        if field != 'pv_power_kw' or stat.expected < self.pv_floor_kw * max(stat.m, 1):
+            return None
+        return round(max(stat.observed, 0.0) / stat.expected, 3)
+
+    def _fire(self, site_id, field, t, score, pv_ratio=None):
+        last = self._last_fired.get(site_id)
+        if last is not None and t - last < self.cooldown_ns:
+            metrics.count('drift_suppressed_total', field=field)
+            return False
+        self._last_fired[site_id] = t
+        stage = FIELD_STAGES[field]
+        queued = self._queue.get(site_id)
+        if queued is None or queued['stage'] != 'forecast':
+            # A re-forecast already re-optimizes, so it absorbs a queued optimize
+            self._queue[site_id] = {'site_id': site_id, 'stage': stage, 'field': field,
+                                    'ts': pd.Timestamp(t).isoformat(), 'score': round(score, 2),
+                                    'pv_ratio': pv_ratio}
+        metrics.count('drift_triggers_total', field=field)
+        log.info(f"[{site_id}] {field} drifted from plan (score {score:.1f}); queued {stage}")
+        return True
+
+    def drain(self, now=None):
+        """
+        Release queued sites, oldest first, as far as the rate limit allows.
+
+        Returns a list of {'site_id', 'stage' ('forecast' or 'optimize'), 'field', 'ts',
+        'score', 'pv_ratio' (observed/forecast PV level, PV events only, else None),
+        'soc_kwh' (latest observed, or None)} events; the rest stay queued.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._refilled_at is not None:
+                self._tokens = min(float(self.burst),
+                                   self._tokens + (now - self._refilled_at) * self.max_per_minute / 60.0)
+            self._refilled_at = now
+            events = []
+            while self._queue and self._tokens >= 1.0:
+                _, event = self._queue.popitem(last=False)
+                events.append({**event, 'soc_kwh': self._soc.get(event['site_id'])})
+                self._tokens -= 1.0
+            if self._queue:
+                log.debug(f"Drift rate limit: {len(self._queue)} site(s) still queued")
+            return events
@@ -0,0 +1,251 @@
+"""
+Incremental per-site feature store with lag and rolling-window features.
+
+Rows arrive in batches from app CSV uploads and from each pipeline ingest
+(CSV or NASA POWER sources). Each append only computes features for the new
+rows, looking back into the stored history by timestamp (binary search), so
+retraining never recomputes rolling windows over the full history. Columns
+are kept as float32 arrays with amortized growth and persisted per site as
+.npz. Appends hold an exclusive flock on the site's lock file across
+reload → append → save, so the app and the pipeline daemon (or several
+stores in one process) never save over each other's rows.
+"""
+import os
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # no cross-process locking on platforms without flock
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from .timeseries import ensure_timestamps, infer_step
+
+log = logging.getLogger('amplifyai.feature_store')
+
+STORE_DIR = '.feature_store'
+BASE_COLUMNS = ('ghi', 'temp_c', 'cloud_pct', 'output_kwh')
+LAG_FEATURES = ('prev_output_kwh', 'cloud_trend_3h', 'same_hour_yesterday_kwh')
+# Forecast-time input (not a feature): stored cloud cover 3 h before each step, for cloud_trend_3h
+CLOUD_3H_AGO = 'cloud_pct_3h_ago'
+
+_HOUR_NS = 3600 * 10**9
+_DAY_NS = 24 * _HOUR_NS
+
+
+class _SiteColumns:
+    """Growable, time-ordered columnar buffer for one site."""
+
+    def __init__(self, capacity=1024):
+        self.n = 0
+        self.step_ns = None
+        self.mtime = None   # of the file this buffer was loaded from or last saved to
+        self.ts = np.empty(capacity, dtype=np.int64)
+        self.cols = {c: np.empty(capacity, dtype=np.float32) for c in BASE_COLUMNS + LAG_FEATURES}
+
+    def _reserve(self, extra):
+        need = self.n + extra
+        if need <= len(self.ts):
+            return
+        cap = max(need, 2 * len(self.ts))
+        self.ts = np.resize(self.ts, cap)
+        for c in self.cols:
+            self.cols[c] = np.resize(self.cols[c], cap)
+
+    def lookup(self, name, ts_ns):
+        """Values of column `name` at exactly `ts_ns` (NaN where no row exists)."""
+        ts_ns = np.asarray(ts_ns, dtype=np.int64)
+        out = np.full(len(ts_ns), np.nan, dtype=np.float32)
+        if self.n == 0:
+            return out
+        stored = self.ts[:self.n]
+        idx = np.searchsorted(stored, ts_ns)
+        idx_c = np.minimum(idx, self.n - 1)
+        hit = stored[idx_c] == ts_ns
+        out[hit] = self.cols[name][idx_c[hit]]
+        return out
+
+
+class _SiteFileLock:
+    """Exclusive flock on `<site>.lock`; a no-op when the store is not persisted or flock is unavailable."""
+
+    def __init__(self, path, enabled=True):
+        self.path = path
+        self.enabled = enabled and fcntl is not None
+        self.fd = None
+
+    def __enter__(self):
+        if self.enabled:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+class FeatureStore:
+    """
+    Per-site store of base columns plus incrementally maintained lag features:
+
+    - prev_output_kwh: output one step earlier
+    - cloud_trend_3h: cloud_pct now minus cloud_pct three hours earlier
+    - same_hour_yesterday_kwh: output 24 hours earlier
+    """
+
+    def __init__(self, root=STORE_DIR, persist=True):
+        self.root = root
+        self.persist = persist
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def _path(self, site_id):
+        return os.path.join(self.root, f'{site_id}.npz')
+
+    def _file_lock(self, site_id):
+        return _SiteFileLock(os.path.join(self.root, f'{site_id}.lock'), self.persist)
+
+    def _site(self, site_id):
+        site = self._sites.get(site_id)
+        if site is None or (self.persist and self._mtime(site_id) != site.mtime):
+            # First use, or another process (app upload, pipeline) saved newer rows
+            site = self._sites[site_id] = self._load(site_id) or site or _SiteColumns()
+        return site
+
+    def _mtime(self, site_id):
+        try:
+            return os.stat(self._path(site_id)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self, site_id):
+        if not self.persist or not os.path.exists(self._path(site_id)):
+            return None
+        try:
+            mtime = self._mtime(site_id)
+            with np.load(self._path(site_id)) as data:
+                site = _SiteColumns(max(1024, len(data['ts'])))
+                n = len(data['ts'])
+                site.ts[:n] = data['ts']
+                for c in site.cols:
+                    site.cols[c][:n] = data[c]
+                site.n = n
+                site.step_ns = int(data['step_ns']) or None
+                site.mtime = mtime
+                return site
+        except Exception as e:
+            log.warning(f"[{site_id}] Discarding unreadable feature store: {e}")
+            return None
+
+    def save(self, site_id):
+        with self._lock, self._file_lock(site_id):
+            self._save(site_id)
+
+    def _save(self, site_id):
+        if not self.persist:
+            return
+        site = self._sites.get(site_id)
+        if site is None:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(site_id)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz'
+        np.savez(tmp, ts=site.ts[:site.n], step_ns=np.int64(site.step_ns or 0),
+                 **{c: v[:site.n] for c, v in site.cols.items()})
+        os.replace(tmp, path)
+        site.mtime = self._mtime(site_id)
+
+    def __len__(self):
+        return len(self._sites)
+
+    def size(self, site_id):
+        return self._site(site_id).n
+
+    def append(self, site_id, df, save=True):
+        """
+        Append new rows for a site and compute their lag features.
+
+        Rows at or before the newest stored timestamp are ignored, so re-sending
+        an overlapping batch is harmless. Missing base columns are stored as NaN.
+        Returns the number of rows added.
+        """
+        df = ensure_timestamps(df)
+        with self._lock, self._file_lock(site_id):
+            site = self._site(site_id)
+            ts = df['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+            keep = np.concatenate([[True], np.diff(ts) > 0]) if len(ts) else np.zeros(0, dtype=bool)
+            if site.n:
+                keep &= ts > site.ts[site.n - 1]
+            if not keep.any():
+                return 0
+            ts = ts[keep]
+            k = len(ts)
+            if site.step_ns is None:
+                site.step_ns = int(infer_step(pd.to_datetime(ts)).value) if k > 1 else _HOUR_NS
+
+            site._reserve(k)
+            lo, hi = site.n, site.n + k
+            site.ts[lo:hi] = ts
+            for c in BASE_COLUMNS:
+                site.cols[c][lo:hi] = df[c].to_numpy(dtype=np.float32)[keep] if c in df.columns else np.nan
+            site.n = hi
+
+            # Lag features for the new rows only; lookups may reach into the new batch itself
+            site.cols['prev_output_kwh'][lo:hi] = site.lookup('output_kwh', ts - site.step_ns)
+            site.cols['cloud_trend_3h'][lo:hi] = site.cols['cloud_pct'][lo:hi] - site.lookup('cloud_pct', ts - 3 * _HOUR_NS)
+            site.cols['same_hour_yesterday_kwh'][lo:hi] = site.lookup('output_kwh', ts - _DAY_NS)
+
+            if save:
+                self._save(site_id)
+            return k
+
+    def frame(self, site_id, features=LAG_FEATURES, since=None, dropna=True):
+        """Aligned training frame: timestamp, hour, base columns and the requested lag features."""
+        site = self._site(site_id)
+        start = 0
+        if since is not None:
+            start = int(np.searchsorted(site.ts[:site.n], pd.Timestamp(since).value))
+        ts = pd.to_datetime(site.ts[start:site.n])
+        df = pd.DataFrame({'timestamp': ts, 'hour': (ts.hour + ts.minute / 60.0).to_numpy()})
+        for c in BASE_COLUMNS + tuple(f for f in features if f not in BASE_COLUMNS):
+            df[c] = site.cols[c][start:site.n]
+        if np.all(df['hour'] == np.floor(df['hour'])):
+            df['hour'] = df['hour'].astype(int)
+        return df.dropna().reset_index(drop=True) if dropna else df
+
+    def matrix(self, site_id, features, target='output_kwh'):
+        """(X, y) float32 arrays for `features` with incomplete rows dropped."""
+        df = self.frame(site_id, [f for f in features if f in LAG_FEATURES])
+        return df[list(features)].to_numpy(dtype=np.float32), df[target].to_numpy(dtype=np.float32)
+
+    def forecast_features(self, site_id, future):
+        """
+        Lag inputs for future timestamps, taken from stored history only.
+
+        prev_output_kwh and cloud_pct_3h_ago are NaN wherever the lag reaches past the
+        newest stored row; forecast_hours rolls them forward from its own predictions and
+        cloud forecast, the same way the features were built for training.
+        same_hour_yesterday_kwh looks back whole days until it reaches stored history.
+        """
+        site = self._site(site_id)
+        n = len(future)
+        if site.n == 0:
+            return {'prev_output_kwh': np.full(n, np.nan), CLOUD_3H_AGO: np.full(n, np.nan),
+                    'same_hour_yesterday_kwh': np.zeros(n)}
+        last = site.n - 1
+        ts = pd.DatetimeIndex(future).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        days_back = np.maximum(1, np.ceil((ts - site.ts[last]) / _DAY_NS)).astype(np.int64)
+        yesterday = site.lookup('output_kwh', ts - days_back * _DAY_NS)
+        fallback = site.cols['output_kwh'][last]
+        return {
+            'prev_output_kwh': site.lookup('output_kwh', ts - site.step_ns).astype(float),
+            CLOUD_3H_AGO: site.lookup('cloud_pct', ts - 3 * _HOUR_NS).astype(float),
+            'same_hour_yesterday_kwh': np.where(np.isnan(yesterday), np.nan_to_num(fallback), yesterday).astype(float),
+        }
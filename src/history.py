@@ -0,0 +1,186 @@
+"""
+Bounded-size history views for the dashboard.
+
+Tables are read with keyset pagination (`WHERE id < ? ORDER BY id DESC LIMIT ?`)
+so every page costs the same regardless of how deep it is, and long series are
+first reduced to per-bucket extremes inside SQLite, streamed in batches
+(fetchmany, no JSON decoding) and decimated with Largest-Triangle-Three-Buckets
+so charts never carry more than a fixed number of points to the browser.
+"""
+import json
+import sqlite3
+import logging
+
+import numpy as np
+import pandas as pd
+
+from . import db
+from . import metrics
+
+log = logging.getLogger('amplifyai.history')
+
+DEFAULT_PAGE_SIZE = 25
+DEFAULT_MAX_POINTS = 500
+STREAM_BATCH = 5000
+SQL_BUCKETS_PER_POINT = 4
+
+
+def lttb(x, y, n_out):
+    """
+    Indices of `n_out` points chosen by Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last points and, per bucket, the point forming the largest
+    triangle with the previously kept point and the next bucket's mean, which
+    preserves peaks and troughs far better than striding or averaging.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)  # n_out - 2 inner buckets
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    # The bucket after the last inner one is the final point
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def downsample(df, x_col, y_col, max_points=DEFAULT_MAX_POINTS):
+    """Rows of `df` (sorted by `x_col`) decimated with LTTB to at most `max_points`."""
+    if len(df) <= max_points:
+        return df
+    x = df[x_col]
+    if pd.api.types.is_datetime64_any_dtype(x):
+        x = x.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    return df.iloc[lttb(x, df[y_col].to_numpy(dtype=float), max_points)]
+
+
+def iter_rows(query, params=(), batch_size=STREAM_BATCH, db_path=None):
+    """Stream result rows from the database (default `db.DB_PATH`) in fixed-size batches."""
+    db_path = db_path or db.DB_PATH
+    db.init_db(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.execute(query, params)
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                break
+            yield from batch
+    finally:
+        conn.close()
+
+
+def _page(query, where, params, before_id, page_size, db_path=None):
+    clauses = list(where)
+    if before_id is not None:
+        clauses.append('id < ?')
+        params = [*params, before_id]
+    sql = query.format(where=f"WHERE {' AND '.join(clauses)}" if clauses else '')
+    try:
+        db_path = db_path or db.DB_PATH
+        db.init_db(db_path)
+        conn = sqlite3.connect(db_path)
+        # One extra row tells whether an older page exists
+        rows = conn.execute(sql, [*params, page_size + 1]).fetchall()
+        conn.close()
+    except Exception as e:
+        db._record_error('history_page', e)
+        return [], None
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    return rows, (rows[-1][0] if more else None)
+
+
+@metrics.timed('db', op='page_forecasts')
+def page_forecasts(page_size=DEFAULT_PAGE_SIZE, before_id=None, model=None, db_path=None):
+    """
+    One page of forecast runs, newest first, without decoding forecast payloads.
+
+    Returns:
+        (rows, next_before_id): rows are dicts with 'id', 'timestamp', 'model', 'mse',
+        'n_steps' and 'matched_steps'; pass next_before_id back for the next (older) page,
+        None when this is the last page
+    """
+    rows, cursor = _page('''SELECT id, timestamp, model_used, mse, n_steps, matched_steps
+                            FROM forecast_history {where} ORDER BY id DESC LIMIT ?''',
+                         ['model_used = ?'] if model else [], [model] if model else [], before_id, page_size,
+                         db_path)
+    keys = ('id', 'timestamp', 'model', 'mse', 'n_steps', 'matched_steps')
+    return [dict(zip(keys, r)) for r in rows], cursor
+
+
+@metrics.timed('db', op='page_schedules')
+def page_schedules(page_size=DEFAULT_PAGE_SIZE, before_id=None, db_path=None):
+    """One page of battery schedules, newest first; only the small summary is decoded."""
+    rows, cursor = _page('''SELECT id, timestamp, horizon_hours, objective, summary_json
+                            FROM battery_schedule_history {where} ORDER BY id DESC LIMIT ?''',
+                         [], [], before_id, page_size, db_path)
+    return [{'id': r[0], 'timestamp': r[1], 'horizon': r[2], 'objective': r[3],
+             'summary': json.loads(r[4]) if r[4] else {}} for r in rows], cursor
+
+
+@metrics.timed('db', op='mse_series')
+def mse_series(max_points=DEFAULT_MAX_POINTS, model=None, db_path=None):
+    """
+    Training MSE per forecast run over time, LTTB-decimated per model.
+
+    Runs still in `forecast_history` are first reduced inside SQLite: each
+    model's id range is cut into `SQL_BUCKETS_PER_POINT` buckets per output
+    point and only the lowest- and highest-MSE run of each bucket is read, so
+    memory stays bounded however many runs are stored. Runs already rolled up
+    by retention contribute one point per model and day (or week): their mean
+    MSE. The point budget is split evenly across models. Returns a DataFrame
+    with 'timestamp', 'model' and 'mse' of at most `max_points` rows; reads
+    `db_path` (default `db.DB_PATH`).
+    """
+    where, params = '', []
+    if model:
+        where = ' AND model_used = ?'
+        params.append(model)
+    rollup = f'''SELECT period_start, model_used, SUM(sum_mse) / SUM(mse_n) FROM forecast_rollup
+                  WHERE mse_n > 0{where} GROUP BY period, period_start, model_used'''
+    spans = f'''SELECT model_used, MIN(id), MAX(id) FROM forecast_history
+                 WHERE mse IS NOT NULL{where} GROUP BY model_used'''
+    # With a single MIN()/MAX() aggregate SQLite returns the bare columns of that row
+    bucketed = '''SELECT id, timestamp, model_used, {agg}(mse) FROM forecast_history JOIN spans USING (model_used)
+                    WHERE mse IS NOT NULL{where}
+                    GROUP BY model_used, ((id - lo) * ?) / (hi - lo + 1)'''
+
+    points = {}
+    try:
+        rolled = list(iter_rows(rollup, params, db_path=db_path))
+        models = {m for m, _, _ in iter_rows(spans, params, db_path=db_path)} | {m for _, m, _ in rolled}
+        if models:
+            n_buckets = max(3, max_points // len(models)) * SQL_BUCKETS_PER_POINT
+            for agg in ('MIN', 'MAX'):
+                sql = (f'WITH spans (model_used, lo, hi) AS ({spans}) '
+                       + bucketed.format(agg=agg, where=where))
+                for row_id, ts, m, v in iter_rows(sql, [*params, *params, n_buckets], db_path=db_path):
+                    points[row_id] = (ts, m, v)  # a run can be both its bucket's MIN and MAX
+            points.update((('rollup', i), row) for i, row in enumerate(rolled))
+    except Exception as e:
+        db._record_error('mse_series', e)
+    if not points:
+        return pd.DataFrame(columns=['timestamp', 'model', 'mse'])
+
+    stamps, names, values = zip(*points.values())
+    df = pd.DataFrame({'timestamp': pd.to_datetime(list(stamps), format='ISO8601'), 'model': list(names),
+                       'mse': np.asarray(values, dtype=float)})
+    groups = list(df.groupby('model', sort=True))
+    budget = max(3, max_points // len(groups))
+    parts = [downsample(g.sort_values('timestamp', kind='stable'), 'timestamp', 'mse', budget) for _, g in groups]
+    return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,233 @@
+"""
+Lightweight in-process metrics: counters and latency histograms.
+
+Disabled by default; every instrumented call then costs a single flag check.
+Enable with `AMPLIFYAI_METRICS=1` or `metrics.enable()`, then export with
+`write_metrics(path)` (Prometheus text format) or `start_http_server(port)`.
+"""
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from functools import wraps
+
+log = logging.getLogger('amplifyai.metrics')
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_enabled = os.environ.get('AMPLIFYAI_METRICS', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (cumulative export, per-bucket storage)."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside the matching bucket."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c > 0:
+                lo = self.buckets[i - 1] if i > 0 else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, labels=()):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        key = (name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """Plain-dict view for dashboards: one row per series."""
+        with self._lock:
+            rows = []
+            for (name, labels), value in sorted(self.counters.items()):
+                rows.append({'name': name, 'labels': dict(labels), 'type': 'counter', 'value': value})
+            for (name, labels), h in sorted(self.histograms.items()):
+                rows.append({
+                    'name': name, 'labels': dict(labels), 'type': 'histogram',
+                    'count': h.count, 'sum': h.sum,
+                    'mean': h.sum / h.count if h.count else 0.0,
+                    'p50': h.quantile(0.5), 'p95': h.quantile(0.95), 'p99': h.quantile(0.99),
+                })
+            return rows
+
+    def to_prometheus(self):
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    lines.append(f'# TYPE amplifyai_{name} counter')
+                    seen.add(name)
+                lines.append(f'amplifyai_{name}{fmt_labels(labels)} {value}')
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in seen:
+                    lines.append(f'# TYPE amplifyai_{name} histogram')
+                    seen.add(name)
+                cumulative = 0
+                for bound, c in zip(h.buckets, h.counts):
+                    cumulative += c
+                    lines.append(f'amplifyai_{name}_bucket{fmt_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'amplifyai_{name}_bucket{fmt_labels(labels, [("le", "+Inf")])} {h.count}')
+                lines.append(f'amplifyai_{name}_sum{fmt_labels(labels)} {h.sum}')
+                lines.append(f'amplifyai_{name}_count{fmt_labels(labels)} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled():
+    return _enabled
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def count(name, value=1, **labels):
+    """Increment a counter (e.g. `count('db_errors_total', op='insert_forecast')`)."""
+    if _enabled:
+        registry.inc(name, value, _labels(labels))
+
+
+def observe(name, seconds, **labels):
+    """Record a latency sample in seconds."""
+    if _enabled:
+        registry.observe(name, seconds, _labels(labels))
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('name', 'labels', 't0')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe(f'{self.name}_seconds', time.perf_counter() - self.t0, self.labels)
+        if exc_type is not None:
+            registry.inc(f'{self.name}_errors_total', 1, self.labels)
+        return False
+
+
+def timer(name, **labels):
+    """Context manager recording `<name>_seconds` and, on exception, `<name>_errors_total`."""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name, _labels(labels))
+
+
+def timed(name=None, **labels):
+    """Decorator form of `timer`; defaults to the function name."""
+    def decorator(fn):
+        metric = name or fn.__name__
+        label_key = _labels(labels)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Timer(metric, label_key):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_metrics(path):
+    """Write the registry in Prometheus text format (atomic replace, textfile-collector friendly)."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(registry.to_prometheus())
+    os.replace(tmp, path)
+
+
+def start_http_server(port=9108, addr='0.0.0.0'):
+    """Serve `/metrics` from a daemon thread. Returns the server (call `.shutdown()` to stop)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='amplifyai-metrics').start()
+    log.info(f"Metrics endpoint on http://{addr}:{server.server_address[1]}/metrics")
+    return server
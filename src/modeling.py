@@ -1,14 +1,29 @@
+import time
+
 import numpy as np
 import pandas as pd
 from sklearn.linear_model import LinearRegression
+from sklearn.ensemble import HistGradientBoostingRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error
+
+from . import metrics
+from .solar import get_solar_table, DEFAULT_LOCATION
+from .timeseries import to_step, step_hours, infer_step, future_index, hour_of_day, horizon_steps
+from .feature_store import CLOUD_3H_AGO
 try:
     from pmdarima import auto_arima
     ARIMA_AVAILABLE = True
 except ImportError:
     ARIMA_AVAILABLE = False
 
+GBM_CHUNK_ITERS = 25
+# Lag features rolled forward over the horizon (see FeatureStore.forecast_features)
+PREV_OUTPUT = 'prev_output_kwh'
+CLOUD_TREND = 'cloud_trend_3h'
+GBM_MIN_EARLY_STOPPING_ROWS = 200
+
+@metrics.timed('train', model='linear')
 def train_simple_regressor(df, features, target):
     X = df[features].values
     y = df[target].values
@@ -19,6 +34,49 @@ def train_simple_regressor(df, features, target):
     mse = mean_squared_error(y_test, preds)
     return model, mse
 
+@metrics.timed('train', model='gbm')
+def train_gradient_boosting(df, features, target, max_iter=300, time_budget_s=10.0, early_stopping=True,
+                            learning_rate=0.1, random_state=42):
+    """
+    Train a histogram gradient boosting regressor (multithreaded via OpenMP).
+    
+    Trees are added in chunks with warm_start so training stops at `time_budget_s`
+    even when early stopping has not triggered. Early stopping holds out 10% of the
+    training rows and is skipped for frames too small to spare a validation set.
+    
+    Returns:
+        (model, mse) with mse on a 20% test split, as train_simple_regressor
+    """
+    X = df[features].to_numpy(dtype=np.float32)
+    y = df[target].to_numpy(dtype=np.float32)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=random_state)
+    stop_early = early_stopping and len(X_train) >= GBM_MIN_EARLY_STOPPING_ROWS
+    model = HistGradientBoostingRegressor(
+        learning_rate=learning_rate,
+        max_iter=0,
+        min_samples_leaf=min(20, max(1, len(X_train) // 10)),
+        early_stopping=stop_early,
+        validation_fraction=0.1 if stop_early else None,
+        n_iter_no_change=10,
+        warm_start=True,
+        random_state=random_state,
+    )
+    
+    t0 = time.perf_counter()
+    while model.max_iter < max_iter:
+        model.max_iter = min(max_iter, model.max_iter + GBM_CHUNK_ITERS)
+        model.fit(X_train, y_train)
+        if model.n_iter_ < model.max_iter:
+            break  # early stopping triggered
+        if time.perf_counter() - t0 > time_budget_s:
+            metrics.count('train_time_budget_exceeded_total', model='gbm')
+            break
+    
+    preds = model.predict(X_test)
+    mse = mean_squared_error(y_test, preds)
+    return model, mse
+
+@metrics.timed('train', model='arima')
 def train_arima_model(df, target='output_kwh'):
     """Train ARIMA model if available"""
     if not ARIMA_AVAILABLE:
@@ -33,7 +91,102 @@ def predict_next(model, feature_row):
     x = np.array(feature_row).reshape(1, -1)
     return float(model.predict(x)[0])
 
-def forecast_hours(model, df, features, n_hours=24, model_type='linear'):
+def _forecast_axis(df, n_hours, step):
+    """Step, step hours, step count and the future timestamps following the last row of `df`."""
+    step = to_step(step) if step is not None else infer_step(df)
+    n_steps = horizon_steps(n_hours, step)
+    last_row = df.iloc[-1]
+    if 'timestamp' in df.columns:
+        last_ts = pd.Timestamp(last_row['timestamp'])
+    else:
+        last_ts = pd.Timestamp.now().normalize() + pd.Timedelta(hours=float(last_row['hour']))
+    return step, step_hours(step), n_steps, last_ts, future_index(last_ts, n_steps, step)
+
+def _feature_matrix(df, features, future, last_ts, step, location=None, exogenous=None):
+    """
+    Per-step model inputs for the forecast horizon.
+    
+    Clear-sky shape from the site's solar table, scaled by the clear-sky index observed
+    at the forecast origin and by the drifting cloud cover. Returns (X, daylight mask).
+    """
+    n_steps = len(future)
+    step_h = step_hours(step)
+    lat, lon = (location or DEFAULT_LOCATION)[:2]
+    tz = location[2] if location is not None and len(location) > 2 else None
+    step_min = int(step.total_seconds() // 60)
+    table = get_solar_table(lat, lon, tz, step_minutes=step_min if step_min and 1440 % step_min == 0 else 60)
+    clear = table.lookup(future).astype(float)
+    daylight = table.lookup(future, 'daylight')
+    
+    last_row = df.iloc[-1]
+    last_ghi = float(last_row['ghi'])
+    last_cloud = float(last_row['cloud_pct'])
+    last_clear = float(table.lookup(last_ts)[0])
+    cloud_factor0 = 1 - last_cloud / 200.0
+    k0 = min(1.2, max(0.0, last_ghi / last_clear)) if last_clear > 50 else cloud_factor0
+    
+    noise = np.random.normal(0, 1, (2, n_steps))
+    noise[:, 0] = 0
+    temp = float(last_row['temp_c']) + 0.5 * noise[0]
+    cloud = np.clip(last_cloud + np.cumsum(5 * np.sqrt(step_h) * noise[1]), 0, 100)
+    ghi = np.where(daylight, clear * np.clip(k0 * (1 - cloud / 200.0) / cloud_factor0, 0, 1.2), 0.0)
+    
+    columns = {'hour': hour_of_day(future).astype(float), 'ghi': ghi, 'temp_c': temp, 'cloud_pct': cloud}
+    if exogenous is not None:
+        extra = exogenous(future) if callable(exogenous) else exogenous
+        for k, v in extra.items():
+            v = np.broadcast_to(np.asarray(v, dtype=float), (n_steps,))
+            # NaN steps (e.g. past the end of a weather run) keep the built-in column
+            columns[k] = np.where(np.isnan(v), columns[k], v) if k in columns else v
+    if CLOUD_TREND in features and CLOUD_TREND not in columns:
+        # Cloud cover 3 h earlier: stored history where it reaches, else the horizon's own cloud forecast
+        lag = max(1, int(round(3.0 / step_h)))
+        earlier = np.full(n_steps, np.nan)
+        earlier[lag:] = columns['cloud_pct'][:n_steps - lag]
+        if CLOUD_3H_AGO in columns:
+            earlier = np.where(np.isnan(columns[CLOUD_3H_AGO]), earlier, columns[CLOUD_3H_AGO])
+        columns[CLOUD_TREND] = np.nan_to_num(columns['cloud_pct'] - earlier)
+    return np.column_stack([columns[f] for f in features]), daylight
+
+def _predict(model, X, daylight, features, starts=(0,)):
+    """
+    Clipped predictions, zero outside daylight.
+
+    NaN prev_output_kwh inputs (steps past the end of history) are filled with the
+    previous step's prediction, one step at a time across every block of rows
+    (one block per site, starting at `starts`).
+    """
+    features = list(features)
+    j = features.index(PREV_OUTPUT) if PREV_OUTPUT in features else None
+    if j is None or not np.isnan(X[:, j]).any():
+        return np.where(daylight, np.clip(np.asarray(model.predict(X), dtype=float), 0, None), 0.0)
+    X = np.array(X, dtype=float)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.append(starts[1:], len(X))
+    preds = np.zeros(len(X))
+    for k in range(int((ends - starts).max())):
+        rows = (starts + k)[starts + k < ends]
+        prev = preds[rows - 1] if k else 0.0
+        X[rows, j] = np.where(np.isnan(X[rows, j]), prev, X[rows, j])
+        preds[rows] = np.where(daylight[rows], np.clip(np.asarray(model.predict(X[rows]), dtype=float), 0, None), 0.0)
+    return preds
+
+def _uncertainty(preds, step_h):
+    return (0.15 * preds + 0.1) * (1 + np.arange(len(preds)) * step_h * 0.05)
+
+def _forecast_result(future, step, mean, std):
+    future_hours = hour_of_day(future)
+    return {
+        'hours': [int(h) if h == int(h) else float(h) for h in future_hours],
+        'timestamps': [ts.isoformat() for ts in future],
+        'mean': mean,
+        'std': std,
+        'step_minutes': step.total_seconds() / 60.0
+    }
+
+@metrics.timed('forecast_hours')
+def forecast_hours(model, df, features, n_hours=24, model_type='linear', step=None, location=None,
+                   exogenous=None):
     """
     Forecast next n hours of solar production with confidence intervals.
     
@@ -41,58 +194,70 @@ def forecast_hours(model, df, features, n_hours=24, model_type='linear'):
         model: Trained regression model
         df: Historical data DataFrame
         features: List of feature names
-        n_hours: Number of hours to forecast
-        model_type: 'linear', 'arima', or 'prophet'
+        n_hours: Forecast horizon in hours
+        model_type: 'linear', 'gbm', 'arima', or 'prophet'
+        step: Step size ('15min', '1h', minutes or Timedelta); defaults to the data's spacing
+        location: (lat, lon) or (lat, lon, tz_offset_hours) for the solar table; defaults to the home site
+        exogenous: Extra or overriding per-step feature columns, as a dict of arrays or a
+            callable taking the future DatetimeIndex (e.g. FeatureStore.forecast_features or
+            GriddedForecast.site_exogenous); NaN entries keep the built-in value
     
     Returns:
-        dict with 'hours', 'mean', 'std' arrays
+        dict with 'hours' (hour of day), 'timestamps', 'mean', 'std' arrays and 'step_minutes'
     """
+    step, step_h, n_steps, last_ts, future = _forecast_axis(df, n_hours, step)
+    
     if model_type == 'arima' and ARIMA_AVAILABLE:
         try:
-            forecasts = model.predict(n_periods=n_hours).tolist()
+            forecasts = model.predict(n_periods=n_steps).tolist()
             forecasts = [max(0, f) for f in forecasts]
             uncertainties = [0.2 * f + 0.15 for f in forecasts]
-            hours_list = [(int(df.iloc[-1]['hour']) + i + 1) % 24 for i in range(n_hours)]
-            return {'hours': hours_list, 'mean': forecasts, 'std': uncertainties}
+            return _forecast_result(future, step, forecasts, uncertainties)
         except Exception:
             pass
     
-    last_row = df.iloc[-1]
-    last_hour = int(last_row['hour'])
+    X, daylight = _feature_matrix(df, features, future, last_ts, step, location, exogenous)
+    # A regression can predict output from hour/temperature alone; there is none outside daylight
+    preds = _predict(model, X, daylight, features)
+    std = np.where(daylight, _uncertainty(preds, step_h), 0.0)
+    return _forecast_result(future, step, preds.tolist(), std.tolist())
+
+@metrics.timed('forecast_fleet')
+def forecast_fleet(model, frames, features, n_hours=24, step=None, locations=None, exogenous=None):
+    """
+    Forecast many sites with one shared regression model and a single predict call.
     
-    forecasts = []
-    uncertainties = []
-    hours_list = []
+    Args:
+        model: Trained regression model (linear or gbm)
+        frames: Dict of site_id -> historical DataFrame
+        features: List of feature names
+        n_hours: Forecast horizon in hours
+        step: Step size; defaults to each site's data spacing
+        locations: Optional dict of site_id -> (lat, lon[, tz_offset_hours])
+        exogenous: Optional dict of site_id -> exogenous features, as for forecast_hours
     
-    for i in range(n_hours):
-        next_hour = (last_hour + i + 1) % 24
-        
-        if i == 0:
-            base_ghi = last_row['ghi']
-            base_temp = last_row['temp_c']
-            base_cloud = last_row['cloud_pct']
-        else:
-            base_ghi = forecasts[-1] * 250.0 if forecasts[-1] > 0 else 0
-            base_temp = last_row['temp_c'] + np.random.normal(0, 0.5)
-            base_cloud = min(100, max(0, base_cloud + np.random.normal(0, 5)))
-        
-        if 6 <= next_hour <= 18:
-            solar_factor = np.sin((next_hour - 6) * np.pi / 12) ** 0.5
-            ghi = base_ghi * solar_factor * (1 - base_cloud / 200.0)
-        else:
-            ghi = 0
-        
-        feature_row = [next_hour, max(0, ghi), base_temp, base_cloud]
-        pred = predict_next(model, feature_row)
-        
-        uncertainty = (0.15 * pred + 0.1) * (1 + i * 0.05)
-        
-        forecasts.append(max(0, pred))
-        uncertainties.append(uncertainty)
-        hours_list.append(next_hour)
+    Returns:
+        dict of site_id -> forecast dict as returned by forecast_hours
+    """
+    locations, exogenous = locations or {}, exogenous or {}
+    axes, blocks, masks = {}, [], []
+    for site_id, df in frames.items():
+        site_step, _, _, last_ts, future = axes[site_id] = _forecast_axis(df, n_hours, step)
+        X, daylight = _feature_matrix(df, features, future, last_ts, site_step, locations.get(site_id),
+                                      exogenous.get(site_id))
+        blocks.append(X)
+        masks.append(daylight)
+    if not blocks:
+        return {}
     
-    return {
-        'hours': hours_list,
-        'mean': forecasts,
-        'std': uncertainties
-    }
+    # One predict over the stacked fleet × horizon matrix, then split back per site
+    daylight = np.concatenate(masks)
+    starts = np.cumsum([0] + [len(b) for b in blocks[:-1]])
+    preds = _predict(model, np.vstack(blocks), daylight, features, starts)
+    out, offset = {}, 0
+    for site_id, (site_step, step_h, n_steps, _, future) in axes.items():
+        site_preds = preds[offset:offset + n_steps]
+        site_std = np.where(daylight[offset:offset + n_steps], _uncertainty(site_preds, step_h), 0.0)
+        offset += n_steps
+        out[site_id] = _forecast_result(future, site_step, site_preds.tolist(), site_std.tolist())
+    return out
@@ -1,6 +1,8 @@
 from pulp import LpProblem, LpVariable, LpMinimize, PULP_CBC_CMD
 import numpy as np
 
+from . import metrics
+
 def optimize_battery_schedule(
     forecast_kwh,
     demand_kwh,
@@ -9,20 +11,24 @@ def optimize_battery_schedule(
     charge_rate_max=10,
     discharge_rate_max=10,
     roundtrip_eff=0.9,
-    objective='minimize_unmet'
+    objective='minimize_unmet',
+    engine='pulp',
+    step_hours=1.0
 ):
     """
     Multi-hour battery optimization using Linear Programming.
     
     Args:
-        forecast_kwh: List of forecasted solar production (kWh) for each hour
-        demand_kwh: List of expected demand (kWh) for each hour
+        forecast_kwh: List of forecasted solar production (kWh) for each step
+        demand_kwh: List of expected demand (kWh) for each step
         battery_capacity_kwh: Maximum battery capacity (kWh)
         initial_soc_kwh: Initial state of charge (kWh)
         charge_rate_max: Maximum charge rate (kW)
         discharge_rate_max: Maximum discharge rate (kW)
         roundtrip_eff: Roundtrip efficiency (0-1)
         objective: 'minimize_unmet' or 'maximize_self_consumption'
+        engine: 'pulp' (CBC via PuLP) or 'sparse' (sparse matrix + HiGHS, for long horizons)
+        step_hours: Length of each step in hours (rates are kW, energies kWh per step)
     
     Returns:
         dict with 'charge', 'discharge', 'soc', 'unmet_demand', 'excess_energy', 'actions'
@@ -32,34 +38,44 @@ def optimize_battery_schedule(
     if len(demand_kwh) != horizon:
         raise ValueError("Forecast and demand must have same length")
     
-    prob = LpProblem('MultiHourBatteryOpt', LpMinimize)
-    
-    charge = [LpVariable(f'charge_{t}', lowBound=0, upBound=charge_rate_max) for t in range(horizon)]
-    discharge = [LpVariable(f'discharge_{t}', lowBound=0, upBound=discharge_rate_max) for t in range(horizon)]
-    soc = [LpVariable(f'soc_{t}', lowBound=0, upBound=battery_capacity_kwh) for t in range(horizon)]
-    unmet = [LpVariable(f'unmet_{t}', lowBound=0) for t in range(horizon)]
-    excess = [LpVariable(f'excess_{t}', lowBound=0) for t in range(horizon)]
+    if engine == 'sparse':
+        return _optimize_sparse(forecast_kwh, demand_kwh, battery_capacity_kwh, initial_soc_kwh,
+                                charge_rate_max, discharge_rate_max, roundtrip_eff, objective, step_hours)
     
-    if objective == 'minimize_unmet':
-        prob += sum(unmet)
-    elif objective == 'maximize_self_consumption':
-        prob += sum(excess)
-    else:
-        prob += sum(unmet) + 0.5 * sum(excess)
+    charge_step_max = charge_rate_max * step_hours
+    discharge_step_max = discharge_rate_max * step_hours
     
-    for t in range(horizon):
-        if t == 0:
-            prob += soc[t] == initial_soc_kwh + (charge[t] * roundtrip_eff) - discharge[t]
-        else:
-            prob += soc[t] == soc[t-1] + (charge[t] * roundtrip_eff) - discharge[t]
+    with metrics.timer('optimize_build'):
+        prob = LpProblem('MultiHourBatteryOpt', LpMinimize)
         
-        prob += forecast_kwh[t] + discharge[t] + unmet[t] == demand_kwh[t] + charge[t] + excess[t]
+        charge = [LpVariable(f'charge_{t}', lowBound=0, upBound=charge_step_max) for t in range(horizon)]
+        discharge = [LpVariable(f'discharge_{t}', lowBound=0, upBound=discharge_step_max) for t in range(horizon)]
+        soc = [LpVariable(f'soc_{t}', lowBound=0, upBound=battery_capacity_kwh) for t in range(horizon)]
+        unmet = [LpVariable(f'unmet_{t}', lowBound=0) for t in range(horizon)]
+        excess = [LpVariable(f'excess_{t}', lowBound=0) for t in range(horizon)]
         
-        prob += charge[t] + discharge[t] <= max(charge_rate_max, discharge_rate_max)
+        if objective == 'minimize_unmet':
+            prob += sum(unmet)
+        elif objective == 'maximize_self_consumption':
+            prob += sum(excess)
+        else:
+            prob += sum(unmet) + 0.5 * sum(excess)
+        
+        for t in range(horizon):
+            if t == 0:
+                prob += soc[t] == initial_soc_kwh + (charge[t] * roundtrip_eff) - discharge[t]
+            else:
+                prob += soc[t] == soc[t-1] + (charge[t] * roundtrip_eff) - discharge[t]
+            
+            prob += forecast_kwh[t] + discharge[t] + unmet[t] == demand_kwh[t] + charge[t] + excess[t]
+            
+            prob += charge[t] + discharge[t] <= max(charge_step_max, discharge_step_max)
     
-    prob.solve(PULP_CBC_CMD(msg=0))
+    with metrics.timer('optimize_solve'):
+        prob.solve(PULP_CBC_CMD(msg=0))
     
     if prob.status != 1:
+        metrics.count('optimize_infeasible_total')
         return {
             'charge': [0.0] * horizon,
             'discharge': [0.0] * horizon,
@@ -76,21 +92,53 @@ def optimize_battery_schedule(
     unmet_vals = [unmet[t].value() if unmet[t].value() else 0.0 for t in range(horizon)]
     excess_vals = [excess[t].value() if excess[t].value() else 0.0 for t in range(horizon)]
     
-    actions = []
-    for t in range(horizon):
-        if charge_vals[t] > 0.1:
-            actions.append(f"Charge {charge_vals[t]:.2f} kWh (surplus expected)")
-        elif discharge_vals[t] > 0.1:
-            actions.append(f"Discharge {discharge_vals[t]:.2f} kWh (deficit expected)")
-        else:
-            actions.append("Hold steady (balanced)")
-    
     return {
         'charge': charge_vals,
         'discharge': discharge_vals,
         'soc': soc_vals,
         'unmet_demand': unmet_vals,
         'excess_energy': excess_vals,
-        'actions': actions,
+        'actions': describe_actions(charge_vals, discharge_vals),
         'status': 'success'
     }
+
+
+def describe_actions(charge_vals, discharge_vals):
+    """Human-readable action per hour from charge/discharge amounts"""
+    actions = []
+    for c, d in zip(charge_vals, discharge_vals):
+        if c > 0.1:
+            actions.append(f"Charge {c:.2f} kWh (surplus expected)")
+        elif d > 0.1:
+            actions.append(f"Discharge {d:.2f} kWh (deficit expected)")
+        else:
+            actions.append("Hold steady (balanced)")
+    return actions
+
+
+def _optimize_sparse(forecast_kwh, demand_kwh, battery_capacity_kwh, initial_soc_kwh,
+                     charge_rate_max, discharge_rate_max, roundtrip_eff, objective, step_hours=1.0):
+    """Single-battery schedule through the sparse site optimizer, in this module's result format"""
+    from .site_optimizer import optimize_site_schedule
+    
+    battery = {
+        'capacity_kwh': battery_capacity_kwh,
+        'initial_soc_kwh': initial_soc_kwh,
+        'charge_rate_max': charge_rate_max,
+        'discharge_rate_max': discharge_rate_max,
+        'roundtrip_eff': roundtrip_eff,
+    }
+    res = optimize_site_schedule(forecast_kwh, demand_kwh, batteries=[battery], step_hours=step_hours,
+                                 objective=objective)
+    charge_vals = res['charge'][0].tolist()
+    discharge_vals = res['discharge'][0].tolist()
+    return {
+        'charge': charge_vals,
+        'discharge': discharge_vals,
+        'soc': res['soc'][0].tolist(),
+        'unmet_demand': res['unmet_demand'].tolist(),
+        'excess_energy': res['curtailed'].tolist(),
+        'actions': describe_actions(charge_vals, discharge_vals) if res['status'] == 'success'
+                   else ['Hold (optimization failed)'] * len(charge_vals),
+        'status': res['status']
+    }
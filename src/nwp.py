@@ -0,0 +1,203 @@
+"""
+Gridded weather-forecast (NWP) ingestion with vectorized spatial interpolation.
+
+A forecast run is a directory holding `grid.json` (latitude, longitude and
+valid-time axes plus the variable list) and one .npy array per variable
+shaped (time, lat, lon). The arrays are memory-mapped and only the
+window of grid rows and columns around the requested sites is read. Every
+site is interpolated bilinearly in one array operation per variable over all
+time steps. Each site's series is then interpolated in time onto its forecast
+steps and passed to forecast_hours as `exogenous` features.
+
+GRIB/netCDF runs are converted once with write_gridded_forecast.
+"""
+import os
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+
+log = logging.getLogger('amplifyai.nwp')
+
+MANIFEST = 'grid.json'
+VARIABLES = ('ghi', 'temp_c', 'cloud_pct')
+# Physical limits re-applied after interpolation
+BOUNDS = {'ghi': (0.0, None), 'cloud_pct': (0.0, 100.0)}
+
+
+def write_gridded_forecast(path, lat, lon, times, variables, issued=None):
+    """
+    Write a forecast run in the memory-mappable layout read by GriddedForecast.
+
+    Args:
+        path: Run directory (created if needed)
+        lat, lon: Grid axes in degrees, each monotonic
+        times: Valid times (UTC)
+        variables: Dict of name -> array shaped (time, lat, lon), e.g. ghi (W/m²), temp_c, cloud_pct
+        issued: Run issue time, used as the run's cache key (defaults to the first valid time)
+    """
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    times = pd.DatetimeIndex(times)
+    shape = (len(times), len(lat), len(lon))
+    issued = pd.Timestamp(issued if issued is not None else times[0])
+    os.makedirs(path, exist_ok=True)
+    # Arrays are named per run: files still mapped by readers of the previous run are never overwritten
+    specs = {}
+    for name, values in variables.items():
+        values = np.asarray(values, dtype=np.float32)
+        if values.shape != shape:
+            raise ValueError(f"{name} has shape {values.shape}, expected (time, lat, lon) = {shape}")
+        filename = f"{name}-{issued.strftime('%Y%m%dT%H%M%S')}.npy"
+        np.save(os.path.join(path, filename), values)
+        specs[name] = {'file': filename}
+    manifest = {
+        'issued': issued.isoformat(),
+        'lat': lat.tolist(),
+        'lon': lon.tolist(),
+        'times': [t.isoformat() for t in times],
+        'variables': specs,
+    }
+    # The manifest goes last, so readers never see a half-written run
+    tmp = os.path.join(path, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+    current = {spec['file'] for spec in specs.values()}
+    for filename in os.listdir(path):
+        if filename.endswith('.npy') and filename not in current:
+            os.remove(os.path.join(path, filename))
+
+
+def _axis_weights(axis, x):
+    """Lower grid index, weight of the upper neighbour and in-grid mask for points on a monotonic axis."""
+    ascending = axis[-1] >= axis[0]
+    a = axis if ascending else axis[::-1]
+    i = np.clip(np.searchsorted(a, x, side='right') - 1, 0, len(a) - 2)
+    w = (x - a[i]) / (a[i + 1] - a[i])
+    inside = (x >= a[0]) & (x <= a[-1])
+    if not ascending:
+        i, w = len(a) - 2 - i, 1.0 - w
+    return i, w, inside
+
+
+class GriddedForecast:
+    """One memory-mapped forecast run."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, MANIFEST), 'r') as f:
+            manifest = json.load(f)
+        self.path = path
+        self.issued = manifest.get('issued')
+        self.lat = np.asarray(manifest['lat'], dtype=float)
+        self.lon = np.asarray(manifest['lon'], dtype=float)
+        self.times = pd.DatetimeIndex(manifest['times'])
+        if len(self.lat) < 2 or len(self.lon) < 2:
+            raise ValueError("Gridded forecast needs at least two latitudes and longitudes")
+        shape = (len(self.times), len(self.lat), len(self.lon))
+        self.arrays = {}
+        for name, spec in manifest['variables'].items():
+            array = np.load(os.path.join(path, spec['file']), mmap_mode='r')
+            if array.shape != shape:
+                raise ValueError(f"{name} has shape {array.shape}, expected {shape}")
+            self.arrays[name] = array
+
+    @property
+    def key(self):
+        """Identifies the run, for cache keys downstream."""
+        return f'{os.path.abspath(self.path)}@{self.issued}'
+
+    def interpolate(self, lats, lons, variables=None, start=None, end=None):
+        """
+        Bilinearly interpolate many sites at once.
+
+        Args:
+            lats, lons: Site coordinates
+            variables: Variables to read (default: all in the run)
+            start, end: Valid-time range to read; the bracketing grid steps are included
+
+        Returns:
+            (times, values) where values maps variable -> (n_times, n_sites) array,
+            NaN for sites outside the grid
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        lons = np.atleast_1d(np.asarray(lons, dtype=float))
+        variables = [v for v in (variables or self.arrays) if v in self.arrays]
+        t0 = 0 if start is None else max(0, int(self.times.searchsorted(pd.Timestamp(start), 'right')) - 1)
+        t1 = len(self.times) if end is None else int(self.times.searchsorted(pd.Timestamp(end), 'left')) + 1
+        times = self.times[t0:t1]
+
+        iy, wy, inside_y = _axis_weights(self.lat, lats)
+        ix, wx, inside_x = _axis_weights(self.lon, lons)
+        inside = inside_y & inside_x
+        if not inside.any() or len(times) == 0:
+            return times, {v: np.full((len(times), len(lats)), np.nan) for v in variables}
+
+        # Only the block of grid cells around the sites is paged in from the memory maps
+        y0, y1 = iy[inside].min(), iy[inside].max() + 2
+        x0, x1 = ix[inside].min(), ix[inside].max() + 2
+        iy = np.clip(iy - y0, 0, y1 - y0 - 2)
+        ix = np.clip(ix - x0, 0, x1 - x0 - 2)
+        values = {}
+        with metrics.timer('nwp_interpolate'):
+            for name in variables:
+                block = np.asarray(self.arrays[name][t0:t1, y0:y1, x0:x1], dtype=float)
+                v = ((1 - wy) * (1 - wx) * block[:, iy, ix] + (1 - wy) * wx * block[:, iy, ix + 1]
+                     + wy * (1 - wx) * block[:, iy + 1, ix] + wy * wx * block[:, iy + 1, ix + 1])
+                v[:, ~inside] = np.nan
+                values[name] = v
+        return times, values
+
+    def site_exogenous(self, sites, variables=VARIABLES):
+        """
+        Per-site `exogenous` callables for forecast_hours, from one interpolation over all sites.
+
+        Args:
+            sites: Site dicts with site_id, lat, lon and optional tz_offset_hours
+                (grid times are UTC; site clocks default to local solar time, lon / 15)
+            variables: Variables to hand to the model
+
+        Returns:
+            dict of site_id -> callable(future DatetimeIndex) -> {variable: per-step array},
+            only for sites inside the grid
+        """
+        lats = [s['lat'] for s in sites]
+        lons = [s['lon'] for s in sites]
+        times, values = self.interpolate(lats, lons, variables)
+        out = {}
+        for i, site in enumerate(sites):
+            series = {name: v[:, i] for name, v in values.items() if np.isfinite(v[:, i]).any()}
+            if series:
+                tz = site.get('tz_offset_hours')
+                tz = site['lon'] / 15.0 if tz is None else tz
+                out[site['site_id']] = _SiteWeather(times + pd.Timedelta(hours=tz), series)
+        return out
+
+
+class _SiteWeather:
+    """One site's interpolated series on its local clock; NaN outside the run's valid times."""
+
+    def __init__(self, times, series):
+        self.t = times.as_unit('ns').asi8.astype(float)
+        self.series = series
+
+    def __call__(self, future):
+        f = pd.DatetimeIndex(future).as_unit('ns').asi8.astype(float)
+        out = {}
+        for name, y in self.series.items():
+            v = np.interp(f, self.t, y, left=np.nan, right=np.nan)
+            lo, hi = BOUNDS.get(name, (None, None))
+            out[name] = np.clip(v, lo, hi) if lo is not None or hi is not None else v
+        return out
+
+
+def open_gridded_forecast(path):
+    """Open a forecast run, or None (logged) when it is missing or unreadable."""
+    try:
+        return GriddedForecast(path)
+    except Exception as e:
+        log.warning(f"Could not open gridded forecast {path}: {e}")
+        metrics.count('nwp_open_errors_total')
+        return None
@@ -1,3 +1,5 @@
+import numpy as np
+
 def simple_battery_opt(predicted_kwh, expected_kwh, battery_capacity_kwh=100, soc_kwh=50, roundtrip_eff=0.9):
     deficit = expected_kwh - predicted_kwh
     
@@ -13,3 +15,76 @@ def simple_battery_opt(predicted_kwh, expected_kwh, battery_capacity_kwh=100, so
     
     else:
         return {'charge_kwh': 0.0, 'discharge_kwh': 0.0}
+
+def vectorized_dispatch(pv_kwh, demand_kwh, battery_capacity_kwh=100, soc_kwh=50, roundtrip_eff=0.9,
+                        charge_rate_max=None, discharge_rate_max=None, min_soc_kwh=0.0, step_hours=1.0,
+                        deadband_kwh=0.1):
+    """
+    Greedy charge/discharge rule of simple_battery_opt applied to sites × steps arrays.
+    
+    Steps are walked in order (SOC carries forward) while every operation is vectorized
+    across sites; 500 batteries over 8760 hourly steps take a fraction of a second.
+    
+    Args:
+        pv_kwh: PV energy per step, shape (S, T) or (T,) for one site
+        demand_kwh: Demand per step, broadcastable to pv_kwh
+        battery_capacity_kwh, soc_kwh, roundtrip_eff, min_soc_kwh: Scalars or per-site arrays (S,)
+        charge_rate_max, discharge_rate_max: kW limits, scalar or (S,); None means unlimited
+        step_hours: Step length in hours
+        deadband_kwh: Deficits/surpluses within this band are left alone
+    
+    Returns:
+        dict of (S, T) arrays 'charge' and 'discharge' (kWh at the battery terminals),
+        'soc' (kWh at the end of each step), 'unmet' and 'curtailed'; 1-D inputs give (T,) arrays
+    """
+    pv = np.asarray(pv_kwh, dtype=float)
+    single = pv.ndim == 1
+    pv = np.atleast_2d(pv)
+    demand = np.broadcast_to(np.asarray(demand_kwh, dtype=float), pv.shape)
+    S, T = pv.shape
+    
+    def per_site(value, default=np.inf):
+        return np.broadcast_to(np.asarray(default if value is None else value, dtype=float), (S,)).copy()
+    
+    cap = per_site(battery_capacity_kwh)
+    soc_min = per_site(min_soc_kwh)
+    eff = per_site(roundtrip_eff)
+    ch_max = per_site(charge_rate_max) * step_hours
+    dis_max = per_site(discharge_rate_max) * step_hours
+    soc = per_site(soc_kwh)
+    if np.any(soc < soc_min) or np.any(soc > cap):
+        raise ValueError("Initial SOC must lie between min_soc_kwh and battery_capacity_kwh")
+    
+    # Work in (T, S) layout so each step is a contiguous row. Rate limits are applied up
+    # front; charge is tracked as energy stored (eff * charge) so the loop is pure min/add.
+    net = np.subtract(demand.T, pv.T, order='C')
+    unmet = np.maximum(net, 0.0)
+    curtailed = np.subtract(unmet, net, out=net)
+    max_dis = np.where(unmet > deadband_kwh, unmet, 0.0)
+    np.minimum(max_dis, dis_max, out=max_dis)
+    max_stored = np.where(curtailed > deadband_kwh, curtailed, 0.0)
+    np.minimum(max_stored, ch_max, out=max_stored)
+    max_stored *= eff
+    
+    discharge = np.empty((T, S))
+    stored = np.empty((T, S))
+    level = np.empty((T, S))   # SOC above soc_min at the end of each step
+    span = cap - soc_min
+    room_ch = np.empty(S)
+    prev = soc - soc_min
+    for t in range(T):
+        np.subtract(span, prev, out=room_ch)
+        d = np.minimum(max_dis[t], prev, out=discharge[t])
+        c = np.minimum(max_stored[t], room_ch, out=stored[t])
+        prev = np.subtract(np.add(prev, c, out=level[t]), d, out=level[t])
+    
+    charge = np.divide(stored, eff, out=stored)
+    unmet -= discharge
+    curtailed -= charge
+    np.maximum(curtailed, 0.0, out=curtailed)  # rounding from stored / eff
+    level += soc_min
+    
+    out = {'charge': charge.T, 'discharge': discharge.T, 'soc': level.T, 'unmet': unmet.T, 'curtailed': curtailed.T}
+    if single:
+        out = {k: v[0] for k, v in out.items()}
+    return out
@@ -0,0 +1,438 @@
+"""Scheduled ingest → train → forecast → optimize pipeline with incremental recompute."""
+import os
+import time
+import pickle
+import hashlib
+import logging
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from .data_fetcher import fetch_nasa_power, fetch_nasa_power_many, load_sample_data
+from .modeling import train_simple_regressor, forecast_hours
+from .multi_hour_optimizer import optimize_battery_schedule
+from .db import insert_forecast, insert_schedule
+from .accuracy import record_actuals
+from .retention import run_retention
+from .demand import fit_demand_profiles, DemandProfiles, DEMAND_COLUMN
+from .nwp import open_gridded_forecast
+from .feature_store import FeatureStore, LAG_FEATURES
+from . import codec
+from . import metrics
+
+log = logging.getLogger('amplifyai.pipeline')
+
+FEATURES = ['hour', 'ghi', 'temp_c', 'cloud_pct']
+TARGET = 'output_kwh'
+STAGES = ('ingest', 'train', 'forecast', 'optimize')
+STATE_DIR = '.pipeline_state'
+MIN_LAGGED_ROWS = 10
+RETENTION_INTERVAL_S = 24 * 3600
+PV_LEVEL_TAU_H = 2.0   # a telemetry PV correction fades back to the model forecast with this time constant
+# Stage outputs kept in the state file as binary payloads: stage -> (encode, decode)
+PACKED_STAGES = {
+    'forecast': (codec.encode_forecast, codec.decode_forecast),
+    'optimize': (codec.encode_schedule, codec.decode_schedule),
+}
+
+DEFAULT_SITE = {
+    'site_id': 'default',
+    'lat': 15.3647,
+    'lon': 75.1234,
+    'source': 'sample',
+    'horizon_hours': 24,
+    'demand_kwh': 5.0,
+    'demand_shape': 'flat',
+    'battery_capacity_kwh': 50,
+    'initial_soc_kwh': 20,
+    'charge_rate_max': 10,
+    'discharge_rate_max': 10,
+    'roundtrip_eff': 0.9,
+    'objective': 'minimize_unmet',
+    'use_sensors': False,
+    'sensor_device': None,   # device id of this site's inverter in a multi-device (e.g. Modbus TCP) poll
+    'lag_features': False,
+}
+
+
+def _fingerprint(*parts):
+    """Stable short hash of stage inputs."""
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            h.update(pd.util.hash_pandas_object(part, index=False).values.tobytes())
+        else:
+            h.update(repr(part).encode('utf-8'))
+    return h.hexdigest()[:16]
+
+
+def load_sites(path):
+    """Load site definitions from a YAML file (top-level `sites:` list)."""
+    try:
+        with open(path, 'r') as f:
+            cfg = yaml.safe_load(f) or {}
+    except Exception as e:
+        log.warning(f"Could not load site config {path}: {e}")
+        return [dict(DEFAULT_SITE)]
+    sites = cfg.get('sites') or []
+    return [{**DEFAULT_SITE, **s} for s in sites] or [dict(DEFAULT_SITE)]
+
+
+def _load_dataset(site):
+    source = site.get('source', 'sample')
+    if source == 'nasa':
+        df = fetch_nasa_power(site['lat'], site['lon'])
+        if df is not None:
+            return df
+        log.info(f"[{site['site_id']}] NASA POWER unavailable, using sample data")
+        return load_sample_data()
+    if source == 'sample':
+        return load_sample_data()
+    return pd.read_csv(source)
+
+
+def _read_soc(site):
+    """Current battery SOC: live BMS reading if enabled, else the configured value."""
+    if site.get('use_sensors'):
+        try:
+            from .sensors.ingest import ingest_latest
+            bms = ingest_latest().get('bms') or {}
+            if bms.get('soc_kwh') is not None:
+                # Quantize so sensor noise alone does not invalidate the schedule
+                return round(float(bms['soc_kwh']), 1)
+        except Exception as e:
+            log.warning(f"[{site['site_id']}] BMS read failed: {e}")
+    return float(site['initial_soc_kwh'])
+
+
+def site_demand(site, forecast, history=None):
+    """
+    Per-step demand (kWh) for a site's forecast horizon.
+
+    An explicit `demand_kwh` list is used as is (kWh per step). Otherwise load history
+    (a `demand_kwh` column in `history`) is learned into a weekday/hour profile, and
+    without history the scalar `demand_kwh` (kWh per hour) follows `demand_shape`: flat
+    unless a site opts into 'residential'.
+    """
+    demand = site['demand_kwh']
+    if isinstance(demand, (list, tuple)):
+        return list(demand)
+    if history is not None and DEMAND_COLUMN in history.columns and history[DEMAND_COLUMN].notna().any():
+        profiles = fit_demand_profiles(history, site_col=None)
+    else:
+        profiles = DemandProfiles.typical([site['site_id']], float(demand), site.get('demand_shape', 'flat'))
+    return profiles.for_forecast(forecast)
+
+
+def _scale_pv(forecast, level):
+    """
+    Correct a forecast by the PV level telemetry reported at drift time: scaled by
+    the observed/forecast ratio at `level['ts']`, fading back to the model after.
+    """
+    if level is None:
+        return forecast
+    age_h = (pd.DatetimeIndex(forecast['timestamps']) - pd.Timestamp(level['ts'])) / pd.Timedelta(hours=1)
+    factor = 1.0 + (level['ratio'] - 1.0) * np.exp(-np.clip(age_h.to_numpy(dtype=float), 0, None) / PV_LEVEL_TAU_H)
+    return {**forecast, 'mean': (np.asarray(forecast['mean']) * factor).tolist(),
+            'std': (np.asarray(forecast['std']) * factor).tolist()}
+
+
+def _combine_exogenous(*sources):
+    """One exogenous callable from several; later sources override earlier ones."""
+    return lambda future: {k: v for source in sources for k, v in source(future).items()}
+
+
+class PipelineRunner:
+    """
+    Runs the forecasting pipeline for a set of sites on a schedule.
+
+    Each stage is keyed by a fingerprint of its inputs; a stage is only
+    recomputed when that fingerprint differs from the one persisted after the
+    previous tick. Sites are independent and run concurrently.
+    """
+
+    def __init__(self, sites, state_dir=STATE_DIR, max_workers=4, persist_db=True, history_size=100,
+                 metrics_path=None, retention_interval_s=RETENTION_INTERVAL_S, nwp_path=None, drift=None):
+        self.sites = [{**DEFAULT_SITE, **s} for s in sites]
+        self.state_dir = state_dir
+        self.max_workers = max_workers
+        self.persist_db = persist_db
+        self.history = deque(maxlen=history_size)
+        self.metrics_path = metrics_path
+        self.retention_interval_s = retention_interval_s
+        self._next_retention = 0.0
+        self._dirty = set()
+        self._reoptimize = set()
+        self.drift = drift
+        self._observed_soc = {}
+        self._pv_level = {}
+        self.nwp_path = nwp_path
+        self._weather = {}
+        self._weather_key = None
+        self.features = FeatureStore(os.path.join(state_dir, 'features'))
+        os.makedirs(state_dir, exist_ok=True)
+        self._state = {s['site_id']: self._load_state(s['site_id']) for s in self.sites}
+
+    def _state_path(self, site_id):
+        return os.path.join(self.state_dir, f'{site_id}.pkl')
+
+    def _load_state(self, site_id):
+        try:
+            with open(self._state_path(site_id), 'rb') as f:
+                state = pickle.load(f)
+            for stage, (_, decode) in PACKED_STAGES.items():
+                if stage in state and codec.is_encoded(state[stage]['output']):
+                    state[stage] = {**state[stage], 'output': decode(state[stage]['output'], as_lists=True)}
+            return state
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            log.warning(f"[{site_id}] Discarding unreadable pipeline state: {e}")
+            return {}
+
+    def _save_state(self, site_id):
+        path = self._state_path(site_id)
+        tmp = path + '.tmp'
+        state = dict(self._state[site_id])
+        for stage, (encode, _) in PACKED_STAGES.items():
+            if stage in state:
+                state[stage] = {**state[stage], 'output': encode(state[stage]['output'])}
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f)
+        os.replace(tmp, path)
+
+    def mark_dirty(self, site_id, stage='forecast'):
+        """Force a site to re-forecast and re-optimize (or, with stage='optimize', only re-optimize) on its next tick."""
+        (self._reoptimize if stage == 'optimize' else self._dirty).add(site_id)
+
+    def apply_drift(self, now=None):
+        """
+        Mark the sites released by the drift monitor dirty. SOC reported with an event
+        replaces the configured initial SOC of sites without a live BMS for the next
+        re-plan, and the PV level reported with a PV event corrects the re-forecast.
+
+        Returns the affected site ids.
+        """
+        if self.drift is None:
+            return []
+        site_ids = []
+        for event in self.drift.drain(now):
+            self.mark_dirty(event['site_id'], event['stage'])
+            if event.get('soc_kwh') is not None:
+                self._observed_soc[event['site_id']] = round(event['soc_kwh'], 1)
+            if event.get('pv_ratio') is not None:
+                self._pv_level[event['site_id']] = {'ratio': event['pv_ratio'], 'ts': event['ts']}
+            site_ids.append(event['site_id'])
+        return site_ids
+
+    def _poll_telemetry(self):
+        """
+        Feed the drift monitor one sensor poll for the sites reading live sensors.
+
+        When the inverter poll covers several devices its pv_power_kw is the fleet
+        total, so each site reads its own `sensor_device`; sites without a mapping
+        get no PV observation.
+        """
+        sensor_sites = [s for s in self.sites if s.get('use_sensors')]
+        if self.drift is None or not sensor_sites:
+            return
+        try:
+            from .sensors.ingest import ingest_latest
+            data = ingest_latest()
+        except Exception as e:
+            log.warning(f"Telemetry poll failed: {e}")
+            return
+        inverter, bms = data.get('inverter') or {}, data.get('bms') or {}
+        devices = inverter.get('devices')
+        for site in sensor_sites:
+            if devices is None:
+                pv = inverter.get('pv_power_kw')
+            else:
+                pv = (devices.get(site.get('sensor_device')) or {}).get('pv_power_kw')
+            self.drift.observe(site['site_id'], data['timestamp'], pv_power_kw=pv, soc_kwh=bms.get('soc_kwh'))
+
+    def _refresh_weather(self):
+        """Interpolate the current gridded weather run for every site in one pass, once per run."""
+        if not self.nwp_path:
+            return
+        grid = open_gridded_forecast(self.nwp_path)
+        if grid is None:
+            self._weather, self._weather_key = {}, None
+        elif grid.key != self._weather_key:
+            self._weather = grid.site_exogenous(self.sites)
+            self._weather_key = grid.key
+            log.info(f"Weather run {grid.issued}: {len(self._weather)}/{len(self.sites)} sites inside the grid")
+
+    def stage_output(self, site_id, stage):
+        entry = self._state.get(site_id, {}).get(stage)
+        return entry['output'] if entry else None
+
+    def _run_stage(self, state, name, key, fn, report):
+        entry = state.get(name)
+        if entry is not None and entry['key'] == key:
+            report['timings'][name] = 0.0
+            return entry['output']
+        t0 = time.perf_counter()
+        out = fn()
+        report['timings'][name] = time.perf_counter() - t0
+        metrics.observe('pipeline_stage_seconds', report['timings'][name], stage=name)
+        report['recomputed'].append(name)
+        state[name] = {'key': key, 'output': out, 'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        return out
+
+    def run_site(self, site):
+        """Run one tick for a single site and return its stage report."""
+        site_id = site['site_id']
+        state = self._state.setdefault(site_id, {})
+        report = {'site_id': site_id, 'timings': {}, 'recomputed': [], 'status': 'ok'}
+        t_start = time.perf_counter()
+
+        try:
+            # Ingest always polls its sources; downstream keys hang off its output
+            t0 = time.perf_counter()
+            df = _load_dataset(site)
+            soc = _read_soc(site)
+            # An observed SOC is a point-in-time reading: it seeds one re-plan, then the configured SOC applies
+            observed_soc = self._observed_soc.pop(site_id, None)
+            if not site.get('use_sensors') and observed_soc is not None:
+                soc = observed_soc
+            report['timings']['ingest'] = time.perf_counter() - t0
+            data_key = _fingerprint(df)
+            if state.get('ingest', {}).get('key') != data_key:
+                report['recomputed'].append('ingest')
+                if self.persist_db:
+                    # New realized output scores earlier forecasts for this site
+                    record_actuals(site['lat'], site['lon'], df)
+            state['ingest'] = {'key': data_key, 'output': df, 'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+            # Lag features are maintained incrementally: only rows newer than the store are appended
+            features, exogenous, train_df = FEATURES, None, df
+            if site['lag_features']:
+                self.features.append(site_id, df)
+                lagged = self.features.frame(site_id, LAG_FEATURES)
+                if len(lagged) >= MIN_LAGGED_ROWS:
+                    features = FEATURES + list(LAG_FEATURES)
+                    train_df = lagged
+                    exogenous = partial(self.features.forecast_features, site_id)
+                else:
+                    log.info(f"[{site_id}] {len(lagged)} rows with complete lag features; training on base features")
+            weather = self._weather.get(site_id)
+            if weather is not None:
+                exogenous = weather if exogenous is None else _combine_exogenous(exogenous, weather)
+
+            model, mse = self._run_stage(
+                state, 'train', _fingerprint('train', data_key, features),
+                lambda: train_simple_regressor(train_df, features, TARGET), report)
+
+            if site_id in self._dirty:
+                state['generation'] = state.get('generation', 0) + 1
+            # The model's inputs did not see what drifted; the telemetry's PV level corrects its output
+            if site_id in self._pv_level:
+                state['pv_level'] = self._pv_level.pop(site_id)
+            pv_level = state.get('pv_level')
+            forecast_key = _fingerprint('forecast', data_key, site['horizon_hours'], state.get('generation', 0),
+                                        *(() if weather is None else (self._weather_key,)),
+                                        *(() if pv_level is None else (pv_level,)))
+            forecast = self._run_stage(
+                state, 'forecast', forecast_key,
+                lambda: _scale_pv(forecast_hours(model, df, features, n_hours=site['horizon_hours'],
+                                                 location=(site['lat'], site['lon'], site.get('tz_offset_hours')),
+                                                 exogenous=exogenous), pv_level), report)
+            if 'forecast' in report['recomputed'] and self.persist_db:
+                insert_forecast(site['lat'], site['lon'], 'linear', forecast, mse)
+
+            step_h = forecast.get('step_minutes', 60.0) / 60.0
+            demand_kwh = site_demand(site, forecast, df)
+            battery = {k: site[k] for k in ('battery_capacity_kwh', 'charge_rate_max', 'discharge_rate_max', 'roundtrip_eff')}
+            if site_id in self._reoptimize:
+                state['optimize_generation'] = state.get('optimize_generation', 0) + 1
+            schedule = self._run_stage(
+                state, 'optimize',
+                _fingerprint('optimize', state['forecast']['key'], demand_kwh, soc, battery, site['objective'],
+                             *((state['optimize_generation'],) if state.get('optimize_generation') else ())),
+                lambda: optimize_battery_schedule(
+                    forecast['mean'], demand_kwh, initial_soc_kwh=soc, objective=site['objective'],
+                    step_hours=step_h, **battery),
+                report)
+            if 'optimize' in report['recomputed'] and self.persist_db:
+                summary = {'total_charge': sum(schedule['charge']), 'total_discharge': sum(schedule['discharge']),
+                           'final_soc': schedule['soc'][-1]}
+                insert_schedule(site['horizon_hours'], site['objective'], schedule, summary)
+
+            if self.drift is not None and ('optimize' in report['recomputed'] or not self.drift.has_plan(site_id)):
+                self.drift.set_plan(site_id, forecast, schedule, initial_soc_kwh=soc,
+                                    capacity_kwh=site['battery_capacity_kwh'])
+            self._dirty.discard(site_id)
+            self._reoptimize.discard(site_id)
+            self._save_state(site_id)
+        except Exception as e:
+            log.exception(f"[{site_id}] Pipeline tick failed: {e}")
+            report['status'] = 'failed'
+            report['error'] = str(e)
+            metrics.count('pipeline_site_errors_total')
+
+        report['total_s'] = time.perf_counter() - t_start
+        return report
+
+    def tick(self, site_ids=None):
+        """Run every site (or only `site_ids`) once, concurrently. Returns the per-site stage reports."""
+        t0 = time.perf_counter()
+        if site_ids is None:
+            sites = self.sites
+        else:
+            site_ids = set(site_ids)
+            sites = [s for s in self.sites if s['site_id'] in site_ids]
+        self._refresh_weather()
+        # One upstream request per NASA POWER grid cell, shared by every site inside it
+        nasa = [(s['lat'], s['lon']) for s in sites if s.get('source') == 'nasa']
+        if nasa:
+            fetch_nasa_power_many(nasa, max_workers=self.max_workers)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            reports = list(pool.map(self.run_site, sites))
+        cycle = {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'wall_s': time.perf_counter() - t0,
+            'stage_totals': {s: sum(r['timings'].get(s, 0.0) for r in reports) for s in STAGES},
+            'sites': reports,
+        }
+        self.history.append(cycle)
+        if self.persist_db and self.retention_interval_s and time.monotonic() >= self._next_retention:
+            self._next_retention = time.monotonic() + self.retention_interval_s
+            # Never the one-time full VACUUM here: it holds an exclusive lock; `--retention` does it
+            cycle['retention'] = run_retention(convert_vacuum=False)
+        if self.metrics_path and metrics.is_enabled():
+            try:
+                metrics.write_metrics(self.metrics_path)
+            except OSError as e:
+                log.warning(f"Could not write metrics to {self.metrics_path}: {e}")
+        log.info('Pipeline tick: ' + ', '.join(f"{s}={v:.3f}s" for s, v in cycle['stage_totals'].items())
+                 + f" (wall {cycle['wall_s']:.3f}s, {len(reports)} sites)")
+        return cycle
+
+    def run_forever(self, interval_s=900, max_ticks=None, poll_s=None):
+        """
+        Tick every `interval_s` seconds until interrupted or `max_ticks` is reached.
+
+        With a drift monitor and `poll_s`, telemetry is checked every `poll_s` seconds
+        between ticks and only the sites that drifted are re-run straight away.
+        """
+        ticks = 0
+        while max_ticks is None or ticks < max_ticks:
+            started = time.monotonic()
+            self.tick()
+            ticks += 1
+            if max_ticks is not None and ticks >= max_ticks:
+                break
+            next_tick = started + interval_s
+            while self.drift is not None and poll_s and time.monotonic() + poll_s < next_tick:
+                time.sleep(poll_s)
+                self._poll_telemetry()
+                drifted = self.apply_drift()
+                if drifted:
+                    log.info(f"Telemetry drift: re-running {len(drifted)} site(s)")
+                    self.tick(drifted)
+            time.sleep(max(0.0, next_tick - time.monotonic()))
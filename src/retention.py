@@ -0,0 +1,326 @@
+"""
+History retention, rollup and compaction for amplifyai.db.
+
+Forecast and schedule runs are kept at full resolution for `keep_days`.
+Older rows are folded into per-day aggregates (`forecast_rollup`,
+`schedule_rollup`) and deleted. Daily aggregates older than `daily_days` are
+folded again into ISO weeks, which are kept indefinitely.
+
+Aggregates are additive running sums, written with UPSERT like
+`forecast_accuracy` (runs, Σmse, min/max mse, Σforecast kWh and the error
+sums of matched steps), so re-running the job or rolling a period in several
+batches gives the same totals.
+
+Rows are moved in small batches. Each batch is one short BEGIN IMMEDIATE
+transaction that reads, aggregates and deletes its rows, so the app and the
+pipeline can keep writing in between. Freed pages are then returned to the
+filesystem with `PRAGMA incremental_vacuum`, a few pages at a time. Databases
+created before auto_vacuum was enabled get one full VACUUM, which runs after
+the bulk of the rows is gone.
+"""
+import json
+import time
+import sqlite3
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from . import db
+from . import metrics
+
+log = logging.getLogger('amplifyai.retention')
+
+RAW_RETENTION_DAYS = 30
+DAILY_RETENTION_DAYS = 365
+BATCH_SIZE = 500
+BATCH_PAUSE_S = 0.01
+VACUUM_PAGES = 256
+LOCATION_DECIMALS = 4
+
+AUTO_VACUUM_NONE = 0
+AUTO_VACUUM_INCREMENTAL = 2
+
+FORECAST_KEYS = ('period', 'period_start', 'model_used', 'location_lat', 'location_lon')
+FORECAST_SUMS = ('runs', 'mse_n', 'sum_mse', 'steps', 'sum_forecast_kwh',
+                 'matched_steps', 'sum_err', 'sum_abs_err', 'sum_sq_err')
+SCHEDULE_KEYS = ('period', 'period_start', 'objective')
+SCHEDULE_SUMS = ('runs', 'sum_horizon', 'sum_charge', 'sum_discharge', 'sum_final_soc')
+MSE_BOUNDS = ('min_mse', 'max_mse')
+
+
+def _upsert_sql(table, keys, sums, bounds=()):
+    """INSERT ... ON CONFLICT that adds `sums` and widens min_*/max_* `bounds`."""
+    columns = keys + sums + bounds + ('updated_at',)
+    updates = [f'{c} = {c} + excluded.{c}' for c in sums]
+    for c in bounds:
+        fn = 'MIN' if c.startswith('min_') else 'MAX'
+        # scalar MIN/MAX return NULL if either side is NULL
+        updates.append(f'{c} = {fn}(COALESCE({c}, excluded.{c}), COALESCE(excluded.{c}, {c}))')
+    updates.append('updated_at = excluded.updated_at')
+    return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(updates)}")
+
+
+def _weekly_sql(table, keys, sums, bounds=()):
+    """Fold 'day' rows older than a cutoff into their ISO week (Monday start)."""
+    group = keys[2:]
+    select = (["'week'", "date(period_start, 'weekday 0', '-6 days')"] + list(group)
+              + [f'SUM({c})' for c in sums] + [f"{'MIN' if c.startswith('min_') else 'MAX'}({c})" for c in bounds]
+              + ['?'])
+    insert = _upsert_sql(table, keys, sums, bounds)
+    head, tail = insert.split(' VALUES ')
+    return (f"{head} SELECT {', '.join(select)} FROM {table} WHERE period = 'day' AND period_start < ? "
+            f"GROUP BY {', '.join(str(i) for i in range(2, len(keys) + 1))} "
+            + tail[tail.index('ON CONFLICT'):])
+
+
+FORECAST_UPSERT = _upsert_sql('forecast_rollup', FORECAST_KEYS, FORECAST_SUMS, MSE_BOUNDS)
+SCHEDULE_UPSERT = _upsert_sql('schedule_rollup', SCHEDULE_KEYS, SCHEDULE_SUMS)
+FORECAST_WEEKLY = _weekly_sql('forecast_rollup', FORECAST_KEYS, FORECAST_SUMS, MSE_BOUNDS)
+SCHEDULE_WEEKLY = _weekly_sql('schedule_rollup', SCHEDULE_KEYS, SCHEDULE_SUMS)
+
+
+def _forecast_rollup_rows(rows, now):
+    """Per-(day, model, location) upsert parameters for a batch of forecast_history rows."""
+    groups = {}
+    for _, created_at, model, lat, lon, mse, payload, forecast_json, actual_json in rows:
+        key = ('day', created_at[:10], model or '',
+               round(lat or 0.0, LOCATION_DECIMALS), round(lon or 0.0, LOCATION_DECIMALS))
+        acc = groups.setdefault(key, {c: 0 for c in FORECAST_SUMS} | {'min_mse': None, 'max_mse': None})
+        acc['runs'] += 1
+        if mse is not None:
+            acc['mse_n'] += 1
+            acc['sum_mse'] += mse
+            acc['min_mse'] = mse if acc['min_mse'] is None else min(acc['min_mse'], mse)
+            acc['max_mse'] = mse if acc['max_mse'] is None else max(acc['max_mse'], mse)
+        try:
+            mean = np.asarray(db.decode_forecast_row(payload, forecast_json).get('mean', []), dtype=float)
+        except Exception as e:
+            log.warning(f"Rolling up an undecodable forecast from {created_at}: {e}")
+            mean = np.empty(0)
+        acc['steps'] += len(mean)
+        acc['sum_forecast_kwh'] += float(mean.sum())
+        if actual_json:
+            actual = np.array([np.nan if a is None else a for a in json.loads(actual_json)], dtype=float)[:len(mean)]
+            err = mean[:len(actual)] - actual
+            err = err[np.isfinite(err)]
+            acc['matched_steps'] += len(err)
+            acc['sum_err'] += float(err.sum())
+            acc['sum_abs_err'] += float(np.abs(err).sum())
+            acc['sum_sq_err'] += float((err ** 2).sum())
+    return [(*key, *(acc[c] for c in FORECAST_SUMS + MSE_BOUNDS), now) for key, acc in groups.items()]
+
+
+def _schedule_rollup_rows(rows, now):
+    """Per-(day, objective) upsert parameters for a batch of battery_schedule_history rows."""
+    groups = {}
+    for _, created_at, horizon, objective, summary_json in rows:
+        summary = json.loads(summary_json) if summary_json else {}
+        acc = groups.setdefault(('day', created_at[:10], objective or ''), [0, 0, 0.0, 0.0, 0.0])
+        acc[0] += 1
+        acc[1] += horizon or 0
+        acc[2] += summary.get('total_charge') or 0.0
+        acc[3] += summary.get('total_discharge') or 0.0
+        acc[4] += summary.get('final_soc') or 0.0
+    return [(*key, *acc, now) for key, acc in groups.items()]
+
+
+TABLES = {
+    # table -> (batch query, upsert, rollup rows builder)
+    'forecast_history': ('''SELECT id, created_at, model_used, location_lat, location_lon, mse,
+                                   payload, forecast_json, actual_json
+                            FROM forecast_history WHERE created_at < ? ORDER BY created_at LIMIT ?''',
+                         FORECAST_UPSERT, _forecast_rollup_rows),
+    'battery_schedule_history': ('''SELECT id, created_at, horizon_hours, objective, summary_json
+                                    FROM battery_schedule_history WHERE created_at < ? ORDER BY created_at LIMIT ?''',
+                                 SCHEDULE_UPSERT, _schedule_rollup_rows),
+}
+
+
+def _in_transaction(conn, fn):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        result = fn()
+        conn.execute('COMMIT')
+        return result
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def _roll_up_table(conn, table, cutoff, batch_size, pause_s):
+    """Move rows older than `cutoff` into the daily rollup, one short transaction per batch."""
+    query, upsert, build = TABLES[table]
+
+    def batch():
+        rows = conn.execute(query, (cutoff, batch_size)).fetchall()
+        if rows:
+            conn.executemany(upsert, build(rows, datetime.now().isoformat()))
+            conn.execute(f"DELETE FROM {table} WHERE id IN ({', '.join('?' * len(rows))})", [r[0] for r in rows])
+        return len(rows)
+
+    moved = 0
+    while True:
+        n = _in_transaction(conn, batch)
+        moved += n
+        if n < batch_size:
+            break
+        time.sleep(pause_s)
+    if moved:
+        metrics.count('retention_rows_rolled_up_total', moved, table=table)
+    return moved
+
+
+def _fold_weeks(conn, cutoff_day):
+    """Fold daily rollups before `cutoff_day` into weekly ones; returns the daily rows removed."""
+    def fold():
+        now = datetime.now().isoformat()
+        removed = 0
+        for table, sql in (('forecast_rollup', FORECAST_WEEKLY), ('schedule_rollup', SCHEDULE_WEEKLY)):
+            conn.execute(sql, (now, cutoff_day))
+            removed += conn.execute(f"DELETE FROM {table} WHERE period = 'day' AND period_start < ?",
+                                    (cutoff_day,)).rowcount
+        return removed
+    return _in_transaction(conn, fold)
+
+
+def _reclaim(conn, vacuum_pages, pause_s, convert, db_path):
+    """Return free pages to the filesystem; returns the number of pages released."""
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if not free:
+        return 0
+    mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    if mode == AUTO_VACUUM_NONE:
+        if not convert:
+            log.info(f"{free} free pages in {db_path} stay allocated until `main.py --retention` "
+                     "enables incremental auto_vacuum")
+            return 0
+        # One-off switch for databases created before auto_vacuum was set; rewrites only live pages
+        log.info(f"Enabling incremental auto_vacuum on {db_path} (one-time VACUUM)")
+        conn.execute(f'PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}')
+        conn.execute('VACUUM')
+        return free
+    if mode != AUTO_VACUUM_INCREMENTAL:
+        return 0  # FULL mode already truncates on every commit
+    released = 0
+    while free:
+        step = min(free, vacuum_pages)
+        # executescript steps the pragma to completion; execute() frees a single page per call
+        conn.executescript(f'PRAGMA incremental_vacuum({step});')
+        released += step
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if free:
+            time.sleep(pause_s)
+    return released
+
+
+@metrics.timed('db', op='retention')
+def run_retention(keep_days=RAW_RETENTION_DAYS, daily_days=DAILY_RETENTION_DAYS, batch_size=BATCH_SIZE,
+                  pause_s=BATCH_PAUSE_S, vacuum_pages=VACUUM_PAGES, convert_vacuum=True, now=None, db_path=None):
+    """
+    Apply the retention policy to the history tables.
+
+    Args:
+        keep_days: Full-resolution history window
+        daily_days: Age beyond which daily rollups are folded into weekly ones
+        batch_size: Rows moved per write transaction
+        pause_s: Sleep between batches and vacuum steps so other writers get the lock
+        vacuum_pages: Pages released per incremental_vacuum step
+        convert_vacuum: Allow the one-time VACUUM that enables incremental auto_vacuum
+        now: Reference time (defaults to the current local time, like created_at)
+        db_path: Database file (default `db.DB_PATH`)
+
+    Returns:
+        dict with rows rolled up per table, 'daily_folded', 'pages_released', 'seconds'
+        and 'error' (None on success)
+    """
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=keep_days)).isoformat()
+    cutoff_day = (now - timedelta(days=daily_days)).date().isoformat()
+    report = {'forecast_history': 0, 'battery_schedule_history': 0, 'daily_folded': 0,
+              'pages_released': 0, 'seconds': 0.0, 'error': None}
+    t0 = time.perf_counter()
+    try:
+        db_path = db_path or db.DB_PATH
+        db.init_db(db_path)
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        try:
+            for table in TABLES:
+                report[table] = _roll_up_table(conn, table, cutoff, batch_size, pause_s)
+            report['daily_folded'] = _fold_weeks(conn, cutoff_day)
+            report['pages_released'] = _reclaim(conn, vacuum_pages, pause_s, convert_vacuum, db_path)
+        finally:
+            conn.close()
+    except Exception as e:
+        db._record_error('retention', e)
+        report['error'] = str(e)
+    report['seconds'] = time.perf_counter() - t0
+    log.info(f"Retention: rolled up {report['forecast_history']} forecasts and "
+             f"{report['battery_schedule_history']} schedules, folded {report['daily_folded']} daily rows, "
+             f"released {report['pages_released']} pages in {report['seconds']:.2f}s")
+    return report
+
+
+@metrics.timed('db', op='load_forecast_rollups')
+def load_forecast_rollups(period='day', model=None, since=None, db_path=None):
+    """
+    Aggregated forecast history for one period ('day' or 'week'), oldest first.
+
+    Returns:
+        list of dicts with 'period_start', 'model', 'lat', 'lon', 'runs', 'avg_mse',
+        'min_mse', 'max_mse', 'forecast_kwh', 'matched_steps', 'mae', 'rmse' and 'bias'
+        (error stats are None when no step was matched); reads `db_path` (default `db.DB_PATH`)
+    """
+    where, params = ['period = ?'], [period]
+    if model is not None:
+        where.append('model_used = ?')
+        params.append(model)
+    if since is not None:
+        where.append('period_start >= ?')
+        params.append(since)
+    try:
+        db_path = db_path or db.DB_PATH
+        db.init_db(db_path)
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute(f'''SELECT period_start, model_used, location_lat, location_lon, runs, mse_n, sum_mse,
+                                       min_mse, max_mse, sum_forecast_kwh, matched_steps, sum_err, sum_abs_err, sum_sq_err
+                                FROM forecast_rollup WHERE {' AND '.join(where)}
+                                ORDER BY period_start, model_used''', params).fetchall()
+        conn.close()
+    except Exception as e:
+        db._record_error('load_forecast_rollups', e)
+        return []
+    out = []
+    for start, model_used, lat, lon, runs, mse_n, sum_mse, min_mse, max_mse, kwh, n, s_err, s_abs, s_sq in rows:
+        out.append({
+            'period_start': start, 'model': model_used, 'lat': lat, 'lon': lon, 'runs': runs,
+            'avg_mse': sum_mse / mse_n if mse_n else None, 'min_mse': min_mse, 'max_mse': max_mse,
+            'forecast_kwh': kwh, 'matched_steps': n,
+            'mae': s_abs / n if n else None,
+            'rmse': float(np.sqrt(s_sq / n)) if n else None,
+            'bias': s_err / n if n else None,
+        })
+    return out
+
+
+@metrics.timed('db', op='load_schedule_rollups')
+def load_schedule_rollups(period='day', objective=None, db_path=None):
+    """Aggregated schedule history for one period: runs and total charge/discharge per objective (default `db.DB_PATH`)."""
+    where, params = ['period = ?'], [period]
+    if objective is not None:
+        where.append('objective = ?')
+        params.append(objective)
+    try:
+        db_path = db_path or db.DB_PATH
+        db.init_db(db_path)
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute(f'''SELECT period_start, objective, runs, sum_horizon, sum_charge, sum_discharge, sum_final_soc
+                                FROM schedule_rollup WHERE {' AND '.join(where)}
+                                ORDER BY period_start, objective''', params).fetchall()
+        conn.close()
+    except Exception as e:
+        db._record_error('load_schedule_rollups', e)
+        return []
+    return [{'period_start': r[0], 'objective': r[1], 'runs': r[2], 'avg_horizon': r[3] / r[2],
+             'total_charge': r[4], 'total_discharge': r[5], 'avg_final_soc': r[6] / r[2]} for r in rows]
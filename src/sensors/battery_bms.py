@@ -1,6 +1,15 @@
+import os
+import tty
 import time
+import struct
 import logging
 import random
+import binascii
+import termios
+import selectors
+import threading
+
+from .. import metrics
 
 log = logging.getLogger('amplifyai.sensors.bms')
 
@@ -16,19 +25,251 @@ def read_bms_mock():
         'source': 'mock_bms'
     }
 
-def read_bms_serial(port: str = '/dev/ttyUSB0', baudrate: int = 9600):
-    """Read BMS data from serial connection."""
+# Serial frame format (little-endian):
+#   sync b'\xaa\x55' | type u8 | payload length u8 | payload | CRC-16/CCITT-FALSE u16 over type..payload
+# Telemetry payload (FRAME_TELEMETRY): uptime ms u32, SOC Wh u32, pack mV u16, current cA i16,
+#   temperature 0.1 degC i16, min cell mV u16, max cell mV u16
+SYNC = b'\xaa\x55'
+FRAME_HEADER = struct.Struct('<2sBB')
+FRAME_CRC = struct.Struct('<H')
+FRAME_TELEMETRY = 0x01
+TELEMETRY = struct.Struct('<IIHhhHH')
+MAX_PAYLOAD = 64
+BUFFER_SIZE = 4096
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+def _crc(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+def encode_telemetry_frame(soc_kwh, voltage, current, temp_c, cell_min_v=None, cell_max_v=None, uptime_ms=0):
+    """Build one telemetry frame (used by the simulator and tests)."""
+    payload = TELEMETRY.pack(
+        uptime_ms & 0xFFFFFFFF, round(soc_kwh * 1000), round(voltage * 1000), round(current * 100),
+        round(temp_c * 10), round((cell_min_v or 0) * 1000), round((cell_max_v or 0) * 1000))
+    body = FRAME_HEADER.pack(SYNC, FRAME_TELEMETRY, len(payload))[2:] + payload
+    return SYNC + body + FRAME_CRC.pack(_crc(body))
+
+
+class BmsFrameParser:
+    """
+    Incremental parser for the BMS serial frame format.
+
+    Bytes land in one preallocated buffer (directly from the fd with os.readv,
+    or copied in by `feed`) and frames are decoded in place through a memoryview
+    with struct.unpack_from. On a bad CRC, an oversized length or an unknown sync
+    the parser skips a single byte and searches for the next sync marker, so one
+    corrupt frame never costs more than itself.
+    """
+
+    def __init__(self, buffer_size=BUFFER_SIZE, source='serial_bms'):
+        self.buf = bytearray(buffer_size)
+        self.view = memoryview(self.buf)
+        self.end = 0
+        self.source = source
+        self.frames = 0
+        self.errors = 0
+        self.skipped_bytes = 0
+
+    def read_from(self, fd):
+        """Read whatever the (non-blocking) fd has into the free tail of the buffer; returns bytes read."""
+        if self.end == len(self.buf):
+            self._discard(len(self.buf) // 2)  # buffer full of garbage: drop the older half
+        try:
+            n = os.readv(fd, [self.view[self.end:]])
+        except (BlockingIOError, InterruptedError):
+            return 0
+        self.end += n
+        return n
+
+    def feed(self, data):
+        """Append bytes, parsing as needed to make room; returns the decoded readings."""
+        readings = []
+        data = memoryview(data)
+        while len(data):
+            if self.end == len(self.buf):
+                self._discard(len(self.buf) // 2)
+            n = min(len(data), len(self.buf) - self.end)
+            self.view[self.end:self.end + n] = data[:n]
+            self.end += n
+            data = data[n:]
+            readings.extend(self.parse())
+        return readings
+
+    def _discard(self, n):
+        self.buf[:self.end - n] = self.view[n:self.end]
+        self.end -= n
+        self.skipped_bytes += n
+
+    def parse(self):
+        """Decode every complete frame in the buffer and compact the remainder to the front."""
+        readings = []
+        buf, view, pos, end = self.buf, self.view, 0, self.end
+        while True:
+            start = buf.find(SYNC, pos, end)
+            if start < 0:
+                # Keep a trailing first sync byte, it may start the next frame
+                keep = end - 1 if end > pos and buf[end - 1] == SYNC[0] else end
+                self.skipped_bytes += keep - pos
+                pos = keep
+                break
+            self.skipped_bytes += start - pos
+            if end - start < FRAME_HEADER.size:
+                pos = start
+                break
+            _, ftype, length = FRAME_HEADER.unpack_from(buf, start)
+            if length > MAX_PAYLOAD:
+                pos = self._bad_frame(start)
+                continue
+            frame_end = start + FRAME_HEADER.size + length + FRAME_CRC.size
+            if frame_end > end:
+                pos = start
+                break
+            crc_at = frame_end - FRAME_CRC.size
+            if _crc(view[start + 2:crc_at]) != FRAME_CRC.unpack_from(buf, crc_at)[0]:
+                pos = self._bad_frame(start)
+                continue
+            if ftype == FRAME_TELEMETRY and length == TELEMETRY.size:
+                readings.append(self._telemetry(buf, start + FRAME_HEADER.size))
+            self.frames += 1
+            pos = frame_end
+        if pos:
+            buf[:end - pos] = view[pos:end]
+            self.end = end - pos
+        if readings:
+            metrics.count('bms_frames_total', len(readings), source=self.source)
+        return readings
+
+    def _bad_frame(self, start):
+        """Count a corrupt frame and resume the sync search one byte past its start"""
+        self.errors += 1
+        self.skipped_bytes += 1
+        metrics.count('bms_frame_errors_total', source=self.source)
+        return start + 1
+
+    def _telemetry(self, buf, offset):
+        uptime, soc_wh, mv, ca, dc, cell_min, cell_max = TELEMETRY.unpack_from(buf, offset)
+        return {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'soc_kwh': soc_wh / 1000.0,
+            'voltage': mv / 1000.0,
+            'current': ca / 100.0,
+            'temp_c': dc / 10.0,
+            'cell_min_v': cell_min / 1000.0,
+            'cell_max_v': cell_max / 1000.0,
+            'uptime_ms': uptime,
+            'source': self.source,
+        }
+
+
+class SerialBmsReader:
+    """
+    Non-blocking reader for a serial (or pty) BMS port.
+
+    The port is opened O_NONBLOCK in raw mode and read straight into the
+    parser's buffer whenever a selector reports it readable. Decoded readings
+    go to `on_reading` (if given) as they arrive and the newest is kept in `latest`.
+    Polls are serialized by a per-reader lock, so one reader can be shared across threads.
+    """
+
+    def __init__(self, port: str = '/dev/ttyUSB0', baudrate: int = 9600, on_reading=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.on_reading = on_reading
+        self.parser = BmsFrameParser()
+        self.latest = None
+        self.fd = None
+        self._selector = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        self.fd = os.open(self.port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            tty.setraw(self.fd, termios.TCSANOW)  # not TCSAFLUSH: keep bytes already received
+            attrs = termios.tcgetattr(self.fd)
+            speed = getattr(termios, f'B{self.baudrate}', None)
+            if speed is not None:
+                attrs[4] = attrs[5] = speed
+                termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
+        except termios.error as e:
+            log.debug(f"Could not configure {self.port} as a terminal: {e}")
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.fd, selectors.EVENT_READ)
+        return self
+
+    def close(self):
+        with self._lock:
+            if self._selector is not None:
+                self._selector.close()
+                self._selector = None
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def poll(self, timeout=0.0):
+        """Wait up to `timeout` seconds for data, drain the port and return the decoded readings."""
+        readings = []
+        with self._lock:
+            if not self._selector.select(timeout):
+                return readings
+            while self.parser.read_from(self.fd):
+                readings.extend(self.parser.parse())
+            if readings:
+                self.latest = readings[-1]
+        if readings and self.on_reading is not None:
+            for reading in readings:
+                self.on_reading(reading)
+        return readings
+
+    def run(self, stop_event, timeout=0.5):
+        """Publish readings until `stop_event` is set."""
+        while not stop_event.is_set():
+            self.poll(timeout)
+
+
+def _serial_port(connection):
+    return connection.split(':', 1)[1] if connection.startswith('serial:') else connection
+
+def read_bms_serial(port: str = '/dev/ttyUSB0', baudrate: int = 9600, timeout: float = 1.0):
+    """
+    Read BMS data from serial connection.
+
+    The port stays open between calls (one reader per port); each call drains
+    what has arrived since the last one and returns the newest reading, waiting
+    up to `timeout` seconds for a first frame.
+    """
+    port = _serial_port(port or '/dev/ttyUSB0')
     try:
-        import serial
-        log.info(f"Serial BMS implementation not yet complete for {port}")
-        return None
-    except ImportError:
-        log.warning("pyserial not installed")
-        return None
+        with _readers_lock:
+            reader = _readers.get(port)
+            if reader is None:
+                reader = _readers[port] = SerialBmsReader(port, baudrate).open()
+        deadline = time.monotonic() + timeout
+        reader.poll(0.0)
+        while reader.latest is None and time.monotonic() < deadline:
+            reader.poll(max(0.0, deadline - time.monotonic()))
+        return reader.latest
     except Exception as e:
         log.warning(f"Serial BMS error: {e}")
+        close_bms_serial(port)
         return None
 
+def close_bms_serial(port: str = None):
+    """Close the cached serial reader for `port` (all ports by default)."""
+    with _readers_lock:
+        ports = [_serial_port(port)] if port else list(_readers)
+        for p in ports:
+            reader = _readers.pop(p, None)
+            if reader is not None:
+                reader.close()
+
 def read_bms_can(interface: str = 'can0'):
     """Read BMS data from CAN bus."""
     log.info("CAN bus BMS implementation not yet complete")
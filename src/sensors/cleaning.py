@@ -0,0 +1,370 @@
+"""
+Streaming validation, de-duplication and gap filling for sensor telemetry.
+
+Each sensor stream (one numeric field of one device/site) is cleaned by a
+SensorCleaner holding a fixed-size state: last timestamp and value, and an
+exponentially weighted running mean/variance. Readings are processed one at
+a time (`push`, for live polls and MQTT) or as vectorized chunks (`process`,
+for high-rate telemetry and historical backfills), with the same state
+carried across calls (chunks judge spikes against statistics of the
+unclipped chunk, so the two modes can differ right after a spike):
+
+- timestamps at or before the last accepted one are dropped as duplicates
+- values outside the field's physical range are rejected
+- spikes (more than `z_threshold` running standard deviations and
+  `min_deviation` away from the running mean) are rejected; they enter the
+  running statistics clipped to the threshold, so an isolated spike barely
+  moves them while a genuine level shift widens the band and is accepted
+  within a few readings
+- gaps up to `max_fill_s` are filled on the expected step grid (linear
+  interpolation or forward fill); longer gaps are reported as outages
+"""
+import math
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from .. import metrics
+
+log = logging.getLogger('amplifyai.sensors.cleaning')
+
+FLAG_OK = 0
+FLAG_FILLED = 1
+
+# Physical limits per field: (min, max), None for unbounded
+FIELD_LIMITS = {
+    'pv_power_kw': (0.0, 5000.0),
+    'pv_voltage': (0.0, 1500.0),
+    'pv_current': (0.0, 1000.0),
+    'ac_power_kw': (-5000.0, 5000.0),
+    'grid_frequency': (40.0, 70.0),
+    'soc_kwh': (0.0, None),
+    'voltage': (0.0, 1000.0),
+    'current': (-2000.0, 2000.0),
+    'temp_c': (-40.0, 100.0),
+    'cell_min_v': (0.0, 5.0),
+    'cell_max_v': (0.0, 5.0),
+}
+
+NS = 1_000_000_000
+
+
+def _to_ns(timestamps):
+    """int64 ns from int64 ns or datetime64 arrays/Series (no parsing) or anything pd.to_datetime takes"""
+    arr = np.asarray(timestamps)
+    if arr.dtype == np.int64:
+        return arr
+    if arr.dtype.kind != 'M':
+        arr = pd.to_datetime(timestamps).to_numpy(dtype='datetime64[ns]')
+    return arr.astype('datetime64[ns]').astype(np.int64)
+
+
+class SensorCleaner:
+    """
+    O(1)-state cleaner for one numeric sensor stream.
+
+    Args:
+        lo, hi: Valid value range (None for unbounded)
+        z_threshold: Spike threshold in running standard deviations
+        min_deviation: Deviations below this absolute size are never spikes
+        alpha: Weight of the newest value in the running mean/variance
+        warmup: Accepted values needed before spike rejection starts
+        step_s: Expected sampling interval; inferred from the first chunk when None
+        max_fill_s: Longest gap that is filled; longer gaps are outages
+        method: 'linear' (interpolate) or 'ffill' (repeat last value) for filled steps
+    """
+
+    def __init__(self, lo=None, hi=None, z_threshold=6.0, min_deviation=0.0, alpha=0.05, warmup=10,
+                 step_s=None, max_fill_s=300.0, method='linear'):
+        if method not in ('linear', 'ffill'):
+            raise ValueError(f"Unknown fill method: {method}")
+        self.lo = -math.inf if lo is None else lo
+        self.hi = math.inf if hi is None else hi
+        self.z_threshold = z_threshold
+        self.min_deviation = min_deviation
+        self.alpha = alpha
+        self.warmup = warmup
+        self.step_ns = None if step_s is None else int(step_s * NS)
+        self.max_fill_ns = int(max_fill_s * NS)
+        self.method = method
+        self.last_ts = None     # int64 ns
+        self.last_value = None
+        self.mean = 0.0
+        self.var = 0.0
+        self.n = 0
+        self.counts = {'accepted': 0, 'duplicate': 0, 'out_of_range': 0, 'spike': 0, 'filled': 0, 'outages': 0}
+
+    def _is_spike(self, value):
+        if self.n < self.warmup:
+            return False
+        dev = abs(value - self.mean)
+        return dev > self.min_deviation and dev > self.z_threshold * math.sqrt(self.var)
+
+    def _update(self, value):
+        if self.n == 0:
+            self.mean, self.var = value, 0.0
+        else:
+            dev = value - self.mean
+            if self.n >= self.warmup:
+                band = max(self.z_threshold * math.sqrt(self.var), self.min_deviation)
+                dev = min(max(dev, -band), band)
+            self.mean += self.alpha * dev
+            self.var = (1 - self.alpha) * (self.var + self.alpha * dev * dev)
+        self.n += 1
+
+    def push(self, ts, value):
+        """
+        Check one reading (timestamp anything pd.Timestamp accepts).
+
+        Returns 'ok', 'duplicate', 'missing', 'out_of_range', 'spike' or 'outage' (accepted, but
+        after a gap longer than max_fill_s). Only 'ok' and 'outage' readings become the last value.
+        """
+        ts = pd.Timestamp(ts).value
+        if self.last_ts is not None and ts <= self.last_ts:
+            self.counts['duplicate'] += 1
+            return 'duplicate'
+        if value is None or not math.isfinite(value):
+            return 'missing'
+        if not self.lo <= value <= self.hi:
+            self.counts['out_of_range'] += 1
+            return 'out_of_range'
+        if self.last_ts is not None and ts - self.last_ts > self.max_fill_ns:
+            self.n = 0  # statistics from before an outage are stale
+        if self._is_spike(value):
+            self.counts['spike'] += 1
+            self._update(value)
+            return 'spike'
+        status = 'ok'
+        if self.last_ts is not None:
+            if self.step_ns is None:
+                self.step_ns = ts - self.last_ts
+            if ts - self.last_ts > self.max_fill_ns:
+                self.counts['outages'] += 1
+                status = 'outage'
+        self._update(value)
+        self.last_ts, self.last_value = ts, value
+        self.counts['accepted'] += 1
+        return status
+
+    def _ewm(self, x):
+        """Running mean/variance before each element of x, starting from the current state."""
+        a = self.alpha
+        mean0 = self.mean if self.n else x[0]
+        # m_t = (1 - a) m_{t-1} + a x_t, so m_{t-1} for each t is the shifted filter output
+        m, _ = lfilter([a], [1, -(1 - a)], x, zi=[(1 - a) * mean0])
+        prev_m = np.concatenate([[mean0], m[:-1]])
+        dev = x - prev_m
+        var0 = self.var if self.n else 0.0
+        v, _ = lfilter([(1 - a) * a], [1, -(1 - a)], dev * dev, zi=[(1 - a) * var0])
+        prev_v = np.concatenate([[var0], v[:-1]])
+        return prev_m, prev_v, m, v
+
+    def _reject_spikes(self, x):
+        """Spike mask for x; advances the running statistics over it"""
+        # Pass 1 flags spikes against the running stats; pass 2 recomputes the stats with
+        # each spike clipped to the band it was judged against
+        prev_m, prev_v, m, v = self._ewm(x)
+        dev = np.abs(x - prev_m)
+        band = self.z_threshold * np.sqrt(prev_v)
+        warm = np.arange(len(x)) + self.n >= self.warmup
+        spike = warm & (dev > self.min_deviation) & (dev > band)
+        if spike.any():
+            band = np.maximum(band, self.min_deviation)
+            _, _, m, v = self._ewm(np.where(spike, np.clip(x, prev_m - band, prev_m + band), x))
+        self.mean, self.var = float(m[-1]), float(v[-1])
+        self.n += len(x)
+        return spike
+
+    def process(self, timestamps, values):
+        """
+        Clean a chunk of readings in a few vectorized passes.
+
+        Returns:
+            dict with 'timestamp' (datetime64[ns]), 'value' and 'flag' (FLAG_OK / FLAG_FILLED)
+            arrays of the cleaned, gap-filled series, 'outages' as [(last good, next good)]
+            timestamp pairs, and 'rejected' counts for this chunk
+        """
+        ts = _to_ns(timestamps)
+        x = np.asarray(values, dtype=float)
+        rejected = {'duplicate': 0, 'out_of_range': 0, 'spike': 0}
+
+        order = np.argsort(ts, kind='stable')
+        ts, x = ts[order], x[order]
+        keep = np.ones(len(ts), dtype=bool)
+        keep[1:] = ts[1:] != ts[:-1]
+        if self.last_ts is not None:
+            keep &= ts > self.last_ts
+        rejected['duplicate'] = int(len(ts) - keep.sum())
+        keep &= np.isfinite(x)
+        in_range = (x >= self.lo) & (x <= self.hi)
+        rejected['out_of_range'] = int((keep & ~in_range).sum())
+        keep &= in_range
+        ts, x = ts[keep], x[keep]
+
+        if len(x):
+            # Statistics restart after every outage, so spikes are judged per segment
+            prev = np.concatenate([[self.last_ts if self.last_ts is not None else ts[0]], ts[:-1]])
+            cuts = np.flatnonzero(ts - prev > self.max_fill_ns)
+            spike = np.zeros(len(x), dtype=bool)
+            for lo, hi in zip(np.concatenate([[0], cuts]), np.concatenate([cuts, [len(x)]])):
+                if lo == hi:
+                    continue
+                if lo in cuts:
+                    self.n = 0
+                spike[lo:hi] = self._reject_spikes(x[lo:hi])
+            rejected['spike'] = int(spike.sum())
+            ts, x = ts[~spike], x[~spike]
+
+        out_ts, out_x, flags, outages = self._fill(ts, x)
+        if len(ts):
+            self.last_ts, self.last_value = int(ts[-1]), float(x[-1])
+        for k, v in rejected.items():
+            self.counts[k] += v
+        self.counts['accepted'] += len(ts)
+        self.counts['filled'] += int((flags == FLAG_FILLED).sum())
+        self.counts['outages'] += len(outages)
+        return {'timestamp': out_ts.astype('datetime64[ns]'), 'value': out_x, 'flag': flags,
+                'outages': outages, 'rejected': rejected}
+
+    def _fill(self, ts, x):
+        anchored = self.last_ts is not None
+        all_ts = np.concatenate([[self.last_ts], ts]) if anchored else ts
+        all_x = np.concatenate([[self.last_value], x]) if anchored else x
+        if len(all_ts) < 2:
+            return ts, x, np.zeros(len(ts), dtype=np.uint8), []
+        dt = np.diff(all_ts)
+        if self.step_ns is None:
+            self.step_ns = int(np.median(dt))
+        step = self.step_ns
+
+        long_gap = dt > self.max_fill_ns
+        outages = [(pd.Timestamp(all_ts[i]), pd.Timestamp(all_ts[i + 1])) for i in np.flatnonzero(long_gap)]
+        missing = np.where(long_gap, 0, np.maximum(np.rint(dt / step).astype(np.int64) - 1, 0))
+        total = int(missing.sum())
+        if not total:
+            return ts, x, np.zeros(len(ts), dtype=np.uint8), outages
+
+        # k-th filled step (1-based) after gap start i
+        gap_idx = np.repeat(np.arange(len(dt)), missing)
+        k = np.arange(total) - np.repeat(np.cumsum(missing) - missing, missing) + 1
+        fill_ts = all_ts[gap_idx] + k * step
+        keep = fill_ts < all_ts[gap_idx + 1]
+        fill_ts, gap_idx = fill_ts[keep], gap_idx[keep]
+        if self.method == 'linear':
+            fill_x = np.interp(fill_ts, all_ts, all_x)
+        else:
+            fill_x = all_x[gap_idx]
+
+        out_ts = np.concatenate([ts, fill_ts])
+        out_x = np.concatenate([x, fill_x])
+        flags = np.concatenate([np.zeros(len(ts), dtype=np.uint8), np.full(len(fill_ts), FLAG_FILLED, dtype=np.uint8)])
+        order = np.argsort(out_ts, kind='stable')
+        return out_ts[order], out_x[order], flags[order], outages
+
+
+class TelemetryCleaner:
+    """
+    Cleaners for a fleet of sensor streams, created on first use per (key, field).
+
+    Args:
+        limits: field -> (min, max); fields not listed are passed through unchecked
+        **options: SensorCleaner options shared by every stream
+    """
+
+    def __init__(self, limits=None, **options):
+        self.limits = FIELD_LIMITS if limits is None else limits
+        self.options = options
+        self.cleaners = {}
+        self._last = {}
+
+    def cleaner(self, key, field):
+        c = self.cleaners.get((key, field))
+        if c is None:
+            lo, hi = self.limits[field]
+            c = self.cleaners[(key, field)] = SensorCleaner(lo, hi, **self.options)
+        return c
+
+    def clean_reading(self, key, reading, time_field='ts'):
+        """
+        Validate one reading dict (inverter/BMS poll, MQTT payload).
+
+        Rejected fields are set to None and listed in reading['flags'] ({field: reason});
+        an accepted reading after a long gap gets 'outage' flags. A reading whose timestamp
+        is not newer than the previous one for `key` is a duplicate: the previously
+        cleaned reading is returned instead.
+        """
+        if reading is None or time_field not in reading:
+            return reading
+        fields = [f for f in reading if f in self.limits and isinstance(reading[f], (int, float))]
+        if not fields:
+            return reading
+        cleaned, flags, duplicate = dict(reading), {}, False
+        for field in fields:
+            status = self.cleaner(key, field).push(reading[time_field], float(reading[field]))
+            if status == 'duplicate':
+                duplicate = True
+            elif status in ('out_of_range', 'spike', 'missing'):
+                cleaned[field] = None
+                flags[field] = status
+                metrics.count('telemetry_rejected_total', field=field, reason=status)
+            elif status == 'outage':
+                flags[field] = status
+        if duplicate and key in self._last:
+            metrics.count('telemetry_duplicates_total')
+            return self._last[key]
+        if flags:
+            cleaned['flags'] = flags
+        self._last[key] = cleaned
+        return cleaned
+
+    def clean_frame(self, df, key_col='site_id', time_col='ts', fields=None):
+        """
+        Clean a long-format telemetry frame chunk (e.g. a backfill or a burst of polls).
+
+        Every (key, field) series is processed vectorized, continuing from the state
+        left by earlier chunks. Returns (frame, outages): one row per key and cleaned
+        timestamp with each field and a '<field>_filled' flag (NaN where a field has no
+        value at that timestamp), and a list of (key, field, last good, next good).
+        """
+        fields = [f for f in (fields or df.columns) if f in self.limits and f in df.columns]
+        if key_col:
+            codes, keys = pd.factorize(df[key_col], sort=False)
+        else:
+            codes, keys = np.zeros(len(df), dtype=np.int64), [None]
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+        stamps = _to_ns(df[time_col])[order]
+        columns = {f: df[f].to_numpy(dtype=float)[order] for f in fields}
+
+        parts, outages = [], []
+        for i, key in enumerate(keys):
+            lo, hi = bounds[i], bounds[i + 1]
+            results = {}
+            for field in fields:
+                res = self.cleaner(key, field).process(stamps[lo:hi], columns[field][lo:hi])
+                outages.extend((key, field, start, end) for start, end in res['outages'])
+                results[field] = res
+            if not results:
+                continue
+            first = next(iter(results.values()))['timestamp']
+            if all(np.array_equal(r['timestamp'], first) for r in results.values()):
+                # Common case: every field kept the same timestamps
+                wide = {time_col: first}
+                for field, r in results.items():
+                    wide[field] = r['value']
+                    wide[f'{field}_filled'] = r['flag'] == FLAG_FILLED
+                wide = pd.DataFrame(wide)
+            else:
+                wide = pd.concat([pd.DataFrame({field: r['value'], f'{field}_filled': r['flag'] == FLAG_FILLED},
+                                               index=pd.DatetimeIndex(r['timestamp'], name=time_col))
+                                  for field, r in results.items()], axis=1).sort_index().reset_index()
+            if key_col:
+                wide.insert(0, key_col, key)
+            parts.append(wide)
+        if outages:
+            metrics.count('telemetry_outages_total', len(outages))
+        if not parts:
+            return pd.DataFrame(columns=[key_col, time_col] if key_col else [time_col]), outages
+        return pd.concat(parts, ignore_index=True), outages
@@ -2,12 +2,19 @@ import os
 import yaml
 import time
 import logging
+import threading
 from . import inverter_api, battery_bms, mqtt_listener
+from .cleaning import TelemetryCleaner
+from .. import metrics
 
 log = logging.getLogger('amplifyai.sensors.ingest')
 
 CONFIG_PATH = os.path.join(os.getcwd(), 'sensor_config.yaml')
 
+# Running per-sensor validation state across polls, shared by the pipeline's site workers
+_cleaner = TelemetryCleaner()
+_cleaner_lock = threading.Lock()
+
 def _load_config():
     """Load sensor configuration from YAML."""
     try:
@@ -17,6 +24,22 @@ def _load_config():
         log.warning(f"Could not load sensor config: {e}")
         return {}
 
+def _clean(source, reading):
+    """
+    Validate a poll result; `source` names one stream, e.g. inverter/modbus_tcp.
+
+    A fleet result is validated per device and its pv_power_kw re-summed from the
+    accepted device readings; per-device limits are not applied to the fleet total.
+    """
+    if not reading:
+        return reading
+    with _cleaner_lock:
+        if not reading.get('devices'):
+            return _cleaner.clean_reading(source, reading)
+        devices = {dev: _cleaner.clean_reading(f'{source}/{dev}', r) for dev, r in reading['devices'].items()}
+    powers = [r['pv_power_kw'] for r in devices.values() if r is not None and r.get('pv_power_kw') is not None]
+    return {**reading, 'pv_power_kw': round(sum(powers), 3), 'devices': devices}
+
 def ingest_latest():
     """Ingest latest data from all configured sensors."""
     cfg = _load_config()
@@ -31,16 +54,25 @@ def ingest_latest():
         inv_cfg = cfg.get('sensors', {}).get('inverter', {})
         provider = inv_cfg.get('provider', 'mock_fronius')
         
-        if provider == 'mock_fronius':
-            data['inverter'] = inverter_api.fetch_fronius_status(
-                inv_cfg.get('api_url'),
-                inv_cfg.get('api_key')
-            )
-        elif provider == 'solaredge':
-            data['inverter'] = inverter_api.fetch_solaredge_status(
-                inv_cfg.get('api_url'),
-                inv_cfg.get('api_key')
-            )
+        with metrics.timer('sensor_poll', source='inverter', provider=provider):
+            if provider == 'mock_fronius':
+                data['inverter'] = inverter_api.fetch_fronius_status(
+                    inv_cfg.get('api_url'),
+                    inv_cfg.get('api_key')
+                )
+            elif provider == 'modbus_tcp':
+                data['inverter'] = inverter_api.fetch_modbus_tcp_status(
+                    inv_cfg.get('devices', []),
+                    inv_cfg.get('registers'),
+                    inv_cfg.get('timeout_s', 1.0),
+                    inv_cfg.get('max_workers', 16)
+                )
+            elif provider == 'solaredge':
+                data['inverter'] = inverter_api.fetch_solaredge_status(
+                    inv_cfg.get('api_url'),
+                    inv_cfg.get('api_key')
+                )
+        data['inverter'] = _clean(f'inverter/{provider}', data['inverter'])
     except Exception as e:
         log.exception(f"Inverter ingestion error: {e}")
     
@@ -48,24 +80,27 @@ def ingest_latest():
         bms_cfg = cfg.get('sensors', {}).get('bms', {})
         provider = bms_cfg.get('provider', 'mock_bms')
         
-        if provider == 'mock_bms':
-            data['bms'] = battery_bms.read_bms_mock()
-        elif provider == 'serial':
-            data['bms'] = battery_bms.read_bms_serial(bms_cfg.get('connection'))
-        elif provider == 'can':
-            data['bms'] = battery_bms.read_bms_can(bms_cfg.get('interface', 'can0'))
+        with metrics.timer('sensor_poll', source='bms', provider=provider):
+            if provider == 'mock_bms':
+                data['bms'] = battery_bms.read_bms_mock()
+            elif provider == 'serial':
+                data['bms'] = battery_bms.read_bms_serial(bms_cfg.get('connection'), bms_cfg.get('baudrate', 9600))
+            elif provider == 'can':
+                data['bms'] = battery_bms.read_bms_can(bms_cfg.get('interface', 'can0'))
+        data['bms'] = _clean(f'bms/{provider}', data['bms'])
     except Exception as e:
         log.exception(f"BMS ingestion error: {e}")
     
     try:
         mqtt_cfg = cfg.get('sensors', {}).get('mqtt', {})
         if mqtt_cfg.get('enabled', False):
-            mqtt_listener.start_listener(
-                mqtt_cfg.get('broker', 'localhost'),
-                mqtt_cfg.get('port', 1883),
-                mqtt_cfg.get('topics')
-            )
-            data['mqtt'] = mqtt_listener.get_latest()
+            with metrics.timer('sensor_poll', source='mqtt', provider='mqtt'):
+                mqtt_listener.start_listener(
+                    mqtt_cfg.get('broker', 'localhost'),
+                    mqtt_cfg.get('port', 1883),
+                    mqtt_cfg.get('topics')
+                )
+                data['mqtt'] = mqtt_listener.get_latest()
     except Exception as e:
         log.exception(f"MQTT ingestion error: {e}")
     
@@ -1,9 +1,16 @@
 import time
+import json
 import logging
 import random
+import threading
+
+from .modbus_tcp import ModbusPoller
 
 log = logging.getLogger('amplifyai.sensors.inverter')
 
+_pollers = {}
+_pollers_lock = threading.Lock()
+
 def fetch_fronius_status(api_url: str, api_key: str = None):
     """Fetch solar inverter status from Fronius API."""
     try:
@@ -27,3 +34,38 @@ def fetch_generic_http_status(api_url: str, params: dict = None):
     """Generic HTTP inverter status endpoint."""
     log.info("Generic HTTP inverter interface not yet implemented")
     return None
+
+def fetch_modbus_tcp_status(devices, register_map=None, timeout: float = 1.0, max_workers: int = 16):
+    """
+    Poll Modbus TCP inverters and return the fleet reading.
+
+    Pollers (and their open connections) are reused across calls with the same
+    configuration. The result sums pv_power_kw over the devices that answered and
+    carries every per-device reading under 'devices' (None for failed devices).
+    """
+    try:
+        key = json.dumps([devices, register_map, timeout, max_workers], sort_keys=True, default=str)
+        with _pollers_lock:
+            poller = _pollers.get(key)
+            if poller is None:
+                poller = _pollers[key] = ModbusPoller(devices, register_map, timeout=timeout, max_workers=max_workers)
+        readings = poller.poll()
+        ok = [r for r in readings.values() if r is not None]
+        return {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'pv_power_kw': round(sum(r.get('pv_power_kw', 0.0) for r in ok), 3),
+            'devices_ok': len(ok),
+            'devices_failed': len(readings) - len(ok),
+            'devices': readings,
+            'source': 'modbus_tcp'
+        }
+    except Exception as e:
+        log.warning(f"Modbus TCP inverter error: {e}")
+        return None
+
+def close_modbus_pollers():
+    """Close all cached Modbus pollers and their connections."""
+    with _pollers_lock:
+        for poller in _pollers.values():
+            poller.close()
+        _pollers.clear()
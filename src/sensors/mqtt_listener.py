@@ -2,16 +2,24 @@ import logging
 import json
 import time
 
+from .cleaning import TelemetryCleaner
+from .. import metrics
+
 log = logging.getLogger('amplifyai.sensors.mqtt')
 
 _latest = {}
+_cleaner = TelemetryCleaner()
 
 def _on_message(client, userdata, msg):
     """Internal MQTT message handler."""
     try:
         data = json.loads(msg.payload.decode('utf-8'))
+        if isinstance(data, dict):
+            data = _cleaner.clean_reading(msg.topic, data, time_field='ts' if 'ts' in data else 'timestamp')
         _latest[msg.topic] = data
+        metrics.count('mqtt_messages_total')
     except Exception as e:
+        metrics.count('mqtt_messages_errors_total')
         log.exception(f'Malformed MQTT payload on {msg.topic}: {e}')
 
 def start_listener(broker='localhost', port=1883, topics=None, timeout=2):
@@ -0,0 +1,178 @@
+"""
+Local device simulators for exercising the sensor drivers without hardware.
+
+BmsPtySimulator streams BMS telemetry frames on a pseudo-terminal, so
+SerialBmsReader can open its slave end exactly like /dev/ttyUSB0.
+ModbusSimulator is a small Modbus TCP server holding inverter registers for
+any number of unit ids, for ModbusPoller.
+"""
+import os
+import tty
+import time
+import random
+import threading
+import socketserver
+
+from .battery_bms import encode_telemetry_frame
+from .modbus_tcp import INVERTER_REGISTERS, MBAP, READ_REQUEST, READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS, plan_blocks
+
+
+class BmsPtySimulator:
+    """
+    Streams telemetry frames into a pty at `rate_hz` (Linux/macOS).
+
+    `port` is the slave device path to hand to SerialBmsReader. Every
+    `corrupt_every`-th frame has a flipped payload byte to exercise resync.
+    """
+
+    def __init__(self, rate_hz=100.0, corrupt_every=0, soc_kwh=20.0):
+        self.master, self.slave = os.openpty()
+        # Raw from the start, like a real UART: bytes written before the reader
+        # configures the port must not go through the terminal line discipline
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.rate_hz = rate_hz
+        self.corrupt_every = corrupt_every
+        self.soc_kwh = soc_kwh
+        self.sent = 0
+        self.corrupted = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def frame(self, i):
+        """Frame number `i` of a slowly discharging pack"""
+        soc = max(0.0, self.soc_kwh - 0.001 * i)
+        frame = bytearray(encode_telemetry_frame(soc, 51.2 - 0.0001 * i, -12.5, 31.4, 3.19, 3.23, uptime_ms=i * 10))
+        if self.corrupt_every and i % self.corrupt_every == self.corrupt_every - 1:
+            frame[6] ^= 0xFF
+            self.corrupted += 1
+        return bytes(frame)
+
+    def write(self, data):
+        """Write raw bytes to the device (e.g. noise or split frames)"""
+        os.write(self.master, data)
+
+    def _run(self, n_frames):
+        period = 1.0 / self.rate_hz if self.rate_hz else 0.0
+        i = 0
+        while not self._stop.is_set() and (n_frames is None or i < n_frames):
+            self.write(self.frame(i))
+            self.sent += 1
+            i += 1
+            if period:
+                time.sleep(period)
+
+    def start(self, n_frames=None):
+        self._thread = threading.Thread(target=self._run, args=(n_frames,), daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def close(self):
+        self._stop.set()
+        self.join(1.0)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class _ModbusHandler(socketserver.BaseRequestHandler):
+    def _recv(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def handle(self):
+        sim = self.server.simulator
+        while True:
+            head = self._recv(MBAP.size)
+            if head is None:
+                return
+            tid, proto, length, unit = MBAP.unpack(head)
+            pdu = self._recv(length - 1)
+            if pdu is None:
+                return
+            sim.count_request()
+            if sim.latency_s:
+                time.sleep(sim.latency_s)
+            fn = pdu[0]
+            if fn not in (READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS) or len(pdu) != READ_REQUEST.size:
+                reply = bytes([fn | 0x80, 0x01])  # illegal function
+            elif unit not in sim.units:
+                reply = bytes([fn | 0x80, 0x0B])  # gateway target failed to respond
+            else:
+                _, start, count = READ_REQUEST.unpack(pdu)
+                if count < 1 or count > 125 or start + count > 0x10000:
+                    reply = bytes([fn | 0x80, 0x02])  # illegal data address
+                else:
+                    reply = bytes([fn, 2 * count]) + bytes(sim.units[unit][2 * start:2 * (start + count)])
+            self.request.sendall(MBAP.pack(tid, proto, len(reply) + 1, unit) + reply)
+
+
+class _ModbusServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 256  # a whole fleet connects at once
+
+
+# Nominal register values for a simulated inverter (jittered per unit)
+SAMPLE_INVERTER_READING = {
+    'pv_power_kw': 4.2, 'pv_voltage': 380.0, 'pv_current': 11.05, 'ac_power_kw': 4.05,
+    'grid_frequency': 50.0, 'energy_today_kwh': 12.3, 'temp_c': 41.5, 'status': 4,
+}
+
+
+class ModbusSimulator:
+    """
+    Local Modbus TCP server exposing inverter registers for unit ids `units`.
+
+    Register values follow `register_map` (INVERTER_REGISTERS by default) and
+    start as a plausible random reading per unit; `set_reading` overrides them.
+    `requests` counts the read requests served; `latency_s` delays each reply.
+    """
+
+    def __init__(self, units=(1,), register_map=None, host='127.0.0.1', port=0, latency_s=0.0, seed=0):
+        self.register_map = register_map or INVERTER_REGISTERS
+        self.latency_s = latency_s
+        self.requests = 0
+        self._count_lock = threading.Lock()
+        self.units = {unit: bytearray(2 * 0x10000) for unit in units}
+        rng = random.Random(seed)
+        for unit in self.units:
+            self.set_reading(unit, {name: value if name == 'status' else value * rng.uniform(0.8, 1.2)
+                                    for name, value in SAMPLE_INVERTER_READING.items() if name in self.register_map})
+        self.server = _ModbusServer((host, port), _ModbusHandler)
+        self.server.simulator = self
+        self.address = self.server.server_address
+        self._thread = None
+
+    def count_request(self):
+        with self._count_lock:
+            self.requests += 1
+
+    def set_reading(self, unit, values):
+        """Write scaled values (name -> engineering value) into a unit's registers"""
+        store = self.units[unit]
+        for start, count, layout, names in plan_blocks(self.register_map):
+            current = list(layout.unpack_from(store, 2 * start))
+            raw = [round(values[name] * divisor) if name in values else old
+                   for (name, divisor), old in zip(names, current)]
+            layout.pack_into(store, 2 * start, *raw)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,467 @@
+"""
+Host-wide shared memory for large read-only arrays.
+
+An entry is published once into a POSIX shared-memory segment and every other
+process on the host attaches to it by key, getting read-only numpy views
+straight into the segment. N Streamlit server processes or pool workers then
+share one copy of a training frame, solar table or forecast result instead of
+each holding their own.
+
+Segment layout:
+
+    header    '<4sBBxxII16s'  magic b'AMSM', format version, state, manifest length,
+                              holder slots, random token identifying this segment
+    holders   int32 pid per slot (0 = free)
+    manifest  UTF-8 JSON {'key', 'arrays': [[name, dtype, shape, offset], ...], 'meta'}
+    arrays    64-byte aligned, at data start + offset
+
+Entries are reference counted by pid in the holder table, which is only
+changed under an flock on a host-wide lock file. A process holds one slot per
+entry however many times it attaches; the segment is unlinked when its last
+holder releases it. Slots of processes that died without releasing (crash,
+SIGKILL) are reclaimed whenever the entry is touched again, and `sweep`
+removes segments nobody alive holds.
+"""
+import os
+import json
+import time
+import pickle
+import atexit
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+
+try:
+    import fcntl
+    SHARED_MEMORY_AVAILABLE = True
+except ImportError:
+    SHARED_MEMORY_AVAILABLE = False
+
+log = logging.getLogger('amplifyai.shared_store')
+
+MAGIC = b'AMSM'
+VERSION = 1
+STATE_WRITING = 0
+STATE_READY = 1
+MAX_HOLDERS = 256
+ALIGN = 64
+PREFIX = 'amp_'
+NAMESPACE = os.environ.get('AMPLIFYAI_SHM_NAMESPACE', 'amplifyai')
+ENABLED = SHARED_MEMORY_AVAILABLE and os.environ.get('AMPLIFYAI_SHARED_MEMORY', '1') != '0'
+LOCK_PATH = os.path.join(tempfile.gettempdir(), 'amplifyai-shm.lock')
+SHM_DIR = '/dev/shm'
+
+HEADER = struct.Struct('<4sBBxxII16s')
+HOLDERS = struct.Struct(f'<{MAX_HOLDERS}i')
+SLOT = struct.Struct('<i')
+STATE_OFFSET = 5
+
+_held = {}  # segment name -> SharedEntry attached by this process
+_held_pid = os.getpid()
+_lock = threading.RLock()
+
+
+class _Segment(shared_memory.SharedMemory):
+    """SharedMemory whose lifetime is decided by the holder table rather than the resource tracker."""
+
+    def __init__(self, name, create=False, size=0):
+        super().__init__(name, create, size)
+        # The tracker would unlink the segment when whichever process touched it first exits
+        resource_tracker.unregister(self._name, 'shared_memory')
+
+    def unlink(self):
+        resource_tracker.register(self._name, 'shared_memory')  # balanced by unlink()'s unregister
+        super().unlink()
+
+    def __del__(self):
+        try:
+            self.close()
+        except (OSError, BufferError):
+            pass  # views still alive keep the mapping until they are collected
+
+
+class SharedEntry:
+    """
+    Read-only arrays attached from a shared segment.
+
+    `arrays` maps names to numpy views into the segment and `meta` holds the
+    JSON metadata given at publish time. Call `release` (or use it as a
+    context manager) when done; views taken from it stay valid after release
+    and keep the mapping alive until they are garbage collected.
+    """
+
+    def __init__(self, key, segment, token, arrays, meta):
+        self.key = key
+        self.name = segment.name if segment is not None else None
+        self.arrays = arrays
+        self.meta = meta
+        self.refs = 1
+        self._segment = segment
+        self._token = token
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    @property
+    def shared(self):
+        """False for the local fallback used when shared memory is unavailable."""
+        return self._segment is not None
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.arrays.values())
+
+    def frame(self):
+        """The DataFrame packed with `pack_frame`, built over the shared columns without copying."""
+        columns = self.meta['columns']
+        return pd.DataFrame({c: self.arrays[f'col:{c}'] for c in columns}, columns=columns, copy=False)
+
+    def load_object(self, name):
+        """Unpickle an object packed with `pack_object`."""
+        return pickle.loads(self.arrays[name])
+
+    def release(self):
+        release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def pack_frame(df):
+    """(arrays, meta) for publishing a DataFrame with plain numeric or datetime columns."""
+    arrays = {f'col:{c}': df[c].to_numpy() for c in df.columns}
+    return arrays, {'columns': [str(c) for c in df.columns]}
+
+
+def pack_object(obj):
+    """A small picklable object (e.g. a fitted model) as a uint8 array for publishing."""
+    return np.frombuffer(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+
+
+def segment_name(key, namespace=NAMESPACE):
+    return PREFIX + hashlib.sha1(f'{namespace}:{key}'.encode('utf-8')).hexdigest()[:24]
+
+
+class _HostLock:
+    """Exclusive flock on LOCK_PATH; guards every holder-table change on the host."""
+
+    def __enter__(self):
+        self.fd = os.open(LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o666)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _reap(buf):
+    """Clear slots of dead processes; returns the live holder pids. Call under _HostLock."""
+    live = []
+    for slot, pid in enumerate(HOLDERS.unpack_from(buf, HEADER.size)):
+        if not pid:
+            continue
+        if _alive(pid):
+            live.append(pid)
+        else:
+            SLOT.pack_into(buf, HEADER.size + slot * SLOT.size, 0)
+            metrics.count('shared_store_reaped_total')
+    return live
+
+
+def _set_holder(buf, old, new):
+    pids = HOLDERS.unpack_from(buf, HEADER.size)
+    if old not in pids:
+        return False
+    SLOT.pack_into(buf, HEADER.size + pids.index(old) * SLOT.size, new)
+    return True
+
+
+def _unlink_if_current(name, token):
+    """Unlink `name` only if it is still the segment carrying `token` (it may have been replaced)."""
+    try:
+        segment = _Segment(name)
+    except FileNotFoundError:
+        return
+    try:
+        if HEADER.unpack_from(segment.buf)[-1] == token:
+            segment.unlink()
+    finally:
+        segment.close()
+
+
+def _close(segment):
+    try:
+        segment.close()
+    except BufferError:
+        pass  # caller still holds views; the mapping goes with them
+
+
+def _views(segment, manifest, data_start):
+    arrays = {}
+    for name, dtype, shape, offset in manifest['arrays']:
+        dtype, count = np.dtype(dtype), int(np.prod(shape))
+        if count:
+            view = np.frombuffer(segment.buf, dtype=dtype, count=count, offset=data_start + offset).reshape(shape)
+        else:
+            view = np.empty(shape, dtype=dtype)
+        view.flags.writeable = False
+        arrays[name] = view
+    return arrays
+
+
+def _check_process():
+    """Forget entries inherited over fork(); the child holds no slots of its own."""
+    global _held_pid
+    if _held_pid != os.getpid():
+        _held.clear()
+        _held_pid = os.getpid()
+
+
+def publish(key, arrays, meta=None, namespace=NAMESPACE, replace=False):
+    """
+    Publish named arrays under `key` for every process on the host.
+
+    The arrays are copied into a new segment once; the returned entry (held
+    by this process) exposes read-only views of that copy, so the originals
+    can be dropped.
+
+    Args:
+        key: Entry name, e.g. 'solar:15.365:75.123:60'
+        arrays: dict of name -> numpy array (no object dtypes)
+        meta: JSON-serializable metadata stored with the arrays
+        replace: Unlink an existing entry first; current holders keep their (old) views
+
+    Raises:
+        FileExistsError: the key is already published by a live process (and not `replace`)
+    """
+    arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+    for name, a in arrays.items():
+        if a.dtype.hasobject:
+            raise TypeError(f"Array '{name}' has object dtype; only plain numeric, datetime or string data can be shared")
+    if not ENABLED:
+        return SharedEntry(key, None, None, arrays, meta or {})
+
+    entries, offset = [], 0
+    for name, a in arrays.items():
+        offset += -offset % ALIGN
+        entries.append([name, a.dtype.str, list(a.shape), offset])
+        offset += a.nbytes
+    manifest = json.dumps({'key': key, 'arrays': entries, 'meta': meta or {}}, separators=(',', ':')).encode('utf-8')
+    data_start = HEADER.size + HOLDERS.size + len(manifest)
+    data_start += -data_start % ALIGN
+    name, token = segment_name(key, namespace), os.urandom(16)
+
+    with _lock, metrics.timer('shared_store_publish'):
+        _check_process()
+        with _HostLock():
+            if replace:
+                _discard_locked(name)
+            try:
+                segment = _Segment(name, create=True, size=data_start + offset)
+            except FileExistsError:
+                if not _stale_locked(name):
+                    raise FileExistsError(f"Shared entry '{key}' is already published") from None
+                segment = _Segment(name, create=True, size=data_start + offset)
+            HEADER.pack_into(segment.buf, 0, MAGIC, VERSION, STATE_WRITING, len(manifest), MAX_HOLDERS, token)
+            SLOT.pack_into(segment.buf, HEADER.size, os.getpid())
+            segment.buf[HEADER.size + HOLDERS.size:HEADER.size + HOLDERS.size + len(manifest)] = manifest
+
+        # Copied outside the host lock; attachers wait for STATE_READY
+        for (_, _, _, array_offset), a in zip(entries, arrays.values()):
+            if a.size:
+                target = np.frombuffer(segment.buf, dtype=a.dtype, count=a.size, offset=data_start + array_offset)
+                np.copyto(target, a.reshape(-1))
+                del target
+        segment.buf[STATE_OFFSET] = STATE_READY
+        views = _views(segment, json.loads(manifest), data_start)
+        entry = SharedEntry(key, segment, token, views, meta or {})
+        _held[name] = entry
+        metrics.count('shared_store_published_total')
+        log.info(f"Published shared entry '{key}' ({(data_start + offset) / 1e6:.1f} MB)")
+        return entry
+
+
+def attach(key, namespace=NAMESPACE, timeout=5.0):
+    """
+    Attach to a published entry; repeated attaches in one process share one mapping.
+
+    Raises:
+        KeyError: nothing live is published under `key`
+        TimeoutError: the publisher did not finish writing within `timeout` seconds
+    """
+    if not ENABLED:
+        raise KeyError(key)
+    name = segment_name(key, namespace)
+    with _lock:
+        _check_process()
+        entry = _held.get(name)
+        if entry is not None:
+            entry.refs += 1
+            return entry
+        try:
+            segment = _Segment(name)
+        except FileNotFoundError:
+            raise KeyError(key) from None
+
+        with _HostLock():
+            magic, version, _, manifest_len, _, token = HEADER.unpack_from(segment.buf)
+            if magic != MAGIC or version > VERSION:
+                _close(segment)
+                raise KeyError(key)
+            if not _reap(segment.buf):
+                segment.unlink()
+                _close(segment)
+                raise KeyError(key)
+            if not _set_holder(segment.buf, 0, os.getpid()):
+                _close(segment)
+                raise RuntimeError(f"Shared entry '{key}' already has {MAX_HOLDERS} holders")
+
+        deadline = time.monotonic() + timeout
+        while segment.buf[STATE_OFFSET] != STATE_READY:
+            if time.monotonic() > deadline:
+                _detach(name, segment, token)
+                raise TimeoutError(f"Shared entry '{key}' was not ready within {timeout}s")
+            time.sleep(0.001)
+
+        manifest = json.loads(bytes(segment.buf[HEADER.size + HOLDERS.size:HEADER.size + HOLDERS.size + manifest_len]))
+        data_start = HEADER.size + HOLDERS.size + manifest_len
+        data_start += -data_start % ALIGN
+        entry = SharedEntry(manifest['key'], segment, token, _views(segment, manifest, data_start), manifest['meta'])
+        _held[name] = entry
+        metrics.count('shared_store_attached_total')
+        return entry
+
+
+def get_or_publish(key, build, namespace=NAMESPACE):
+    """
+    Attach to `key`, or call `build()` -> (arrays, meta) and publish the result.
+
+    Two processes racing on a missing key may both build; the loser attaches
+    to the winner's entry. Without shared memory this just builds locally.
+    """
+    try:
+        return attach(key, namespace)
+    except KeyError:
+        pass
+    arrays, meta = build()
+    try:
+        return publish(key, arrays, meta, namespace)
+    except FileExistsError:
+        return attach(key, namespace)
+
+
+def _detach(name, segment, token):
+    with _HostLock():
+        _set_holder(segment.buf, os.getpid(), 0)
+        if not _reap(segment.buf):
+            _unlink_if_current(name, token)
+    _close(segment)
+
+
+def release(entry):
+    """Drop one reference; the last holder on the host unlinks the segment."""
+    if not entry.shared:
+        entry.arrays = {}
+        return
+    with _lock:
+        _check_process()
+        if _held.get(entry.name) is not entry:
+            return
+        entry.refs -= 1
+        if entry.refs > 0:
+            return
+        del _held[entry.name]
+        segment, entry._segment, entry.arrays = entry._segment, None, {}
+        _detach(entry.name, segment, entry._token)
+
+
+def _stale_locked(name):
+    """Unlink `name` if no live process holds it; returns True if it was removed. Call under _HostLock."""
+    try:
+        segment = _Segment(name)
+    except FileNotFoundError:
+        return True
+    try:
+        if HEADER.unpack_from(segment.buf)[0] == MAGIC and _reap(segment.buf):
+            return False
+        segment.unlink()
+        return True
+    finally:
+        _close(segment)
+
+
+def _discard_locked(name):
+    entry = _held.pop(name, None)
+    if entry is not None:
+        segment, entry._segment = entry._segment, None
+        _set_holder(segment.buf, os.getpid(), 0)
+        _close(segment)
+    try:
+        segment = _Segment(name)
+    except FileNotFoundError:
+        return
+    segment.unlink()
+    _close(segment)
+
+
+def discard(key, namespace=NAMESPACE):
+    """
+    Unpublish `key` so the next get_or_publish rebuilds it.
+
+    Processes (including this one) keep whatever views they already hold;
+    the old segment's memory is freed when the last of them is released.
+    """
+    if not ENABLED:
+        return
+    with _lock, _HostLock():
+        _check_process()
+        _discard_locked(segment_name(key, namespace))
+
+
+def sweep():
+    """Unlink shared segments whose holders have all exited; returns how many were removed."""
+    if not ENABLED or not os.path.isdir(SHM_DIR):
+        return 0
+    removed = 0
+    with _HostLock():
+        for name in os.listdir(SHM_DIR):
+            if name.startswith(PREFIX) and _stale_locked(name):
+                removed += 1
+    if removed:
+        log.info(f"Swept {removed} orphaned shared segment(s)")
+    return removed
+
+
+@atexit.register
+def release_all():
+    """Release every entry this process holds (run at interpreter exit)."""
+    with _lock:
+        _check_process()
+        for entry in list(_held.values()):
+            entry.refs = 1
+            release(entry)
@@ -0,0 +1,144 @@
+"""
+Per-site solar geometry and clear-sky irradiance tables.
+
+A table holds one value per step for a whole (leap) year, computed in a single
+vectorized pass and cached on disk as .npz. Lookups are pure index arithmetic
+on (day of year, minute of day), so forecasting needs no trigonometry per step.
+"""
+import os
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from . import shared_store
+
+log = logging.getLogger('amplifyai.solar')
+
+DEFAULT_LOCATION = (15.3647, 75.1234)
+CACHE_DIR = os.environ.get('AMPLIFYAI_SOLAR_CACHE', '.solar_cache')
+HAURWITZ_COEFF = 1098.0
+DAYS = 366  # leap-year sized; day-of-year indexes straight in
+
+_memory = {}
+_lock = threading.Lock()
+
+
+def haurwitz_ghi(cos_zenith):
+    """Haurwitz clear-sky GHI (W/m²) from cos(zenith); zero with the sun below the horizon."""
+    cos_z = np.clip(cos_zenith, 0.0, None)
+    with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+        return np.where(cos_z > 0.01, HAURWITZ_COEFF * cos_z * np.exp(-0.059 / np.maximum(cos_z, 0.01)), 0.0)
+
+
+def solar_position(lat, lon, day_of_year, clock_hours, tz_offset_hours):
+    """
+    Vectorized solar position (Spencer declination and equation of time).
+
+    All arguments broadcast. Returns (cos_zenith, elevation_deg).
+    """
+    gamma = 2 * np.pi * (day_of_year - 1 + (clock_hours - 12) / 24.0) / 365.0
+    decl = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+            - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+            - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+    eot_min = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                        - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    solar_minutes = clock_hours * 60.0 + eot_min + 4.0 * lon - 60.0 * tz_offset_hours
+    hour_angle = np.radians(solar_minutes / 4.0 - 180.0)
+    phi = np.radians(lat)
+    cos_z = np.sin(phi) * np.sin(decl) + np.cos(phi) * np.cos(decl) * np.cos(hour_angle)
+    cos_z = np.clip(cos_z, -1.0, 1.0)
+    return cos_z, np.degrees(np.arcsin(cos_z))
+
+
+class SolarTable:
+    """Clear-sky GHI, cos(zenith) and daylight flags at a fixed step for one site."""
+
+    def __init__(self, lat, lon, tz_offset_hours, step_minutes, cos_zenith, clearsky_ghi, daylight=None):
+        self.lat = lat
+        self.lon = lon
+        self.tz_offset_hours = tz_offset_hours
+        self.step_minutes = step_minutes
+        self.steps_per_day = 1440 // step_minutes
+        self.cos_zenith = cos_zenith
+        self.clearsky_ghi = clearsky_ghi
+        self.daylight = cos_zenith > 0.0 if daylight is None else daylight
+
+    def index(self, timestamps):
+        """Flat table index for naive local-clock timestamps (scalar or array-like)."""
+        ts = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(timestamps)))
+        minute = ts.hour.to_numpy() * 60 + ts.minute.to_numpy()
+        return (ts.dayofyear.to_numpy() - 1) * self.steps_per_day + minute // self.step_minutes
+
+    def lookup(self, timestamps, field='clearsky_ghi'):
+        return getattr(self, field)[self.index(timestamps)]
+
+
+def _cache_path(lat, lon, tz, step_minutes):
+    return os.path.join(CACHE_DIR, f'solar_{lat:.3f}_{lon:.3f}_{tz:+.2f}_{step_minutes}m.npz')
+
+
+def compute_solar_table(lat, lon, tz_offset_hours=None, step_minutes=60):
+    """Build a year-long table (values at step centres) in one vectorized pass."""
+    if 1440 % step_minutes:
+        raise ValueError("step_minutes must divide a day evenly")
+    tz = lon / 15.0 if tz_offset_hours is None else float(tz_offset_hours)
+    spd = 1440 // step_minutes
+    day = np.repeat(np.arange(1, DAYS + 1, dtype=float), spd)
+    clock = np.tile((np.arange(spd) + 0.5) * step_minutes / 60.0, DAYS)
+    cos_z, _ = solar_position(lat, lon, day, clock, tz)
+    return SolarTable(lat, lon, tz, step_minutes,
+                      cos_z.astype(np.float32), haurwitz_ghi(cos_z).astype(np.float32))
+
+
+def _load_table(key, use_disk):
+    """Table from the .npz disk cache, else computed (and written back when `use_disk`)."""
+    lat, lon, tz, step_minutes = key
+    path = _cache_path(*key)
+    if use_disk and os.path.exists(path):
+        try:
+            with np.load(path) as data:
+                return SolarTable(lat, lon, tz, step_minutes, data['cos_zenith'], data['clearsky_ghi'])
+        except Exception as e:
+            log.warning(f"Ignoring unreadable solar cache {path}: {e}")
+    table = compute_solar_table(lat, lon, tz, step_minutes)
+    if use_disk:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp = path + '.tmp.npz'
+            np.savez(tmp, cos_zenith=table.cos_zenith, clearsky_ghi=table.clearsky_ghi)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning(f"Could not write solar cache {path}: {e}")
+    return table
+
+
+def _shared_table(key, use_disk):
+    """Table whose arrays live in host shared memory, published by whichever process gets there first."""
+    def build():
+        table = _load_table(key, use_disk)
+        return {'cos_zenith': table.cos_zenith, 'clearsky_ghi': table.clearsky_ghi, 'daylight': table.daylight}, {}
+
+    entry = shared_store.get_or_publish('solar:{:.3f}:{:.3f}:{:+.2f}:{}'.format(*key), build)
+    return SolarTable(*key, entry['cos_zenith'], entry['clearsky_ghi'], entry['daylight'])
+
+
+def get_solar_table(lat, lon, tz_offset_hours=None, step_minutes=60, use_disk=True):
+    """
+    Cached table for a site: process memory first, then host shared memory, then the
+    .npz disk cache, else computed and stored. Shared tables are read-only.
+    """
+    tz = lon / 15.0 if tz_offset_hours is None else float(tz_offset_hours)
+    key = (round(lat, 3), round(lon, 3), round(tz, 2), step_minutes)
+    table = _memory.get(key)
+    if table is not None:
+        return table
+
+    with _lock:
+        table = _memory.get(key)
+        if table is not None:
+            return table
+        table = _shared_table(key, use_disk) if shared_store.ENABLED else _load_table(key, use_disk)
+        _memory[key] = table
+        return table
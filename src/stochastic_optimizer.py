@@ -0,0 +1,226 @@
+"""
+Two-stage stochastic battery scheduling against sampled forecast scenarios.
+
+Forecast uncertainty (the per-step `std` from forecast_hours) is turned into
+correlated PV scenarios. All scenarios are assembled into a single sparse LP
+in which the first-stage charge/discharge columns are shared by every
+scenario (non-anticipativity by construction, no linking rows), while later
+steps are per-scenario recourse. The model is solved once with HiGHS.
+"""
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+
+from . import metrics
+from .multi_hour_optimizer import describe_actions
+
+OBJECTIVE_WEIGHTS = {
+    # objective: (unmet weight, excess weight), as in optimize_battery_schedule
+    'minimize_unmet': (1.0, 0.0),
+    'maximize_self_consumption': (0.0, 1.0),
+    'balanced': (1.0, 0.5),
+}
+
+THROUGHPUT_EPS = 1e-6
+
+
+def sample_scenarios(mean_kwh, std_kwh, n_scenarios=100, correlation=0.7, seed=None):
+    """
+    PV scenarios (n_scenarios, T) with AR(1)-correlated errors around the forecast.
+
+    Forecast errors persist from one step to the next, so errors are correlated
+    in time with coefficient `correlation`; values are clipped at zero.
+    """
+    mean = np.asarray(mean_kwh, dtype=float)
+    std = np.broadcast_to(np.asarray(std_kwh, dtype=float), mean.shape)
+    rng = np.random.default_rng(seed)
+    z = rng.standard_normal((n_scenarios, len(mean)))
+    scale = np.sqrt(1 - correlation ** 2)
+    for t in range(1, len(mean)):
+        z[:, t] = correlation * z[:, t - 1] + scale * z[:, t]
+    return np.clip(mean + std * z, 0, None)
+
+
+def optimize_stochastic_schedule(
+    scenarios_kwh,
+    demand_kwh,
+    battery_capacity_kwh=50,
+    initial_soc_kwh=20,
+    charge_rate_max=10,
+    discharge_rate_max=10,
+    roundtrip_eff=0.9,
+    objective='minimize_unmet',
+    step_hours=1.0,
+    first_stage_steps=1,
+    probabilities=None
+):
+    """
+    Schedule minimizing the expected objective over PV scenarios with a shared first-stage action.
+
+    Args:
+        scenarios_kwh: PV energy per scenario and step, shape (S, T)
+        demand_kwh: Demand per step (T,) or per scenario (S, T)
+        battery_capacity_kwh .. roundtrip_eff, objective, step_hours: as optimize_battery_schedule
+        first_stage_steps: Leading steps whose charge/discharge is common to all scenarios
+        probabilities: Scenario weights (S,); uniform by default
+
+    Returns:
+        dict in optimize_battery_schedule's format: 'charge', 'discharge', 'soc', 'unmet_demand',
+        'excess_energy' and 'actions' are one executable plan, the shared first stage followed by
+        the recourse of the scenario whose PV is closest to the expected PV ('scenario', with its
+        PV as 'scenario_pv'). Probability-weighted averages over all scenarios, which are not a
+        feasible plan themselves, are under 'expected_charge', 'expected_discharge', 'expected_soc',
+        'expected_unmet_demand' and 'expected_excess_energy'. Also 'first_stage' ({'charge',
+        'discharge'} for the shared steps), 'scenario_unmet' (total per scenario), 'n_scenarios',
+        'status' and 'timings'
+    """
+    pv = np.atleast_2d(np.asarray(scenarios_kwh, dtype=float))
+    S, T = pv.shape
+    demand = np.broadcast_to(np.asarray(demand_kwh, dtype=float), (S, T))
+    if demand.shape[1] != T:
+        raise ValueError("Scenarios and demand must have same length")
+    if objective not in OBJECTIVE_WEIGHTS:
+        raise ValueError(f"Unknown objective: {objective}")
+    k = min(max(1, int(first_stage_steps)), T)
+    prob = np.full(S, 1.0 / S) if probabilities is None else np.asarray(probabilities, dtype=float) / np.sum(probabilities)
+    ch_max = charge_rate_max * step_hours
+    dis_max = discharge_rate_max * step_hours
+
+    timings = {}
+    with metrics.timer('stochastic_optimize_build'):
+        t0 = time.perf_counter()
+
+        # Layout: [ch shared (k) | dis shared (k) | ch (S*(T-k)) | dis (S*(T-k)) | soc | unmet | excess (S*T each)]
+        R = T - k
+        ST = S * T
+        o_ch1, o_dis1 = 0, k
+        o_ch2, o_dis2 = 2 * k, 2 * k + S * R
+        o_soc = 2 * k + 2 * S * R
+        o_unmet, o_exc = o_soc + ST, o_soc + 2 * ST
+        n = o_soc + 3 * ST
+
+        st = np.arange(ST)           # flat (s, t) index, scenario-major
+        s_of, t_of = st // T, st % T
+        first = t_of < k
+        ch_col = np.where(first, o_ch1 + t_of, o_ch2 + s_of * R + (t_of - k))
+        dis_col = np.where(first, o_dis1 + t_of, o_dis2 + s_of * R + (t_of - k))
+
+        # SOC dynamics: soc[s,t] - soc[s,t-1] - eff * ch[s,t] + dis[s,t] = soc0 if t == 0 else 0
+        prev = st[t_of > 0]
+        dyn_rows = np.concatenate([st, prev, st, st])
+        dyn_cols = np.concatenate([o_soc + st, o_soc + prev - 1, ch_col, dis_col])
+        dyn_vals = np.concatenate([np.ones(ST), -np.ones(len(prev)), np.full(ST, -roundtrip_eff), np.ones(ST)])
+        dyn_rhs = np.where(t_of == 0, float(initial_soc_kwh), 0.0)
+
+        # Balance: dis - ch + unmet - excess = demand - pv
+        bal_rows = ST + np.concatenate([st, st, st, st])
+        bal_cols = np.concatenate([dis_col, ch_col, o_unmet + st, o_exc + st])
+        bal_vals = np.concatenate([np.ones(ST), -np.ones(ST), np.ones(ST), -np.ones(ST)])
+
+        A_eq = sparse.csr_matrix(
+            (np.concatenate([dyn_vals, bal_vals]), (np.concatenate([dyn_rows, bal_rows]), np.concatenate([dyn_cols, bal_cols]))),
+            shape=(2 * ST, n))
+        b_eq = np.concatenate([dyn_rhs, (demand - pv).ravel()])
+
+        # Converter limit ch + dis <= max rate, once per distinct (ch, dis) pair
+        rows = st[~first | (s_of == 0)]
+        m = len(rows)
+        A_ub = sparse.csr_matrix(
+            (np.ones(2 * m), (np.concatenate([np.arange(m), np.arange(m)]), np.concatenate([ch_col[rows], dis_col[rows]]))),
+            shape=(m, n))
+        b_ub = np.full(m, max(ch_max, dis_max))
+
+        lower = np.zeros(n)
+        upper = np.full(n, np.inf)
+        upper[o_ch1:o_dis1 + k] = np.repeat([ch_max, dis_max], k)
+        upper[o_ch2:o_dis2] = ch_max
+        upper[o_dis2:o_soc] = dis_max
+        upper[o_soc:o_soc + ST] = battery_capacity_kwh
+
+        w_unmet, w_exc = OBJECTIVE_WEIGHTS[objective]
+        weight = prob[s_of]
+        c = np.zeros(n)
+        c[:o_soc] = THROUGHPUT_EPS
+        c[o_unmet:o_unmet + ST] = w_unmet * weight
+        c[o_exc:o_exc + ST] = w_exc * weight
+        timings['build_s'] = time.perf_counter() - t0
+
+    with metrics.timer('stochastic_optimize_solve'):
+        t0 = time.perf_counter()
+        res = linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq,
+                      bounds=np.column_stack([lower, upper]), method='highs')
+        timings['solve_s'] = time.perf_counter() - t0
+
+    if res.status != 0 or res.x is None:
+        metrics.count('stochastic_optimize_infeasible_total')
+        expected_pv = prob @ pv
+        expected_demand = prob @ demand
+        unmet = np.clip(expected_demand - expected_pv, 0, None).tolist()
+        excess = np.clip(expected_pv - expected_demand, 0, None).tolist()
+        return {
+            'charge': [0.0] * T,
+            'discharge': [0.0] * T,
+            'soc': [float(initial_soc_kwh)] * T,
+            'unmet_demand': unmet,
+            'excess_energy': excess,
+            'actions': ['Hold (optimization failed)'] * T,
+            'expected_charge': [0.0] * T,
+            'expected_discharge': [0.0] * T,
+            'expected_soc': [float(initial_soc_kwh)] * T,
+            'expected_unmet_demand': unmet,
+            'expected_excess_energy': excess,
+            'scenario': None,
+            'scenario_pv': expected_pv.tolist(),
+            'first_stage': {'charge': [0.0] * k, 'discharge': [0.0] * k},
+            'scenario_unmet': np.clip(demand - pv, 0, None).sum(axis=1).tolist(),
+            'n_scenarios': S,
+            'status': 'failed',
+            'timings': timings,
+        }
+
+    x = np.clip(res.x, 0.0, None)
+    charge = x[ch_col].reshape(S, T)
+    discharge = x[dis_col].reshape(S, T)
+    soc = x[o_soc:o_soc + ST].reshape(S, T)
+    unmet = x[o_unmet:o_unmet + ST].reshape(S, T)
+    excess = x[o_exc:o_exc + ST].reshape(S, T)
+    # The schedule to execute is one scenario's path: averaging paths mixes charge and discharge
+    # and gives an SOC trajectory no scenario follows
+    i = int(np.argmin(((pv - prob @ pv) ** 2).sum(axis=1)))
+    charge_vals = charge[i].tolist()
+    discharge_vals = discharge[i].tolist()
+    return {
+        'charge': charge_vals,
+        'discharge': discharge_vals,
+        'soc': soc[i].tolist(),
+        'unmet_demand': unmet[i].tolist(),
+        'excess_energy': excess[i].tolist(),
+        'actions': describe_actions(charge_vals, discharge_vals),
+        'expected_charge': (prob @ charge).tolist(),
+        'expected_discharge': (prob @ discharge).tolist(),
+        'expected_soc': (prob @ soc).tolist(),
+        'expected_unmet_demand': (prob @ unmet).tolist(),
+        'expected_excess_energy': (prob @ excess).tolist(),
+        'scenario': i,
+        'scenario_pv': pv[i].tolist(),
+        'first_stage': {'charge': x[o_ch1:o_ch1 + k].tolist(), 'discharge': x[o_dis1:o_dis1 + k].tolist()},
+        'scenario_unmet': unmet.sum(axis=1).tolist(),
+        'n_scenarios': S,
+        'status': 'success',
+        'timings': timings,
+    }
+
+
+def optimize_battery_schedule_stochastic(forecast_kwh, forecast_std, demand_kwh, n_scenarios=100,
+                                         correlation=0.7, seed=None, **kwargs):
+    """
+    Stochastic counterpart of optimize_battery_schedule taking forecast_hours' mean and std.
+
+    Extra keyword arguments go to optimize_stochastic_schedule.
+    """
+    if len(forecast_kwh) != len(demand_kwh):
+        raise ValueError("Forecast and demand must have same length")
+    scenarios = sample_scenarios(forecast_kwh, forecast_std, n_scenarios, correlation, seed)
+    return optimize_stochastic_schedule(scenarios, demand_kwh, **kwargs)
@@ -0,0 +1,267 @@
+"""
+Synthetic fleet-scale data for load, scaling and soak tests.
+
+Everything is vectorized over sites × time, so a fleet of hundreds of sites
+with a year of hourly data is generated in a few seconds.
+
+Usage:
+    python -m src.synthetic --sites 200 --days 365 --out synthetic_data
+    python -m src.synthetic --sites 50 --days 30 --forecast-rows 100000 --db synthetic.db
+"""
+import os
+import sqlite3
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from .solar import haurwitz_ghi
+
+log = logging.getLogger('amplifyai.synthetic')
+
+def _step_hours(freq):
+    return pd.Timedelta(pd.tseries.frequencies.to_offset(freq)).total_seconds() / 3600.0
+
+
+def generate_sites(n_sites=100, seed=42, lat_range=(8.0, 30.0), lon_range=(68.0, 90.0)):
+    """Random site metadata: location, PV capacity, battery size and base load."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'site_id': [f'site_{i:04d}' for i in range(n_sites)],
+        'lat': rng.uniform(*lat_range, n_sites).round(4),
+        'lon': rng.uniform(*lon_range, n_sites).round(4),
+        'capacity_kw': rng.uniform(3.0, 8.0, n_sites).round(2),
+        'battery_capacity_kwh': rng.choice([20.0, 30.0, 50.0, 100.0], n_sites),
+        'base_load_kw': rng.uniform(1.5, 5.0, n_sites).round(2),
+    })
+
+
+def clear_sky_ghi(lat, day_of_year, solar_hour):
+    """
+    Haurwitz clear-sky GHI from a simple declination/hour-angle solar model.
+
+    `lat` broadcasts against `day_of_year`/`solar_hour` (e.g. shape (sites, 1) vs (time,)).
+    Returns (ghi, cos_zenith), both clipped at zero at night.
+    """
+    decl = np.radians(23.45) * np.sin(2 * np.pi * (284 + day_of_year) / 365.0)
+    hour_angle = np.radians(15.0 * (solar_hour - 12.0))
+    phi = np.radians(lat)
+    cos_z = np.sin(phi) * np.sin(decl) + np.cos(phi) * np.cos(decl) * np.cos(hour_angle)
+    cos_z = np.clip(cos_z, 0.0, None)
+    return haurwitz_ghi(cos_z), cos_z
+
+
+def _ar1(rng, shape, phi, scale):
+    """AR(1) noise along the last axis, filtered in one call."""
+    noise = rng.normal(0.0, scale, shape)
+    return lfilter([1.0], [1.0, -phi], noise, axis=-1)
+
+
+def generate_weather(sites, start='2024-01-01', periods=8760, freq='h', seed=42):
+    """
+    Weather and production arrays for every site.
+
+    Returns (timestamps, arrays) where each array has shape (n_sites, periods):
+    ghi (W/m²), temp_c, cloud_pct, output_kwh (energy per step) and demand_kwh.
+    """
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range(start, periods=periods, freq=freq)
+    step_h = _step_hours(freq)
+    n = len(sites)
+
+    lat = sites['lat'].to_numpy()[:, None]
+    lon = sites['lon'].to_numpy()[:, None]
+    doy = ts.dayofyear.to_numpy()[None, :]
+    clock_h = (ts.hour + ts.minute / 60.0).to_numpy()[None, :]
+    # Local solar time from longitude; timestamps are treated as UTC+5:30 local clock
+    solar_hour = (clock_h + (lon - 82.5) / 15.0) % 24
+
+    clear, _ = clear_sky_ghi(lat, doy, solar_hour)
+
+    # Cloud cover: seasonal monsoon bump plus persistent AR(1) weather systems
+    season = 0.5 + 0.5 * np.sin(2 * np.pi * (doy - 100) / 365.0)
+    latent = -0.8 + 1.6 * season + _ar1(rng, (n, periods), phi=0.97 ** step_h, scale=0.35 * np.sqrt(step_h))
+    cloud = 100.0 / (1.0 + np.exp(-latent))
+
+    # Kasten–Czeplak cloud attenuation
+    ghi = clear * (1.0 - 0.75 * (cloud / 100.0) ** 3.4)
+
+    temp_mean = 26.0 - 0.3 * (lat - 15.0) + 5.0 * np.sin(2 * np.pi * (doy - 80) / 365.0)
+    diurnal = 5.0 * np.cos(2 * np.pi * (solar_hour - 15.0) / 24.0)
+    temp = temp_mean + diurnal * (1.0 - 0.4 * cloud / 100.0) + _ar1(rng, (n, periods), 0.9, 0.4)
+
+    capacity = sites['capacity_kw'].to_numpy()[:, None]
+    cell_temp = temp + ghi / 800.0 * 20.0
+    derate = 1.0 - 0.004 * (cell_temp - 25.0)
+    output = np.clip(capacity * ghi / 1000.0 * derate * 0.85, 0.0, None) * step_h
+
+    base = sites['base_load_kw'].to_numpy()[:, None]
+    weekday = ts.dayofweek.to_numpy()[None, :]
+    morning = np.exp(-0.5 * ((clock_h - 7.5) / 1.5) ** 2)
+    evening = np.exp(-0.5 * ((clock_h - 19.5) / 2.0) ** 2)
+    weekend = np.where(weekday >= 5, 1.1, 1.0)
+    load_kw = base * weekend * (0.6 + 0.5 * morning + 0.9 * evening) * np.exp(_ar1(rng, (n, periods), 0.8, 0.05))
+    demand = load_kw * step_h
+
+    arrays = {
+        'ghi': ghi.astype(np.float32),
+        'temp_c': temp.astype(np.float32),
+        'cloud_pct': cloud.astype(np.float32),
+        'output_kwh': output.astype(np.float32),
+        'demand_kwh': demand.astype(np.float32),
+    }
+    return ts, arrays
+
+
+def generate_fleet(n_sites=100, start='2024-01-01', periods=8760, freq='h', seed=42, sites=None):
+    """
+    Long-format fleet table with the training columns used throughout AmplifyAI.
+
+    Columns: site_id, timestamp, hour, ghi, temp_c, cloud_pct, output_kwh, demand_kwh.
+    """
+    if sites is None:
+        sites = generate_sites(n_sites, seed)
+    ts, arrays = generate_weather(sites, start, periods, freq, seed)
+    n = len(sites)
+    df = pd.DataFrame({
+        'site_id': pd.Categorical(np.repeat(sites['site_id'].to_numpy(), len(ts))),
+        'timestamp': np.tile(ts.to_numpy(), n),
+        'hour': np.tile(ts.hour.to_numpy(), n).astype(np.int8),
+    })
+    for name, values in arrays.items():
+        df[name] = values.ravel()
+    return df
+
+
+def generate_site_frame(n_rows=200, start='2024-06-01', freq='h', seed=42):
+    """Single-site training frame in the `solar_sample.csv` column layout."""
+    df = generate_fleet(1, start=start, periods=n_rows, freq=freq, seed=seed)
+    return df[['hour', 'ghi', 'temp_c', 'cloud_pct', 'output_kwh']].astype(
+        {'ghi': float, 'temp_c': float, 'cloud_pct': float, 'output_kwh': float})
+
+
+def generate_telemetry(n_sites=10, start='2024-06-01 12:00:00', seconds=600, seed=42, sites=None):
+    """
+    1-second inverter and BMS telemetry bursts.
+
+    Returns {'inverter': DataFrame, 'bms': DataFrame}, each in long format with
+    the same fields as the sensor readers (`pv_power_kw`, `soc_kwh`, ...).
+    """
+    rng = np.random.default_rng(seed)
+    if sites is None:
+        sites = generate_sites(n_sites, seed)
+    n = len(sites)
+    ts = pd.date_range(start, periods=seconds, freq='s')
+    minute_ts, arrays = generate_weather(sites, ts[0].floor('h'), int(np.ceil(seconds / 60.0)) + 61, 'min', seed)
+
+    offset = int((ts[0] - minute_ts[0]).total_seconds())
+    idx = (offset + np.arange(seconds)) / 60.0
+    lo = np.floor(idx).astype(int)
+    frac = idx - lo
+    ghi = arrays['ghi'][:, lo] * (1 - frac) + arrays['ghi'][:, lo + 1] * frac
+    demand_kw = (arrays['demand_kwh'][:, lo] * 60.0)
+
+    capacity = sites['capacity_kw'].to_numpy()[:, None]
+    pv_kw = np.clip(capacity * ghi / 1000.0 * 0.85 + _ar1(rng, (n, seconds), 0.95, 0.02), 0.0, None)
+    battery_kw = np.clip(pv_kw - demand_kw, -5.0, 5.0)
+    cap = sites['battery_capacity_kwh'].to_numpy()[:, None]
+    soc = np.clip(cap * rng.uniform(0.3, 0.7, (n, 1)) + np.cumsum(battery_kw, axis=1) / 3600.0, 0.0, cap)
+    voltage = 48.0 + 4.0 * soc / cap + rng.normal(0, 0.05, (n, seconds))
+    current = battery_kw * 1000.0 / voltage
+
+    site_col = pd.Categorical(np.repeat(sites['site_id'].to_numpy(), seconds))
+    ts_col = np.tile(ts.to_numpy(), n)
+    inverter = pd.DataFrame({
+        'site_id': site_col, 'ts': ts_col,
+        'pv_power_kw': pv_kw.ravel().astype(np.float32),
+        'pv_voltage': (380.0 + 40.0 * pv_kw / capacity + rng.normal(0, 1.0, (n, seconds))).ravel().astype(np.float32),
+    })
+    bms = pd.DataFrame({
+        'site_id': site_col, 'ts': ts_col,
+        'soc_kwh': soc.ravel().astype(np.float32),
+        'voltage': voltage.ravel().astype(np.float32),
+        'current': current.ravel().astype(np.float32),
+        'temp_c': (28.0 + 0.05 * np.abs(current) + rng.normal(0, 0.2, (n, seconds))).ravel().astype(np.float32),
+    })
+    return {'inverter': inverter, 'bms': bms}
+
+
+def prefill_forecast_history(n_rows=10000, db_path=None, horizon=24, seed=42, start='2024-01-01'):
+    """Bulk-insert synthetic rows into `forecast_history` (one transaction, executemany)."""
+    from . import db
+    from .codec import encode_forecast
+    db_path = db_path or db.DB_PATH
+    db.init_db(db_path)
+
+    rng = np.random.default_rng(seed)
+    hours = (np.arange(horizon) + 6) % 24
+    shape = np.clip(np.sin((hours - 6) * np.pi / 12), 0, None)
+    means = (shape[None, :] * rng.uniform(2.0, 6.0, (n_rows, 1))).round(4)
+    stds = (0.15 * means + 0.1).round(4)
+    mse = rng.uniform(0.001, 0.05, n_rows)
+    models = rng.choice(['linear', 'arima'], n_rows)
+    t0 = datetime.fromisoformat(start)
+    hours_list = hours.tolist()
+
+    def rows():
+        for i in range(n_rows):
+            stamp = (t0 + timedelta(hours=i)).isoformat()
+            payload = encode_forecast({'hours': hours_list, 'mean': means[i], 'std': stds[i]})
+            yield (stamp, 15.3647, 75.1234, str(models[i]), payload, float(mse[i]), stamp)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executemany('''INSERT INTO forecast_history
+                            (timestamp, location_lat, location_lon, model_used, payload, mse, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)''', rows())
+        conn.commit()
+    finally:
+        conn.close()
+    return n_rows
+
+
+def write_dataset(out_dir, n_sites=100, days=365, freq='h', seed=42, per_site_csv=False):
+    """Write a fleet dataset to `out_dir` (sites.csv plus fleet.parquet, or fleet.csv without pyarrow)."""
+    os.makedirs(out_dir, exist_ok=True)
+    sites = generate_sites(n_sites, seed)
+    periods = int(days * 24 / _step_hours(freq))
+    fleet = generate_fleet(start='2024-01-01', periods=periods, freq=freq, seed=seed, sites=sites)
+    sites.to_csv(os.path.join(out_dir, 'sites.csv'), index=False)
+    try:
+        fleet.to_parquet(os.path.join(out_dir, 'fleet.parquet'), index=False)
+    except ImportError:
+        fleet.to_csv(os.path.join(out_dir, 'fleet.csv'), index=False)
+    if per_site_csv:
+        site_dir = os.path.join(out_dir, 'sites')
+        os.makedirs(site_dir, exist_ok=True)
+        for site_id, group in fleet.groupby('site_id', observed=True):
+            group.drop(columns='site_id').to_csv(os.path.join(site_dir, f'{site_id}.csv'), index=False)
+    return fleet
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic AmplifyAI fleet data')
+    parser.add_argument('--sites', type=int, default=100)
+    parser.add_argument('--days', type=float, default=365)
+    parser.add_argument('--freq', default='h', help="Step size as a pandas offset (default: 'h')")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help='Directory for sites.csv and the fleet table')
+    parser.add_argument('--per-site-csv', action='store_true', help='Also write one training CSV per site')
+    parser.add_argument('--forecast-rows', type=int, default=0, help='Rows to prefill into forecast_history')
+    parser.add_argument('--db', help='SQLite file for --forecast-rows (default: amplifyai.db)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.out:
+        fleet = write_dataset(args.out, args.sites, args.days, args.freq, args.seed, args.per_site_csv)
+        log.info(f'Wrote {len(fleet):,} rows for {args.sites} sites to {args.out}')
+    if args.forecast_rows:
+        prefill_forecast_history(args.forecast_rows, args.db, seed=args.seed)
+        log.info(f'Inserted {args.forecast_rows:,} forecast_history rows')
+
+
+if __name__ == '__main__':
+    main()
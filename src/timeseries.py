@@ -0,0 +1,132 @@
+"""
+Resolution-agnostic time axis helpers.
+
+Datasets carry a real `timestamp` column; `hour` is kept as the (fractional)
+hour-of-day model feature derived from it. Legacy frames that only have an
+integer `hour` get timestamps synthesized by rolling the day over whenever the
+hour wraps.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_STEP = pd.Timedelta(hours=1)
+
+# Columns that are energy per step (summed when coarsening, split when refining);
+# everything else numeric is an intensive quantity (averaged / interpolated).
+ENERGY_COLUMNS = ('output_kwh', 'demand_kwh', 'load_kwh')
+
+
+def to_step(step):
+    """Normalize '15min', '1h', minutes (int) or a Timedelta to a Timedelta."""
+    if step is None:
+        return DEFAULT_STEP
+    if isinstance(step, pd.Timedelta):
+        return step
+    if isinstance(step, (int, float, np.integer, np.floating)):
+        return pd.Timedelta(minutes=float(step))
+    return pd.Timedelta(pd.tseries.frequencies.to_offset(step))
+
+
+def step_hours(step):
+    return to_step(step).total_seconds() / 3600.0
+
+
+def hour_of_day(ts):
+    """Fractional hour-of-day for a DatetimeIndex / Series / Timestamp."""
+    if isinstance(ts, pd.Timestamp):
+        return ts.hour + ts.minute / 60.0
+    ts = pd.DatetimeIndex(ts)
+    return (ts.hour + ts.minute / 60.0).to_numpy()
+
+
+def ensure_timestamps(df, anchor=None):
+    """
+    Return a copy of `df` sorted by a datetime `timestamp` column, with `hour` derived from it.
+
+    Frames without `timestamp` are anchored at `anchor` (default: today 00:00) and a
+    new day starts every time `hour` fails to increase.
+    """
+    df = df.copy()
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+        hours = hour_of_day(df['timestamp'])
+        df['hour'] = hours.astype(int) if np.all(hours == np.floor(hours)) else hours
+        return df
+
+    anchor = pd.Timestamp(anchor).normalize() if anchor is not None else pd.Timestamp.now().normalize()
+    hours = df['hour'].to_numpy(dtype=float)
+    day = np.concatenate([[0], np.cumsum(np.diff(hours) <= 0)])
+    df['timestamp'] = anchor + pd.to_timedelta(day * 24.0 + hours, unit='h')
+    return df
+
+
+def infer_step(df_or_ts):
+    """Median spacing of the timestamps (1 hour if it cannot be inferred)."""
+    if isinstance(df_or_ts, pd.DataFrame):
+        if 'timestamp' not in df_or_ts.columns:
+            return DEFAULT_STEP
+        df_or_ts = df_or_ts['timestamp']
+    ts = pd.DatetimeIndex(pd.to_datetime(df_or_ts))
+    if len(ts) < 2:
+        return DEFAULT_STEP
+    diffs = np.diff(ts.to_numpy(dtype='datetime64[ns]').astype(np.int64))
+    diffs = diffs[diffs > 0]
+    if len(diffs) == 0:
+        return DEFAULT_STEP
+    return pd.Timedelta(int(np.median(diffs)), unit='ns')
+
+
+def future_index(last_ts, n_steps, step):
+    """The `n_steps` timestamps following `last_ts`."""
+    return pd.Timestamp(last_ts) + pd.to_timedelta(np.arange(1, n_steps + 1) * to_step(step).value, unit='ns')
+
+
+def horizon_steps(n_hours, step):
+    """Number of steps covering `n_hours` at the given resolution (at least 1)."""
+    return max(1, int(round(n_hours / step_hours(step))))
+
+
+def resample(df, step, by=None, energy_columns=ENERGY_COLUMNS):
+    """
+    Resample a timestamped frame to `step`, per group when `by` is given.
+
+    Coarsening sums energy columns and averages the rest. Refining interpolates
+    intensive columns in time and splits energy columns evenly across sub-steps.
+    """
+    step = to_step(step)
+    df = ensure_timestamps(df)
+    if by is not None:
+        parts = [resample(g.drop(columns=by), step, None, energy_columns).assign(**{by: key})
+                 for key, g in df.groupby(by, observed=True, sort=False)]
+        return pd.concat(parts, ignore_index=True) if parts else df.iloc[0:0]
+
+    src_step = infer_step(df)
+    frame = df.set_index('timestamp').drop(columns=['hour'], errors='ignore')
+    frame = frame.select_dtypes(include='number')
+    energy = [c for c in frame.columns if c in energy_columns]
+    intensive = [c for c in frame.columns if c not in energy_columns]
+
+    if step >= src_step:
+        binned = frame.resample(step, label='left', closed='left')
+        parts = []
+        if intensive:
+            parts.append(binned[intensive].mean())
+        if energy:
+            parts.append(binned[energy].sum(min_count=1))
+        out = pd.concat(parts, axis=1)[frame.columns].dropna(how='all')
+    else:
+        ratio = src_step / step
+        grid = pd.date_range(frame.index[0], frame.index[-1] + src_step - step, freq=step)
+        out = pd.DataFrame(index=grid)
+        if intensive:
+            out[intensive] = frame[intensive].reindex(grid.union(frame.index)).interpolate(
+                method='time', limit_area='inside').ffill().reindex(grid)
+        if energy:
+            out[energy] = frame[energy].reindex(grid, method='ffill') / ratio
+        out = out[frame.columns]
+
+    out = out.rename_axis('timestamp').reset_index()
+    hours = hour_of_day(out['timestamp'])
+    out['hour'] = hours.astype(int) if np.all(hours == np.floor(hours)) else hours
+    return out
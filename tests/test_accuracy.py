@@ -0,0 +1,90 @@
+import sys
+import os
+import json
+import sqlite3
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from src import db
+from src.accuracy import record_actuals, load_accuracy, actuals_from_power
+from src.modeling import train_simple_regressor, forecast_hours
+from src.synthetic import generate_site_frame
+from src.timeseries import ensure_timestamps
+
+FEATURES = ['hour', 'ghi', 'temp_c', 'cloud_pct']
+LAT, LON = 15.3647, 75.1234
+
+def _use_temp_db():
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'accuracy.db')
+
+def _forecast(df, origin, n_hours=24, model='linear'):
+    model_obj, mse = train_simple_regressor(df, FEATURES, 'output_kwh')
+    fc = forecast_hours(model_obj, df.iloc[:origin], FEATURES, n_hours=n_hours)
+    return db.insert_forecast(LAT, LON, model, fc, mse), fc
+
+def test_actuals_fill_forecast_and_rollup():
+    """Test realized output is joined to stored forecasts and aggregated per step"""
+    saved = db.DB_PATH
+    _use_temp_db()
+    try:
+        df = ensure_timestamps(generate_site_frame(120, seed=4))
+        row_id, fc = _forecast(df, 48)
+        assert row_id is not None
+
+        assert record_actuals(LAT, LON, df.iloc[48:60]) == 12
+        assert record_actuals(LAT, LON, df.iloc[40:80]) == 12  # only the 12 new steps count
+        assert record_actuals(LAT, LON, df) == 0
+
+        conn = sqlite3.connect(db.DB_PATH)
+        actual_json, matched = conn.execute('SELECT actual_json, matched_steps FROM forecast_history WHERE id = ?',
+                                            (row_id,)).fetchone()
+        conn.close()
+        assert matched == 24
+        actual = np.array(json.loads(actual_json), dtype=float)
+        assert np.allclose(actual, df['output_kwh'].iloc[48:72])
+
+        err = np.array(fc['mean']) - df['output_kwh'].iloc[48:72].to_numpy()
+        by_step = load_accuracy()
+        assert len(by_step) == 24
+        assert np.allclose([r['bias'] for r in by_step], err, atol=1e-5)  # forecasts are stored as float32
+        total = load_accuracy(by_step=False)[0]
+        assert total['n'] == 24
+        assert np.isclose(total['mae'], np.abs(err).mean())
+        assert np.isclose(total['rmse'], np.sqrt((err ** 2).mean()))
+        print("✓ Forecast/actual join and rollup test passed")
+    finally:
+        db.DB_PATH = saved
+
+def test_rollup_filters_by_model_and_location():
+    """Test rollups are kept per model and location, and other locations are untouched"""
+    saved = db.DB_PATH
+    _use_temp_db()
+    try:
+        df = ensure_timestamps(generate_site_frame(120, seed=5))
+        _forecast(df, 48, model='linear')
+        _forecast(df, 48, model='gbm')
+        assert record_actuals(LAT + 1, LON, df) == 0
+        assert record_actuals(LAT, LON, df) == 48
+        assert {r['model'] for r in load_accuracy(by_step=False)} == {'linear', 'gbm'}
+        assert all(r['model'] == 'gbm' for r in load_accuracy(model='gbm'))
+        assert load_accuracy(lat=LAT + 1, lon=LON) == []
+        print("✓ Accuracy filter test passed")
+    finally:
+        db.DB_PATH = saved
+
+def test_actuals_from_power_telemetry():
+    """Test 1-second inverter power becomes hourly energy"""
+    ts = pd.date_range('2024-06-01 10:00', periods=7200, freq='s')
+    readings = pd.DataFrame({'timestamp': ts, 'pv_power_kw': np.r_[np.full(3600, 2.0), np.full(3600, 4.0)]})
+    energy = actuals_from_power(readings, step='1h')
+    assert list(energy['output_kwh']) == [2.0, 4.0]
+    assert energy['timestamp'].iloc[0] == pd.Timestamp('2024-06-01 10:00')
+    print("✓ Telemetry to energy test passed")
+
+if __name__ == '__main__':
+    test_actuals_fill_forecast_and_rollup()
+    test_rollup_filters_by_model_and_location()
+    test_actuals_from_power_telemetry()
+    print("\n✅ All accuracy tests passed!")
@@ -0,0 +1,70 @@
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from src.backtest import run_backtest, DaySolveCache, format_report
+from src.optimizer import simple_battery_opt
+from src.synthetic import generate_fleet
+
+def test_rule_backtest_accounts_energy():
+    """Test the rule policy's energy balance per site"""
+    history = generate_fleet(5, periods=24 * 30)
+    report = run_backtest(history, 'rule')
+    assert set(report['sites']) == set(history['site_id'].unique())
+    for site_id, r in report['sites'].items():
+        g = history[history['site_id'] == site_id]
+        deficit = np.clip(g['demand_kwh'] - g['output_kwh'], 0, None).sum()
+        assert 0 <= r['unmet_kwh'] <= deficit + 1e-6
+        assert r['curtailed_kwh'] >= -1e-6
+        assert 0 <= r['served_pct'] <= 100
+    assert report['solves'] == 0
+    print("✓ Rule backtest energy accounting test passed")
+
+def test_rule_backtest_matches_scalar_replay():
+    """Test the fleet replay equals stepping simple_battery_opt hour by hour"""
+    history = generate_fleet(1, periods=72, seed=3)
+    battery = {'battery_capacity_kwh': 30, 'initial_soc_kwh': 10, 'roundtrip_eff': 1.0,
+               'charge_rate_max': 1e9, 'discharge_rate_max': 1e9}
+    report = run_backtest(history, 'rule', battery=battery)
+    soc, throughput = 10.0, 0.0
+    for pv, demand in zip(history['output_kwh'], history['demand_kwh']):
+        step = simple_battery_opt(pv, demand, battery_capacity_kwh=30, soc_kwh=soc)
+        soc += step['charge_kwh'] - step['discharge_kwh']
+        throughput += step['charge_kwh'] + step['discharge_kwh']
+    assert np.isclose(report['totals']['throughput_kwh'], throughput)
+    print("✓ Rule backtest replay test passed")
+
+def test_lp_backtest_caches_day_solves():
+    """Test the rolling LP runs in parallel, beats no battery and reuses cached day solves"""
+    history = generate_fleet(3, periods=24 * 7)
+    path = os.path.join(tempfile.mkdtemp(), 'solves.pkl')
+    first = run_backtest(history, 'lp', engine='sparse', max_workers=3, cache=DaySolveCache(path))
+    assert first['solves'] == 3 * 7 and first['cache_hits'] == 0
+    deficit = np.clip(history['demand_kwh'] - history['output_kwh'], 0, None).sum()
+    assert first['totals']['unmet_kwh'] < deficit
+    assert first['totals']['throughput_kwh'] > 0
+
+    second = run_backtest(history, 'lp', engine='sparse', cache=DaySolveCache(path))
+    assert second['solves'] == 0 and second['cache_hits'] == 3 * 7
+    assert np.isclose(second['totals']['unmet_kwh'], first['totals']['unmet_kwh'])
+    assert 'lp' in format_report([first, second])
+    print("✓ LP backtest cache test passed")
+
+def test_lp_backtest_with_forecast_error():
+    """Test planning on a noisy forecast serves no more than perfect foresight"""
+    history = generate_fleet(2, periods=24 * 5, seed=9)
+    rng = np.random.default_rng(0)
+    history['forecast_kwh'] = history['output_kwh'] * rng.uniform(0.3, 1.7, len(history))
+    perfect = run_backtest(history, 'lp', engine='sparse')
+    noisy = run_backtest(history, 'lp', engine='sparse', forecast_col='forecast_kwh')
+    assert noisy['totals']['unmet_kwh'] >= perfect['totals']['unmet_kwh'] - 1e-6
+    print("✓ LP backtest forecast error test passed")
+
+if __name__ == '__main__':
+    test_rule_backtest_accounts_energy()
+    test_rule_backtest_matches_scalar_replay()
+    test_lp_backtest_caches_day_solves()
+    test_lp_backtest_with_forecast_error()
+    print("\n✅ All backtest tests passed!")
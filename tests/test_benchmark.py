@@ -0,0 +1,45 @@
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import db
+from src.benchmark import run_suite, compare, format_results
+
+def test_quick_suite_reports_metrics():
+    """Test that a quick run reports wall time, peak memory and throughput"""
+    run = run_suite(['parse_csv_upload', 'forecast_hours'], quick=True, repeat=1)
+    for name in ('parse_csv_upload', 'forecast_hours'):
+        metrics = next(iter(run['results'][name].values()))
+        assert metrics['wall_s'] > 0
+        assert metrics['peak_mem_kb'] > 0
+        assert metrics['throughput'] > 0
+    assert 'parse_csv_upload' in format_results(run)
+    print("✓ Quick suite test passed")
+
+def test_db_cases_use_temp_database():
+    """Test that storage benchmarks never write through the process-wide database path"""
+    saved = db.DB_PATH
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'app.db')
+    try:
+        run_suite(['insert_forecast', 'history_view'], quick=True, repeat=1)
+        assert not os.path.exists(db.DB_PATH)
+    finally:
+        db.DB_PATH = saved
+    print("✓ Temp database test passed")
+
+def test_compare_flags_regressions():
+    """Test regression detection against a baseline"""
+    baseline = {'results': {'forecast_hours': {'24': {'wall_s': 0.010}, '168': {'wall_s': 0.050}}}}
+    current = {'results': {'forecast_hours': {'24': {'wall_s': 0.011}, '168': {'wall_s': 0.080}}}}
+    regressions = compare(current, baseline, tolerance=0.25)
+    assert len(regressions) == 1
+    assert regressions[0][0] == 'forecast_hours'
+    assert regressions[0][1] == '168'
+    print("✓ Regression comparison test passed")
+
+if __name__ == '__main__':
+    test_quick_suite_reports_metrics()
+    test_db_cases_use_temp_database()
+    test_compare_flags_regressions()
+    print("\n✅ All benchmark tests passed!")
@@ -0,0 +1,83 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from src.sensors.cleaning import SensorCleaner, TelemetryCleaner, FLAG_FILLED
+from src.synthetic import generate_telemetry
+
+def _series(n=600, seed=0):
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range('2024-06-01 12:00', periods=n, freq='s')
+    return ts, 5.0 + np.cumsum(rng.normal(0, 0.02, n))
+
+def test_chunked_matches_streaming():
+    """Test chunked and one-at-a-time cleaning reject the same readings and end in the same state"""
+    ts, x = _series()
+    x[200] = 40.0    # spike
+    x[300] = -1.0    # out of range
+    streaming, chunked = SensorCleaner(0, 100), SensorCleaner(0, 100)
+    statuses = [streaming.push(t, v) for t, v in zip(ts, x)]
+    for lo in range(0, len(x), 128):
+        chunked.process(ts[lo:lo + 128], x[lo:lo + 128])
+    assert statuses[200] == 'spike' and statuses[300] == 'out_of_range'
+    for key in ('accepted', 'spike', 'out_of_range'):
+        assert streaming.counts[key] == chunked.counts[key]
+    assert np.isclose(streaming.mean, chunked.mean) and np.isclose(streaming.var, chunked.var)
+    print("✓ Chunked vs streaming cleaning test passed")
+
+def test_duplicates_gaps_and_outages():
+    """Test duplicate drop, short-gap fill and long-gap outage reporting across chunks"""
+    ts, x = _series(400)
+    keep = np.ones(400, dtype=bool)
+    keep[100:105] = False     # 5 s gap: filled
+    keep[250:350] = False     # 100 s gap: outage
+    cleaner = SensorCleaner(0, 100, max_fill_s=30)
+    first = cleaner.process(ts[:200][keep[:200]], x[:200][keep[:200]])
+    stamps = np.concatenate([ts[190:200], ts[200:][keep[200:]]])     # overlap replays 10 readings
+    values = np.concatenate([x[190:200], x[200:][keep[200:]]])
+    second = cleaner.process(stamps[::-1], values[::-1])             # order does not matter
+
+    assert len(first['value']) == 200 and (first['flag'] == FLAG_FILLED).sum() == 5
+    filled = first['flag'] == FLAG_FILLED
+    assert np.allclose(first['value'][filled], np.interp(ts[100:105].asi8, ts[keep].asi8, x[keep]))
+    assert second['rejected']['duplicate'] == 10
+    assert second['outages'] == [(ts[249], ts[350])]
+    assert len(second['value']) == 100 and np.all(np.diff(second['timestamp']) > np.timedelta64(0))
+    print("✓ Duplicates, gaps and outages test passed")
+
+def test_level_shift_is_accepted():
+    """Test a genuine step change is rejected at most briefly, not locked out"""
+    ts, x = _series(300)
+    x[150:] += 3.0
+    cleaner = SensorCleaner(0, 100)
+    statuses = [cleaner.push(t, v) for t, v in zip(ts, x)]
+    assert statuses[150:].count('spike') <= 10
+    assert all(s == 'ok' for s in statuses[160:])
+    print("✓ Level shift test passed")
+
+def test_clean_reading_and_frame():
+    """Test reading validation and fleet frame cleaning"""
+    cleaner = TelemetryCleaner()
+    reading = {'ts': '2024-06-01T12:00:00', 'pv_power_kw': 2.5, 'pv_voltage': 9000.0, 'source': 'x'}
+    cleaned = cleaner.clean_reading('inv', reading)
+    assert cleaned['pv_power_kw'] == 2.5 and cleaned['pv_voltage'] is None
+    assert cleaned['flags'] == {'pv_voltage': 'out_of_range'}
+    assert cleaner.clean_reading('inv', {**reading, 'pv_power_kw': 3.0}) is cleaned
+
+    telemetry = generate_telemetry(n_sites=5, seconds=300)['inverter']
+    telemetry = pd.concat([telemetry, telemetry.iloc[:50]]).sample(frac=1.0, random_state=0)
+    telemetry = telemetry[telemetry['ts'] != pd.Timestamp('2024-06-01 12:01:00')]
+    frame, outages = TelemetryCleaner().clean_frame(telemetry)
+    assert len(frame) == 5 * 300 and not outages
+    assert frame['pv_power_kw_filled'].sum() >= 5
+    assert frame.groupby('site_id', observed=True)['ts'].is_monotonic_increasing.all()
+    print("✓ Reading and frame cleaning test passed")
+
+if __name__ == '__main__':
+    test_chunked_matches_streaming()
+    test_duplicates_gaps_and_outages()
+    test_level_shift_is_accepted()
+    test_clean_reading_and_frame()
+    print("\n✅ All cleaning tests passed!")
@@ -0,0 +1,117 @@
+import sys
+import os
+import json
+import sqlite3
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from src import db
+from src.codec import encode_forecast, decode_forecast, encode_schedule, decode_schedule, is_encoded
+from src.multi_hour_optimizer import optimize_battery_schedule
+
+def _forecast(n=48, freq='15min'):
+    stamps = pd.date_range('2024-03-01 06:00', periods=n, freq=freq)
+    rng = np.random.default_rng(0)
+    return {
+        'hours': [h + m / 60.0 for h, m in zip(stamps.hour, stamps.minute)],
+        'timestamps': [ts.isoformat() for ts in stamps],
+        'mean': rng.uniform(0, 5, n).tolist(),
+        'std': rng.uniform(0, 1, n).tolist(),
+        'step_minutes': stamps.freq.nanos / 60e9,
+    }
+
+def test_forecast_round_trip():
+    """Test forecasts survive encoding and shrink well below their JSON size"""
+    forecast = _forecast()
+    blob = encode_forecast(forecast)
+    assert is_encoded(blob)
+    assert len(blob) * 4 < len(json.dumps(forecast))
+
+    decoded = decode_forecast(blob, as_lists=True)
+    assert decoded['timestamps'] == forecast['timestamps']
+    assert decoded['hours'] == forecast['hours']
+    assert decoded['step_minutes'] == forecast['step_minutes']
+    assert np.allclose(decoded['mean'], forecast['mean'], rtol=1e-6)
+
+    arrays = decode_forecast(blob)
+    assert arrays['mean'].dtype == np.float32 and not arrays['mean'].flags.writeable
+    assert arrays['timestamps'][0] == np.datetime64('2024-03-01T06:00:00')
+    print("✓ Forecast round-trip test passed")
+
+def test_forecast_without_regular_axis():
+    """Test hour-only and irregular forecasts keep their fields verbatim"""
+    hour_only = {'hours': [12, 13, 14], 'mean': [5.0, 6.0, 5.5], 'std': [0.5, 0.6, 0.5]}
+    decoded = decode_forecast(encode_forecast(hour_only), as_lists=True)
+    assert decoded.keys() == hour_only.keys() and decoded['hours'] == hour_only['hours']
+    assert np.allclose(decoded['std'], hour_only['std'])
+
+    irregular = _forecast(3)
+    irregular['timestamps'][2] = '2024-03-01T09:00:00'
+    decoded = decode_forecast(encode_forecast(irregular), as_lists=True)
+    assert decoded['timestamps'] == irregular['timestamps']
+    print("✓ Irregular forecast test passed")
+
+def test_schedule_actions_derived():
+    """Test schedule actions are regenerated on decode, including the failed placeholder"""
+    schedule = optimize_battery_schedule([0, 2, 8, 8, 1, 0], [3.0] * 6)
+    decoded = decode_schedule(encode_schedule(schedule))
+    assert decoded['actions'] == schedule['actions']
+    assert decoded['status'] == 'success'
+    assert np.allclose(decoded['soc'], schedule['soc'], atol=1e-4)
+
+    failed = {'charge': [0.0] * 3, 'discharge': [0.0] * 3, 'actions': ['Hold (optimization failed)'] * 3,
+              'status': 'failed'}
+    assert decode_schedule(encode_schedule(failed), as_lists=True) == failed
+
+    try:
+        decode_forecast(encode_schedule(schedule))
+        assert False, "schedule payload decoded as a forecast"
+    except ValueError:
+        pass
+    print("✓ Schedule actions test passed")
+
+def test_db_reads_binary_and_legacy_rows():
+    """Test storage writes binary payloads and still reads rows stored as JSON"""
+    saved = db.DB_PATH
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'codec.db')
+    try:
+        legacy = {'hours': [1, 2], 'mean': [1.5, 2.5], 'std': [0.1, 0.2]}
+        db.init_db()
+        conn = sqlite3.connect(db.DB_PATH)
+        conn.execute('INSERT INTO forecast_history (model_used, forecast_json, created_at) VALUES (?, ?, ?)',
+                     ('linear', json.dumps(legacy), '2000-01-01T00:00:00'))
+        conn.execute('INSERT INTO battery_schedule_history (schedule_json, summary_json, created_at) VALUES (?, ?, ?)',
+                     (json.dumps({'charge': [1.0]}), '{}', '2000-01-01T00:00:00'))
+        conn.commit()
+        conn.close()
+
+        forecast = _forecast(24, 'h')
+        db.insert_forecast(15.36, 75.12, 'gbm', forecast, 0.01)
+        schedule = optimize_battery_schedule([4.0] * 6, [3.0] * 6)
+        db.insert_schedule(6, 'balanced', schedule, {'total_charge': 1.0})
+
+        conn = sqlite3.connect(db.DB_PATH)
+        assert conn.execute("SELECT forecast_json FROM forecast_history WHERE model_used = 'gbm'").fetchone()[0] is None
+        conn.close()
+
+        newest, oldest = db.load_recent_forecasts(2)
+        assert np.allclose(newest['forecast']['mean'], forecast['mean'], rtol=1e-6)
+        assert isinstance(newest['forecast']['mean'], list) and isinstance(newest['forecast']['timestamps'][0], str)
+        assert oldest['forecast'] == legacy
+        assert isinstance(db.load_recent_forecasts(1, as_lists=False)[0]['forecast']['mean'], np.ndarray)
+        schedules = db.load_recent_schedules(2)
+        assert schedules[0]['schedule']['actions'] == schedule['actions']
+        assert isinstance(schedules[0]['schedule']['soc'], list)
+        assert schedules[1]['schedule'] == {'charge': [1.0]}
+    finally:
+        db.DB_PATH = saved
+    print("✓ Binary and legacy storage test passed")
+
+if __name__ == '__main__':
+    test_forecast_round_trip()
+    test_forecast_without_regular_axis()
+    test_schedule_actions_derived()
+    test_db_reads_binary_and_legacy_rows()
+    print("\n✅ All codec tests passed!")
@@ -0,0 +1,91 @@
+import sys
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from src import data_fetcher
+from src.data_fetcher import PowerFetcher, power_cell, cell_point
+
+def _fake_upstream(delay=0.1, fail=False):
+    """Stand-in for the POWER API: records every request and returns one sunny day."""
+    calls = []
+    lock = threading.Lock()
+
+    def request(lat, lon, start, end):
+        with lock:
+            calls.append((lat, lon, start, end))
+        time.sleep(delay)
+        if fail:
+            return None
+        keys = [f'{start}{h:02d}' for h in range(24)]
+        ghi = {k: max(0.0, 900.0 * np.sin(np.pi * (h - 6) / 12)) for h, k in enumerate(keys)}
+        return {'ALLSKY_SFC_SW_DWN': ghi, 'T2M': {k: 25.0 for k in keys}, 'CLD_FRAC': {k: 0.2 for k in keys}}
+    return request, calls
+
+def test_cells_group_nearby_sites():
+    """Test sites share a cell only when every POWER parameter comes from the same grid cells"""
+    assert power_cell(15.30, 75.10) == power_cell(15.40, 75.25)
+    assert power_cell(15.30, 75.10) != power_cell(15.30, 74.90)   # 1° solar cell boundary at 75°
+    assert power_cell(15.20, 75.10) != power_cell(15.30, 75.10)   # MERRA-2 cell boundary at 15.25°
+    rng = np.random.default_rng(0)
+    for lat, lon in zip(rng.uniform(-60, 60, 200), rng.uniform(-179, 179, 200)):
+        cell = power_cell(lat, lon)
+        assert power_cell(*cell_point(cell)) == cell
+    print("✓ Grid cell test passed")
+
+def test_one_request_per_cell():
+    """Test a fleet fetch goes upstream once per unique cell and fans parsed frames out per site"""
+    saved = data_fetcher._request_power
+    request, calls = _fake_upstream()
+    data_fetcher._request_power = request
+    try:
+        fetcher = PowerFetcher()
+        base = [(15.30, 75.10), (18.60, 73.80), (12.95, 77.55)]
+        coords = [(lat + 0.01 * (i % 5), lon + 0.01 * (i % 7)) for i in range(60) for lat, lon in [base[i % 3]]]
+        frames = fetcher.fetch_many(coords, '20240601', '20240601')
+        assert len(calls) == 3 and len(frames) == 60 and all(f is not None for f in frames)
+        assert {(lat, lon) for lat, lon, _, _ in calls} == {cell_point(power_cell(*c)) for c in base}
+
+        fetcher.fetch(15.31, 75.12, '20240601', '20240601')
+        assert len(calls) == 3
+        fetcher.fetch(15.31, 75.12, '20240602', '20240602')
+        assert len(calls) == 4   # a new date range is a new key
+    finally:
+        data_fetcher._request_power = saved
+    print("✓ One request per cell test passed")
+
+def test_concurrent_requests_coalesce():
+    """Test callers racing on one cell share a single in-flight request, and failures are retried after a short TTL"""
+    saved = data_fetcher._request_power
+    try:
+        request, calls = _fake_upstream(delay=0.2)
+        data_fetcher._request_power = request
+        fetcher = PowerFetcher()
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda i: fetcher.params(15.3 + i * 0.001, 75.1, '20240601', '20240601'),
+                                    range(16)))
+        assert len(calls) == 1 and all(r is results[0] for r in results)
+
+        request, calls = _fake_upstream(delay=0.0, fail=True)
+        data_fetcher._request_power = request
+        fetcher = PowerFetcher()
+        # An outage costs one request per cell per pass, not one per site
+        assert fetcher.fetch_many([(15.3, 75.1), (15.4, 75.2)], '20240601', '20240601') == [None, None]
+        assert fetcher.fetch(15.3, 75.1, '20240601', '20240601') is None
+        assert len(calls) == 1
+        fetcher = PowerFetcher(negative_ttl_s=0.0)
+        assert fetcher.fetch(15.3, 75.1, '20240601', '20240601') is None
+        assert fetcher.fetch(15.3, 75.1, '20240601', '20240601') is None
+        assert len(calls) == 3
+    finally:
+        data_fetcher._request_power = saved
+    print("✓ Request coalescing test passed")
+
+if __name__ == '__main__':
+    test_cells_group_nearby_sites()
+    test_one_request_per_cell()
+    test_concurrent_requests_coalesce()
+    print("\n✅ All data fetcher tests passed!")
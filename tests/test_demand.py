@@ -0,0 +1,74 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from src.demand import fit_demand_profiles, DemandProfiles, LEVEL_BOUNDS
+from src.synthetic import generate_fleet
+from src.multi_hour_optimizer import optimize_battery_schedule
+from src.pipeline import site_demand, DEFAULT_SITE
+
+def _known_load(weeks=4, freq='1h', weekend_kw=3.0):
+    """Two sites with exact weekday/hour load: hour + 1 kW on weekdays, a flat weekend."""
+    ts = pd.date_range('2024-01-01', periods=int(weeks * 7 * 24 * pd.Timedelta('1h') / pd.Timedelta(freq)), freq=freq)
+    step_h = pd.Timedelta(freq) / pd.Timedelta('1h')
+    kw = np.where(ts.dayofweek >= 5, weekend_kw, ts.hour + 1.0)
+    return pd.concat([pd.DataFrame({'site_id': site, 'timestamp': ts, 'demand_kwh': scale * kw * step_h})
+                      for site, scale in (('a', 1.0), ('b', 2.0))], ignore_index=True)
+
+def test_profiles_recover_weekday_hour_load():
+    """Test fitted profiles reproduce a known weekday/hour pattern for every site in one matrix"""
+    for freq in ('1h', '15min'):
+        profiles = fit_demand_profiles(_known_load(freq=freq))
+        assert profiles.site_ids == ['a', 'b']
+        assert np.allclose(profiles.level, 1.0)
+        # Monday 2024-01-29 follows the four weeks of history
+        matrix = profiles.forecast(48, step='1h')
+        assert matrix.shape == (2, 48)
+        assert np.allclose(matrix[0, :24], np.arange(1, 25))
+        assert np.allclose(matrix[1], 2 * matrix[0])
+        weekend = profiles.forecast(4, step='30min', start='2024-02-03 10:00')
+        assert np.allclose(weekend, [[1.5] * 4, [3.0] * 4])
+    print("✓ Weekday/hour profile test passed")
+
+def test_recent_level_adjustment():
+    """Test recent load above the profile lifts the near-term forecast, fading over the horizon"""
+    history = _known_load()
+    last_day = history['timestamp'] >= '2024-01-28'   # a Sunday, normally 3 kW flat
+    history.loc[last_day, 'demand_kwh'] *= 1.5
+    profiles = fit_demand_profiles(history)
+    assert np.all(profiles.level > 1.2) and np.all(profiles.level <= LEVEL_BOUNDS[1])
+    adjusted = profiles.forecast(72)
+    base = DemandProfiles(profiles.site_ids, profiles.profile_kw).forecast(72, start='2024-01-29')
+    ratio = adjusted / base
+    assert np.all(ratio[:, 0] > 1.2) and np.all(np.diff(ratio, axis=1) < 0) and np.all(ratio[:, -1] < 1.05)
+    print("✓ Recent level test passed")
+
+def test_demand_plugs_into_optimizer():
+    """Test learned and typical demand line up with a forecast and feed optimize_battery_schedule"""
+    fleet = generate_fleet(3, periods=24 * 21)
+    profiles = fit_demand_profiles(fleet)
+    forecast = {'mean': [1.0] * 24, 'step_minutes': 60.0,
+                'timestamps': [t.isoformat() for t in pd.date_range('2024-01-22', periods=24, freq='h')]}
+    demand = profiles.for_forecast(forecast, 'site_0001')
+    assert np.allclose(demand, profiles.forecast(24, site_ids=['site_0001'])[0])
+    assert max(demand) > 1.5 * min(demand)   # evening peak, not a constant
+    schedule = optimize_battery_schedule(forecast['mean'], demand, engine='sparse')
+    assert schedule['status'] == 'success' and len(schedule['soc']) == 24
+
+    typical = DemandProfiles.typical(['x', 'y'], [5.0, 2.0]).forecast(24, start='2024-01-22')
+    assert np.allclose(typical.mean(axis=1), [5.0, 2.0]) and typical[0].argmax() > 12
+    # A scalar demand stays flat unless the site opts into a shape
+    assert site_demand({**DEFAULT_SITE, 'demand_kwh': 2.0}, forecast) == [2.0] * 24
+    shaped = site_demand({**DEFAULT_SITE, 'demand_kwh': 2.0, 'demand_shape': 'residential'}, forecast)
+    assert np.isclose(np.mean(shaped), 2.0) and max(shaped) > 1.5 * min(shaped)
+    single = fleet[fleet['site_id'] == 'site_0001'].drop(columns='site_id')
+    assert np.allclose(site_demand(DEFAULT_SITE, forecast, single), demand)
+    print("✓ Optimizer integration test passed")
+
+if __name__ == '__main__':
+    test_profiles_recover_weekday_hour_load()
+    test_recent_level_adjustment()
+    test_demand_plugs_into_optimizer()
+    print("\n✅ All demand tests passed!")
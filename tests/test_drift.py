@@ -0,0 +1,152 @@
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from src.drift import DriftMonitor
+from src.pipeline import PipelineRunner
+from src.sensors import ingest
+
+START = pd.Timestamp('2024-06-01 06:00')
+
+def _plan(hours=12, kwh=5.0):
+    """A flat daytime PV forecast and a schedule charging 1 kWh per hour from 20 kWh."""
+    forecast = {'timestamps': [t.isoformat() for t in pd.date_range(START, periods=hours, freq='h')],
+                'mean': [kwh] * hours, 'std': [0.15 * kwh + 0.1] * hours, 'step_minutes': 60.0}
+    schedule = {'soc': [21.0 + i for i in range(hours)], 'charge': [1.0] * hours, 'discharge': [0.0] * hours}
+    return forecast, schedule
+
+def _telemetry(site_ids, minutes, pv_kw, seed=0):
+    """1 Hz PV telemetry around `pv_kw` (a per-minute array) for each site."""
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range(START, periods=minutes * 60, freq='s')
+    pv = np.repeat(np.asarray(pv_kw, dtype=float), 60)
+    noise = rng.normal(0, 0.3, len(ts) * len(site_ids))
+    return pd.DataFrame({'site_id': np.repeat(site_ids, len(ts)), 'ts': np.tile(ts, len(site_ids)),
+                         'pv_power_kw': np.clip(np.tile(pv, len(site_ids)) + noise, 0, None)})
+
+def test_cloud_drop_triggers_reforecast():
+    """Test telemetry on forecast stays quiet, a brief dip is absorbed and a sustained drop queues a re-forecast"""
+    monitor = DriftMonitor()
+    forecast, schedule = _plan()
+    for site in ('a', 'b'):
+        monitor.set_plan(site, forecast, schedule, initial_soc_kwh=20.0, capacity_kwh=50.0)
+
+    steady = np.full(60, 5.0)
+    steady[30] = 1.0   # one cloudy minute
+    assert monitor.observe_frame(_telemetry(['a', 'b'], 60, steady)) == 0
+
+    # Site a goes overcast at minute 10: queued once the drift has persisted for the debounce time
+    clouds = np.where(np.arange(60) >= 10, 1.0, 5.0)
+    frame = pd.concat([_telemetry(['a'], 60, clouds, seed=1), _telemetry(['b'], 60, steady, seed=2)])
+    frame['ts'] += pd.Timedelta(hours=1)
+    assert monitor.observe_frame(frame) == 1
+    events = monitor.drain(now=0.0)
+    assert [(e['site_id'], e['stage'], e['field']) for e in events] == [('a', 'forecast', 'pv_power_kw')]
+    fired = pd.Timestamp(events[0]['ts'])
+    assert pd.Timedelta('3min') <= fired - (START + pd.Timedelta('1h10min')) <= pd.Timedelta('6min')
+    assert 0.1 < events[0]['pv_ratio'] < 0.4   # ~1 kW observed against 5 kW forecast
+
+    # Readings outside the plan are ignored
+    monitor.observe('b', START - pd.Timedelta(hours=3), pv_power_kw=0.0)
+    assert monitor.pending == 0
+    print("✓ Cloud drop trigger test passed")
+
+def test_debounce_cooldown_and_rate_limit():
+    """Test single readings debounce, a site fires once per cooldown and drain releases at the rate limit"""
+    monitor = DriftMonitor(debounce_s=120, cooldown_s=900, max_per_minute=6, burst=2)
+    forecast, schedule = _plan()
+    sites = [f's{i}' for i in range(5)]
+    for site in sites:
+        monitor.set_plan(site, forecast, schedule, initial_soc_kwh=20.0, capacity_kwh=50.0)
+
+    # SOC 8 kWh below schedule, one reading every 30 s: crossing at the 3rd reading, queued 120 s later
+    for k in range(12):
+        ts = START + pd.Timedelta(seconds=30 * k)
+        queued = [monitor.observe(site, ts, soc_kwh=12.0 + k / 120.0) for site in sites]
+        assert all(queued) == (k >= 6) and any(queued) == (k >= 6)
+
+    # Still drifting, but inside the cooldown: not queued again after draining
+    assert len(monitor.drain(now=0.0)) == 2
+    for k in range(12, 20):
+        monitor.observe('s0', START + pd.Timedelta(seconds=30 * k), soc_kwh=12.0)
+    assert monitor.pending == 3 and monitor.drain(now=5.0) == []
+    events = monitor.drain(now=10.0) + monitor.drain(now=20.0) + monitor.drain(now=30.0)
+    assert [e['site_id'] for e in events] == ['s2', 's3', 's4']
+    assert all(e['stage'] == 'optimize' and abs(e['soc_kwh'] - 12.09) < 0.01 for e in events)
+    print("✓ Debounce, cooldown and rate limit test passed")
+
+def test_pipeline_reruns_only_drifted_sites():
+    """Test drift events re-forecast from the observed PV level or re-optimize from the observed SOC, once"""
+    monitor = DriftMonitor(debounce_s=0)
+    runner = PipelineRunner([{'site_id': 'a'}, {'site_id': 'b'}, {'site_id': 'c'}],
+                            state_dir=tempfile.mkdtemp(), persist_db=False, drift=monitor)
+    runner.tick()
+    assert all(monitor.has_plan(s) for s in 'abc')
+
+    forecast = runner.stage_output('a', 'forecast')
+    ts = pd.DatetimeIndex(forecast['timestamps'])
+    sunny = int(np.argmax(forecast['mean']))
+    planned = runner.stage_output('b', 'optimize')['soc'][sunny]
+    observed = planned - 10.0 if planned > 25.0 else planned + 10.0
+    for k in range(5):
+        t = ts[sunny] + pd.Timedelta(minutes=k)
+        monitor.observe('a', t, pv_power_kw=0.0)
+        monitor.observe('b', t, soc_kwh=observed)
+    assert sorted(runner.apply_drift(now=0.0)) == ['a', 'b']
+
+    reports = {r['site_id']: r for r in runner.tick(['a', 'b'])['sites']}
+    assert set(reports) == {'a', 'b'}
+    assert reports['a']['recomputed'] == ['forecast', 'optimize']
+    assert reports['b']['recomputed'] == ['optimize']
+
+    # The re-forecast carries the dark inverter, fading back to the model later in the horizon
+    reforecast = runner.stage_output('a', 'forecast')
+    assert reforecast['mean'][sunny] == 0.0
+    assert reforecast['mean'][-1] > 0.9 * forecast['mean'][-1] or forecast['mean'][-1] == 0.0
+    # ...so the same telemetry after the cooldown matches the new plan instead of firing again
+    for k in range(20, 25):
+        monitor.observe('a', ts[sunny] + pd.Timedelta(minutes=k), pv_power_kw=0.0)
+    assert monitor.pending == 0
+
+    # The observed SOC seeded one re-plan; the next tick is back on the configured SOC
+    assert runner._observed_soc == {}
+    reports = {r['site_id']: r for r in runner.tick()['sites']}
+    assert reports['b']['recomputed'] == ['optimize']
+    assert reports['a']['recomputed'] == reports['c']['recomputed'] == []
+    assert all(r['recomputed'] == [] for r in runner.tick()['sites'])
+    print("✓ Pipeline drift re-run test passed")
+
+def test_sensor_sites_read_their_own_device():
+    """Test a multi-device poll feeds each sensor site its mapped inverter, never the fleet total"""
+    class Recorder:
+        def __init__(self):
+            self.seen = {}
+
+        def observe(self, site_id, ts, pv_power_kw=None, soc_kwh=None):
+            self.seen[site_id] = (pv_power_kw, soc_kwh)
+
+    poll = {'timestamp': '2024-06-01T12:00:00', 'bms': {'soc_kwh': 18.0},
+            'inverter': {'pv_power_kw': 9.0, 'devices': {'inv-a': {'pv_power_kw': 4.0}, 'inv-b': None}}}
+    recorder = Recorder()
+    runner = PipelineRunner([{'site_id': 'a', 'use_sensors': True, 'sensor_device': 'inv-a'},
+                             {'site_id': 'b', 'use_sensors': True, 'sensor_device': 'inv-b'},
+                             {'site_id': 'c', 'use_sensors': True}, {'site_id': 'd'}],
+                            state_dir=tempfile.mkdtemp(), persist_db=False, drift=recorder)
+    saved = ingest.ingest_latest
+    ingest.ingest_latest = lambda: poll
+    try:
+        runner._poll_telemetry()
+    finally:
+        ingest.ingest_latest = saved
+    assert recorder.seen == {'a': (4.0, 18.0), 'b': (None, 18.0), 'c': (None, 18.0)}
+    print("✓ Per-device sensor mapping test passed")
+
+if __name__ == '__main__':
+    test_cloud_drop_triggers_reforecast()
+    test_debounce_cooldown_and_rate_limit()
+    test_pipeline_reruns_only_drifted_sites()
+    test_sensor_sites_read_their_own_device()
+    print("\n✅ All drift tests passed!")
@@ -0,0 +1,73 @@
+import sys
+import os
+import sqlite3
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from src import db
+from src.history import lttb, downsample, page_forecasts, page_schedules, mse_series
+from src.synthetic import prefill_forecast_history
+
+def test_lttb_keeps_shape():
+    """Test LTTB bounds the point count and keeps endpoints and spikes"""
+    x = np.arange(100000)
+    y = np.sin(x / 2000.0)
+    y[54321] = 25.0
+    y[77777] = -25.0
+    idx = lttb(x, y, 500)
+    assert len(idx) == 500
+    assert idx[0] == 0 and idx[-1] == len(x) - 1
+    assert np.all(np.diff(idx) > 0)
+    assert 54321 in idx and 77777 in idx
+    assert len(lttb(x[:10], y[:10], 500)) == 10
+    print("✓ LTTB shape preservation test passed")
+
+def test_downsample_datetime_frame():
+    """Test frame decimation on a datetime axis"""
+    df = pd.DataFrame({'timestamp': pd.date_range('2024-01-01', periods=5000, freq='h'),
+                       'value': np.random.default_rng(0).normal(size=5000)})
+    out = downsample(df, 'timestamp', 'value', 200)
+    assert len(out) == 200
+    assert out['timestamp'].is_monotonic_increasing
+    assert out['value'].max() == df['value'].max()
+    print("✓ Datetime downsample test passed")
+
+def test_keyset_pagination_and_series():
+    """Test pages walk the whole table without overlap and the MSE series stays bounded"""
+    saved = db.DB_PATH
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'history.db')
+    try:
+        prefill_forecast_history(1003)
+        seen, cursor, pages = [], None, 0
+        while True:
+            rows, cursor = page_forecasts(100, before_id=cursor)
+            seen.extend(r['id'] for r in rows)
+            pages += 1
+            if cursor is None:
+                break
+        assert pages == 11
+        assert seen == list(range(1003, 0, -1))
+        assert all(r['model'] == 'arima' for r in page_forecasts(50, model='arima')[0])
+
+        with sqlite3.connect(db.DB_PATH) as conn:
+            conn.execute('UPDATE forecast_history SET mse = 99.0 WHERE id = 500')
+        series = mse_series(max_points=100)
+        assert len(series) <= 100
+        assert set(series['model']) == {'linear', 'arima'}
+        assert series['mse'].max() == 99.0  # SQL bucketing keeps per-bucket extremes
+
+        db.insert_schedule(24, 'balanced', {'charge': [1.0]}, {'total_charge': 1.0, 'total_discharge': 0.0})
+        schedules, cursor = page_schedules(10)
+        assert len(schedules) == 1 and cursor is None
+        assert schedules[0]['summary']['total_charge'] == 1.0
+        print("✓ Keyset pagination test passed")
+    finally:
+        db.DB_PATH = saved
+
+if __name__ == '__main__':
+    test_lttb_keeps_shape()
+    test_downsample_datetime_frame()
+    test_keyset_pagination_and_series()
+    print("\n✅ All history tests passed!")
@@ -0,0 +1,80 @@
+import sys
+import os
+import tempfile
+import urllib.request
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import metrics
+from src.data_fetcher import load_sample_data
+from src.modeling import train_simple_regressor, forecast_hours
+from src.multi_hour_optimizer import optimize_battery_schedule
+
+def _fresh(enabled=True):
+    metrics.registry.reset()
+    metrics.enable(enabled)
+
+def test_disabled_records_nothing():
+    """Test that instrumentation is a no-op while disabled"""
+    _fresh(False)
+    with metrics.timer('noop'):
+        pass
+    metrics.count('noop_total')
+    assert metrics.registry.snapshot() == []
+    print("✓ Disabled metrics test passed")
+
+def test_timer_and_errors():
+    """Test latency histogram and error counting"""
+    _fresh()
+    with metrics.timer('work', op='a'):
+        pass
+    try:
+        with metrics.timer('work', op='a'):
+            raise RuntimeError('boom')
+    except RuntimeError:
+        pass
+    rows = {(r['name'], r['type']): r for r in metrics.registry.snapshot()}
+    assert rows[('work_seconds', 'histogram')]['count'] == 2
+    assert rows[('work_errors_total', 'counter')]['value'] == 1
+    metrics.enable(False)
+    print("✓ Timer and error test passed")
+
+def test_hot_paths_instrumented():
+    """Test that train, forecast and optimizer build/solve are recorded"""
+    _fresh()
+    df = load_sample_data()
+    features = ['hour', 'ghi', 'temp_c', 'cloud_pct']
+    model, mse = train_simple_regressor(df, features, 'output_kwh')
+    forecast = forecast_hours(model, df, features, n_hours=6)
+    optimize_battery_schedule(forecast['mean'], [5.0] * 6)
+    names = {r['name'] for r in metrics.registry.snapshot()}
+    assert {'train_seconds', 'forecast_hours_seconds', 'optimize_build_seconds', 'optimize_solve_seconds'} <= names
+    metrics.enable(False)
+    print("✓ Hot path instrumentation test passed")
+
+def test_prometheus_export():
+    """Test file and HTTP export in Prometheus text format"""
+    _fresh()
+    metrics.observe('latency_seconds', 0.02, op='x')
+    metrics.count('errors_total', op='x')
+    path = os.path.join(tempfile.mkdtemp(), 'metrics.prom')
+    metrics.write_metrics(path)
+    text = open(path).read()
+    assert 'amplifyai_latency_seconds_bucket{op="x",le="0.025"} 1' in text
+    assert 'amplifyai_errors_total{op="x"} 1' in text
+
+    server = metrics.start_http_server(0, '127.0.0.1')
+    try:
+        port = server.server_address[1]
+        body = urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5).read().decode()
+        assert 'amplifyai_latency_seconds_count{op="x"} 1' in body
+    finally:
+        server.shutdown()
+        metrics.enable(False)
+    print("✓ Prometheus export test passed")
+
+if __name__ == '__main__':
+    test_disabled_records_nothing()
+    test_timer_and_errors()
+    test_hot_paths_instrumented()
+    test_prometheus_export()
+    print("\n✅ All metrics tests passed!")
@@ -2,8 +2,12 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import numpy as np
+import pandas as pd
 from src.data_fetcher import load_sample_data
-from src.modeling import train_simple_regressor, train_arima_model, forecast_hours
+from src.solar import get_solar_table, DEFAULT_LOCATION
+from src.modeling import train_simple_regressor, train_arima_model, train_gradient_boosting, forecast_hours, forecast_fleet
+from src.synthetic import generate_site_frame
 
 def test_linear_forecast():
     """Test linear regression forecast"""
@@ -53,13 +57,64 @@ def test_confidence_intervals():
     
     forecast_data = forecast_hours(model, df, features, n_hours=24, model_type='linear')
     
-    assert all(s > 0 for s in forecast_data['std'])
+    # Uncertainty at every daylight step; none at night, where the forecast is exactly zero
+    daylight = get_solar_table(*DEFAULT_LOCATION[:2]).lookup(pd.to_datetime(forecast_data['timestamps']), 'daylight')
+    std = np.array(forecast_data['std'])
+    assert daylight.any() and np.all(std[daylight] > 0) and np.all(std[~daylight] == 0)
     assert len(forecast_data['std']) == 24
     print("✓ Confidence intervals test passed")
 
+def test_gbm_forecast():
+    """Test gradient boosting beats linear on nonlinear cloud effects and stops early"""
+    df = generate_site_frame(5000, seed=7)
+    features = ['hour', 'ghi', 'temp_c', 'cloud_pct']
+    _, linear_mse = train_simple_regressor(df, features, 'output_kwh')
+    model, mse = train_gradient_boosting(df, features, 'output_kwh', max_iter=500)
+    
+    assert mse < linear_mse
+    assert model.n_iter_ < 500
+    forecast_data = forecast_hours(model, df, features, n_hours=24, model_type='gbm')
+    assert len(forecast_data['mean']) == 24
+    assert all(f >= 0 for f in forecast_data['mean'])
+    print("✓ Gradient boosting forecast test passed")
+
+def test_gbm_time_budget_and_small_frames():
+    """Test the training time cap and tiny datasets"""
+    df = generate_site_frame(2000, seed=3)
+    features = ['hour', 'ghi', 'temp_c', 'cloud_pct']
+    model, _ = train_gradient_boosting(df, features, 'output_kwh', max_iter=1000, time_budget_s=0.0,
+                                       early_stopping=False)
+    assert model.n_iter_ == 25
+    
+    small_model, _ = train_gradient_boosting(load_sample_data(), features, 'output_kwh')
+    assert len(forecast_hours(small_model, load_sample_data(), features, n_hours=6)['mean']) == 6
+    print("✓ Gradient boosting time budget test passed")
+
+def test_fleet_forecast_single_predict():
+    """Test fleet forecasting predicts all sites in one call with per-site results"""
+    df = generate_site_frame(500, seed=1)
+    features = ['hour', 'ghi', 'temp_c', 'cloud_pct']
+    model, _ = train_simple_regressor(df, features, 'output_kwh')
+    
+    calls = []
+    class Counting:
+        def predict(self, X):
+            calls.append(X.shape)
+            return model.predict(X)
+    
+    frames = {f'site_{i}': generate_site_frame(48, seed=i) for i in range(5)}
+    out = forecast_fleet(Counting(), frames, features, n_hours=12)
+    assert calls == [(60, 4)]
+    assert set(out) == set(frames)
+    assert all(len(fc['mean']) == 12 and len(fc['timestamps']) == 12 for fc in out.values())
+    print("✓ Fleet forecast test passed")
+
 if __name__ == '__main__':
     test_linear_forecast()
     test_arima_forecast()
     test_prophet_fallback()
     test_confidence_intervals()
+    test_gbm_forecast()
+    test_gbm_time_budget_and_small_frames()
+    test_fleet_forecast_single_predict()
     print("\n✅ All model selection tests passed!")
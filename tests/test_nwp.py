@@ -0,0 +1,102 @@
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from src.nwp import write_gridded_forecast, GriddedForecast, open_gridded_forecast
+from src.modeling import train_simple_regressor, forecast_hours
+from src.pipeline import PipelineRunner
+from src.synthetic import generate_site_frame
+
+FEATURES = ['hour', 'ghi', 'temp_c', 'cloud_pct']
+LAT = np.arange(30.0, 9.0, -0.5)   # north to south, as most NWP grids
+LON = np.arange(70.0, 90.5, 0.5)
+TIMES = pd.date_range('2024-06-01', periods=48, freq='h')
+
+def _linear_field(a, b, c, d):
+    t = np.arange(len(TIMES))[:, None, None]
+    return a * LAT[None, :, None] + b * LON[None, None, :] + c * t + d
+
+def _write_run(path, issued='2024-06-01', ghi_offset=0.0):
+    write_gridded_forecast(path, LAT, LON, TIMES, {
+        'ghi': _linear_field(10.0, 5.0, 2.0, ghi_offset),
+        'temp_c': _linear_field(-0.5, 0.1, 0.0, 30.0),
+        'cloud_pct': _linear_field(1.0, 0.0, 0.5, 0.0),
+    }, issued=issued)
+
+def test_vectorized_bilinear_interpolation():
+    """Test all sites are interpolated exactly on a linear field, with NaN outside the grid"""
+    path = tempfile.mkdtemp()
+    _write_run(path)
+    grid = GriddedForecast(path)
+    assert all(isinstance(a, np.memmap) for a in grid.arrays.values())
+
+    rng = np.random.default_rng(0)
+    lats = np.append(rng.uniform(10.0, 30.0, 500), [35.0])
+    lons = np.append(rng.uniform(70.0, 90.0, 500), [80.0])
+    times, values = grid.interpolate(lats, lons, start=TIMES[5], end=TIMES[9])
+    assert list(times) == list(TIMES[5:10])
+    t = np.arange(5, 10)[:, None]
+    assert values['ghi'].shape == (5, 501)
+    assert np.allclose(values['ghi'][:, :-1], 10.0 * lats[:-1] + 5.0 * lons[:-1] + 2.0 * t, atol=1e-3)
+    assert np.allclose(values['temp_c'][:, :-1], -0.5 * lats[:-1] + 0.1 * lons[:-1] + 30.0, atol=1e-4)
+    assert np.isnan(values['ghi'][:, -1]).all()
+
+    # A cluster of sites only needs the grid cells around it
+    _, near = grid.interpolate([12.1, 12.3], [75.2, 75.4], variables=['cloud_pct'])
+    assert set(near) == {'cloud_pct'} and near['cloud_pct'].shape == (48, 2)
+    assert open_gridded_forecast(os.path.join(path, 'missing')) is None
+    print("✓ Bilinear interpolation test passed")
+
+def test_weather_feeds_forecast_hours():
+    """Test per-site weather becomes forecast inputs on the site clock, falling back past the run"""
+    path = tempfile.mkdtemp()
+    _write_run(path)
+    sites = [{'site_id': 'in', 'lat': 20.0, 'lon': 80.0, 'tz_offset_hours': 5.5},
+             {'site_id': 'out', 'lat': 45.0, 'lon': 80.0}]
+    weather = GriddedForecast(path).site_exogenous(sites)
+    assert set(weather) == {'in'}
+
+    # Local 05:30 on June 1 is the run's first valid time (00:00 UTC)
+    future = pd.date_range('2024-06-01 05:30', periods=3, freq='30min')
+    ghi = weather['in'](future)['ghi']
+    assert np.allclose(ghi, 10.0 * 20.0 + 5.0 * 80.0 + np.array([0.0, 1.0, 2.0]), atol=1e-3)
+    assert np.isnan(weather['in'](pd.DatetimeIndex(['2024-06-05 12:00']))['ghi']).all()
+
+    # History ends at local 05:00 on June 1, so the forecast starts inside the run
+    df = generate_site_frame(n_rows=96, start='2024-05-28 06:00')
+    df['timestamp'] = pd.date_range('2024-05-28 06:00', periods=96, freq='h')
+    model, _ = train_simple_regressor(df, FEATURES, 'output_kwh')
+    runs = []
+    for exogenous in (None, weather['in']):
+        np.random.seed(1)
+        runs.append(np.array(forecast_hours(model, df, FEATURES, n_hours=72, location=(20.0, 80.0, 5.5),
+                                            exogenous=exogenous)['mean']))
+    # The run covers the first 47.5 local hours after 05:30; later steps keep the built-in features
+    assert not np.allclose(runs[0][:40], runs[1][:40])
+    assert np.allclose(runs[0][-20:], runs[1][-20:])
+    print("✓ Weather forecast input test passed")
+
+def test_pipeline_reforecasts_on_new_run():
+    """Test the pipeline interpolates each weather run once and re-forecasts when a new run lands"""
+    path = tempfile.mkdtemp()
+    _write_run(path)
+    sites = [{'site_id': 'a', 'lat': 15.3647, 'lon': 75.1234}, {'site_id': 'b', 'lat': 50.0, 'lon': 75.0}]
+    runner = PipelineRunner(sites, state_dir=tempfile.mkdtemp(), persist_db=False, nwp_path=path)
+    runner.tick()
+    assert set(runner._weather) == {'a'}
+    assert all(r['recomputed'] == [] for r in runner.tick()['sites'])
+
+    _write_run(path, issued='2024-06-01T06:00', ghi_offset=50.0)
+    reports = {r['site_id']: r for r in runner.tick()['sites']}
+    assert 'forecast' in reports['a']['recomputed'] and 'train' not in reports['a']['recomputed']
+    assert reports['b']['recomputed'] == []
+    print("✓ Pipeline weather run test passed")
+
+if __name__ == '__main__':
+    test_vectorized_bilinear_interpolation()
+    test_weather_feeds_forecast_hours()
+    test_pipeline_reforecasts_on_new_run()
+    print("\n✅ All NWP tests passed!")
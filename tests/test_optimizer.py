@@ -2,7 +2,8 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.optimizer import simple_battery_opt
+import numpy as np
+from src.optimizer import simple_battery_opt, vectorized_dispatch
 
 def test_deficit_scenario():
     result = simple_battery_opt(predicted_kwh=2.0, expected_kwh=5.0, battery_capacity_kwh=50, soc_kwh=20)
@@ -22,8 +23,51 @@ def test_balanced_scenario():
     assert result['discharge_kwh'] == 0.0
     print("✓ Balanced scenario: No action needed")
 
+def test_vectorized_matches_scalar_rule():
+    """Test the fleet engine reproduces simple_battery_opt step by step (lossless, no rate limits)"""
+    rng = np.random.default_rng(0)
+    pv, demand = rng.uniform(0, 10, 72), rng.uniform(0, 10, 72)
+    result = vectorized_dispatch(pv, demand, battery_capacity_kwh=50, soc_kwh=20, roundtrip_eff=1.0)
+    soc = 20
+    for t in range(72):
+        step = simple_battery_opt(pv[t], demand[t], battery_capacity_kwh=50, soc_kwh=soc)
+        assert np.isclose(step['charge_kwh'], result['charge'][t])
+        assert np.isclose(step['discharge_kwh'], result['discharge'][t])
+        soc += step['charge_kwh'] - step['discharge_kwh']
+        assert np.isclose(soc, result['soc'][t])
+    print("✓ Vectorized dispatch matches scalar rule")
+
+def test_vectorized_limits_and_efficiency():
+    """Test rate limits, capacity, min SOC and efficiency per site"""
+    pv = np.array([[10.0] * 6 + [0.0] * 6, [10.0] * 6 + [0.0] * 6])
+    result = vectorized_dispatch(pv, 4.0, battery_capacity_kwh=[20, 100], soc_kwh=[5, 5], roundtrip_eff=0.8,
+                                 charge_rate_max=[3, 10], discharge_rate_max=2, min_soc_kwh=[5, 0])
+    assert result['charge'].shape == (2, 12)
+    assert np.allclose(result['charge'][0, :5], 3.0)
+    assert result['soc'][0].max() <= 20 + 1e-9 and result['soc'][0].min() >= 5 - 1e-9
+    assert np.isclose(result['soc'][1, 0], 5 + 0.8 * 6)
+    assert np.allclose(result['discharge'][1, 6:], 2.0)
+    assert np.allclose(result['charge'] + result['curtailed'], np.clip(pv - 4.0, 0, None))
+    assert np.allclose(result['discharge'] + result['unmet'], np.clip(4.0 - pv, 0, None))
+    print("✓ Vectorized dispatch limits test passed")
+
+def test_vectorized_fleet_year():
+    """Test 500 batteries over 8760 hours dispatch in one call (timed by the vectorized_dispatch benchmark)"""
+    rng = np.random.default_rng(1)
+    hours = np.arange(8760) % 24
+    pv = np.clip(np.sin((hours - 6) * np.pi / 12), 0, None) * 8 * rng.uniform(0.5, 1.5, (500, 1))
+    demand = 4 + 2 * rng.random((500, 8760))
+    result = vectorized_dispatch(pv, demand, battery_capacity_kwh=50, soc_kwh=20,
+                                 charge_rate_max=10, discharge_rate_max=10)
+    assert result['soc'].shape == (500, 8760)
+    assert np.all((result['soc'] >= -1e-9) & (result['soc'] <= 50 + 1e-9))
+    print("✓ Fleet-year dispatch test passed")
+
 if __name__ == '__main__':
     test_deficit_scenario()
     test_surplus_scenario()
     test_balanced_scenario()
+    test_vectorized_matches_scalar_rule()
+    test_vectorized_limits_and_efficiency()
+    test_vectorized_fleet_year()
     print("\nAll optimizer tests passed!")
@@ -0,0 +1,120 @@
+import sys
+import os
+import json
+import sqlite3
+import tempfile
+from datetime import datetime, date
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from src import db
+from src.retention import run_retention, load_forecast_rollups, load_schedule_rollups
+from src.history import mse_series
+from src.synthetic import prefill_forecast_history
+
+NOW = datetime(2024, 4, 1)  # prefilled rows run hourly from 2024-01-01
+
+def _use_temp_db():
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'retention.db')
+
+def _query(sql, params=()):
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+def _add_schedules(n):
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.executemany('''INSERT INTO battery_schedule_history (timestamp, horizon_hours, objective, summary_json, created_at)
+                        VALUES (?, 24, 'balanced', ?, ?)''',
+                     [(f'2024-01-{1 + i % 28:02d}T12:00:00',
+                       json.dumps({'total_charge': 2.0, 'total_discharge': 1.0, 'final_soc': 20.0}),
+                       f'2024-01-{1 + i % 28:02d}T12:00:00') for i in range(n)])
+    conn.commit()
+    conn.close()
+
+def test_rollup_preserves_totals():
+    """Test old rows become daily/weekly aggregates whose totals match the raw history"""
+    saved = db.DB_PATH
+    _use_temp_db()
+    try:
+        prefill_forecast_history(2000)
+        _add_schedules(56)
+        # Score the first ten runs: actuals 0.5 kWh above the forecast at every step
+        conn = sqlite3.connect(db.DB_PATH)
+        for row_id, payload, forecast_json in conn.execute(
+                'SELECT id, payload, forecast_json FROM forecast_history WHERE id <= 10').fetchall():
+            mean = db.decode_forecast_row(payload, forecast_json)['mean']
+            conn.execute('UPDATE forecast_history SET actual_json = ? WHERE id = ?',
+                         (json.dumps([float(m) + 0.5 for m in mean]), row_id))
+        conn.commit()
+        conn.close()
+        runs_before, mse_before = _query('SELECT COUNT(*), SUM(mse) FROM forecast_history')[0]
+
+        report = run_retention(keep_days=30, daily_days=60, batch_size=128, pause_s=0.0, now=NOW)
+        assert report['error'] is None
+        cutoff = '2024-03-02T00:00:00'
+        assert _query('SELECT MIN(created_at) FROM forecast_history')[0][0] >= cutoff
+        kept = _query('SELECT COUNT(*), SUM(mse) FROM forecast_history')[0]
+        assert report['forecast_history'] == runs_before - kept[0] and report['battery_schedule_history'] == 56
+
+        daily, weekly = load_forecast_rollups('day'), load_forecast_rollups('week')
+        assert daily and weekly and report['daily_folded'] > 0
+        assert min(r['period_start'] for r in daily) >= '2024-02-01'
+        assert all(date.fromisoformat(r['period_start']).weekday() == 0 for r in weekly)
+        rolled = daily + weekly
+        assert sum(r['runs'] for r in rolled) + kept[0] == runs_before
+        assert np.isclose(sum(r['avg_mse'] * r['runs'] for r in rolled) + kept[1], mse_before)
+        assert min(r['min_mse'] for r in rolled) > 0
+
+        first_week = [r for r in weekly if r['period_start'] == weekly[0]['period_start']]  # one row per model
+        assert sum(r['matched_steps'] for r in first_week) == 240
+        assert all(np.isclose(r['bias'], -0.5, atol=1e-5) and np.isclose(r['mae'], 0.5, atol=1e-5) for r in first_week)
+        schedules = load_schedule_rollups('week')
+        assert sum(r['runs'] for r in schedules) == 56
+        assert np.isclose(sum(r['total_charge'] for r in schedules), 112.0)
+
+        again = run_retention(keep_days=30, daily_days=60, now=NOW)
+        assert again['forecast_history'] == 0 and again['daily_folded'] == 0
+        assert load_forecast_rollups('week') == weekly
+
+        series = mse_series(max_points=2000)
+        assert series['timestamp'].min() < datetime(2024, 1, 8)
+        assert len(series) < 2 * kept[0]
+        print("✓ Rollup totals test passed")
+    finally:
+        db.DB_PATH = saved
+
+def test_space_is_reclaimed():
+    """Test freed pages go back to the filesystem, converting databases without auto_vacuum once when allowed"""
+    saved = db.DB_PATH
+    try:
+        for legacy in (False, True):
+            _use_temp_db()
+            if legacy:
+                conn = sqlite3.connect(db.DB_PATH)
+                conn.execute('CREATE TABLE created_before_auto_vacuum (x)')
+                conn.close()
+            prefill_forecast_history(5000)
+            assert _query('PRAGMA auto_vacuum')[0][0] == (0 if legacy else 2)
+            size = os.path.getsize(db.DB_PATH)
+            if legacy:
+                # The pipeline's scheduled retention never runs the one-time VACUUM itself
+                report = run_retention(keep_days=30, now=datetime(2024, 8, 1), pause_s=0.0, convert_vacuum=False)
+                assert report['forecast_history'] > 0 and report['pages_released'] == 0
+                assert _query('PRAGMA auto_vacuum')[0][0] == 0 and _query('PRAGMA freelist_count')[0][0] > 0
+
+            report = run_retention(keep_days=30, now=datetime(2024, 8, 1), pause_s=0.0, vacuum_pages=64)
+            assert report['pages_released'] > 0
+            assert _query('PRAGMA auto_vacuum')[0][0] == 2
+            assert _query('PRAGMA freelist_count')[0][0] == 0
+            assert os.path.getsize(db.DB_PATH) < size / 2
+        print("✓ Space reclaim test passed")
+    finally:
+        db.DB_PATH = saved
+
+if __name__ == '__main__':
+    test_rollup_preserves_totals()
+    test_space_is_reclaimed()
+    print("\n✅ All retention tests passed!")
@@ -1,9 +1,16 @@
 import sys
 import os
+import time
+import tempfile
+import threading
+import yaml
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from src.sensors import ingest
 from src.sensors.ingest import ingest_latest
 from src.sensors import inverter_api, battery_bms
+from src.sensors.modbus_tcp import plan_blocks, ModbusPoller, INVERTER_REGISTERS
+from src.sensors.simulators import BmsPtySimulator, ModbusSimulator
 
 def test_ingest_latest():
     """Test that ingest_latest returns correct structure."""
@@ -46,10 +53,146 @@ def test_bms_data_types():
     assert isinstance(result['voltage'], (int, float))
     print("✓ BMS data types test passed")
 
+def test_bms_frame_resync():
+    """Test the frame parser survives split, corrupt and garbage bytes."""
+    frames = [battery_bms.encode_telemetry_frame(10 + i, 51.2, -3.5, 25.5, 3.2, 3.3, uptime_ms=i) for i in range(20)]
+    stream = bytearray(b''.join(frames))
+    stream[len(frames[0]) * 3 + 5] ^= 0xFF          # corrupt frame 3's payload
+    stream[len(frames[0]) * 10:len(frames[0]) * 10] = b'\x00\xaa\x55\xff\x13'  # noise with a false sync
+    parser = battery_bms.BmsFrameParser(buffer_size=64)
+    readings = []
+    for i in range(0, len(stream), 5):
+        readings.extend(parser.feed(stream[i:i + 5]))
+    assert [r['uptime_ms'] for r in readings] == [i for i in range(20) if i != 3]
+    assert readings[0]['soc_kwh'] == 10.0 and readings[0]['current'] == -3.5
+    assert parser.errors >= 2
+    print("✓ BMS frame resync test passed")
+
+def test_bms_serial_pty():
+    """Test the non-blocking serial reader against a pty simulator."""
+    sim = BmsPtySimulator(rate_hz=0, corrupt_every=10).start(n_frames=300)
+    received = []
+    try:
+        with battery_bms.SerialBmsReader(sim.port, 115200, on_reading=received.append) as reader:
+            deadline = time.monotonic() + 5
+            while (len(received) < 270 or reader.parser.errors < 30) and time.monotonic() < deadline:
+                reader.poll(0.1)
+            sim.join(1.0)
+            assert len(received) == 270
+            assert reader.parser.errors == sim.corrupted == 30
+            assert reader.latest['uptime_ms'] == 2980
+    finally:
+        sim.close()
+
+    sim = BmsPtySimulator(rate_hz=200).start()
+    try:
+        result = battery_bms.read_bms_serial(f'serial:{sim.port}', 115200)
+        assert result is not None and result['source'] == 'serial_bms'
+        assert 0 <= result['soc_kwh'] <= 50
+    finally:
+        battery_bms.close_bms_serial()
+        sim.close()
+    print("✓ BMS serial pty test passed")
+
+def test_bms_serial_shared_reader():
+    """Test threads polling one shared reader neither corrupt nor drop frames."""
+    sim = BmsPtySimulator(rate_hz=0).start(n_frames=2000)
+    received = []
+    try:
+        with battery_bms.SerialBmsReader(sim.port, 115200, on_reading=received.append) as reader:
+            deadline = time.monotonic() + 10
+
+            def worker():
+                while len(received) < 2000 and time.monotonic() < deadline:
+                    reader.poll(0.01)
+            threads = [threading.Thread(target=worker) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert reader.parser.errors == 0
+            assert sorted(r['uptime_ms'] for r in received) == [i * 10 for i in range(2000)]
+    finally:
+        sim.close()
+    print("✓ BMS shared reader test passed")
+
+def test_modbus_block_planning():
+    """Test register maps coalesce into contiguous block reads."""
+    assert [(start, count) for start, count, _, _ in plan_blocks(INVERTER_REGISTERS)] == [(0, 31)]
+    registers = {'a': (0, 'u16', 1), 'b': (1, 'i32', 0.1), 'c': (100, 'u16', 1), 'd': (300, 'u16', 1)}
+    blocks = plan_blocks(registers, max_gap=8)
+    assert [(start, count) for start, count, _, _ in blocks] == [(0, 3), (100, 1), (300, 1)]
+    assert blocks[0][2].size == 6
+    print("✓ Modbus block planning test passed")
+
+def test_modbus_poller_simulator():
+    """Test concurrent polling of many inverters over persistent connections."""
+    sim = ModbusSimulator(units=range(1, 21)).start()
+    host, port = sim.address
+    devices = [{'id': f'inv-{u}', 'host': host, 'port': port, 'unit': u} for u in range(1, 23)]  # 21, 22 unknown
+    poller = ModbusPoller(devices, max_workers=8)
+    try:
+        sim.set_reading(3, {'pv_power_kw': 5.125, 'temp_c': -4.5, 'ac_power_kw': -0.25})
+        readings = poller.poll()
+        assert readings['inv-3']['pv_power_kw'] == 5.125
+        assert readings['inv-3']['temp_c'] == -4.5 and readings['inv-3']['ac_power_kw'] == -0.25
+        assert readings['inv-3']['status'] == 4
+        assert readings['inv-21'] is None and readings['inv-22'] is None
+        assert sum(r is not None for r in readings.values()) == 20
+        assert sim.requests == 22  # one block read per device
+
+        poller.poll()
+        assert sim.requests == 44
+        assert all(poller.clients[f'inv-{u}'].sock is not None for u in range(1, 21))
+    finally:
+        poller.close()
+        sim.close()
+    print("✓ Modbus poller simulator test passed")
+
+def test_ingest_modbus_provider():
+    """Test ingest_latest polls Modbus inverters when configured."""
+    sim = ModbusSimulator(units=(1, 2)).start()
+    host, port = sim.address
+    config = {'sensors': {'inverter': {'provider': 'modbus_tcp', 'devices': [
+        {'id': 'a', 'host': host, 'port': port, 'unit': 1}, {'id': 'b', 'host': host, 'port': port, 'unit': 2}]}}}
+    path = os.path.join(tempfile.mkdtemp(), 'sensor_config.yaml')
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f)
+    saved = ingest.CONFIG_PATH
+    ingest.CONFIG_PATH = path
+    try:
+        inverter = ingest_latest()['inverter']
+        assert inverter['source'] == 'modbus_tcp' and inverter['devices_ok'] == 2
+        assert inverter['pv_power_kw'] > 0
+    finally:
+        ingest.CONFIG_PATH = saved
+        inverter_api.close_modbus_pollers()
+        sim.close()
+    print("✓ Modbus ingest provider test passed")
+
+def test_fleet_total_from_cleaned_devices():
+    """Test the fleet total is re-summed from accepted devices and not range-checked itself."""
+    ts = '2024-06-01T12:00:00'
+    reading = {'ts': ts, 'pv_power_kw': 12000.0, 'source': 'modbus_tcp', 'devices': {
+        'a': {'ts': ts, 'pv_power_kw': 3000.0}, 'b': {'ts': ts, 'pv_power_kw': 4000.0},
+        'c': {'ts': ts, 'pv_power_kw': 9000.0}, 'd': None}}  # c exceeds the per-device limit
+    cleaned = ingest._clean('inverter/test_fleet', reading)
+    assert cleaned['pv_power_kw'] == 7000.0 and 'flags' not in cleaned
+    assert cleaned['devices']['c']['flags'] == {'pv_power_kw': 'out_of_range'}
+    assert cleaned['devices']['d'] is None
+    print("✓ Fleet total cleaning test passed")
+
 if __name__ == '__main__':
     test_ingest_latest()
     test_inverter_mock()
     test_bms_mock()
     test_inverter_data_types()
     test_bms_data_types()
+    test_bms_frame_resync()
+    test_bms_serial_pty()
+    test_bms_serial_shared_reader()
+    test_modbus_block_planning()
+    test_modbus_poller_simulator()
+    test_ingest_modbus_provider()
+    test_fleet_total_from_cleaned_devices()
     print("\n✅ All sensor tests passed!")
@@ -0,0 +1,117 @@
+import sys
+import os
+import subprocess
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from src import shared_store
+from src.solar import get_solar_table, _memory
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NS = f'test-{os.getpid()}'
+
+def _exists(entry_or_key):
+    name = entry_or_key.name if hasattr(entry_or_key, 'name') else shared_store.segment_name(entry_or_key, NS)
+    return os.path.exists(os.path.join(shared_store.SHM_DIR, name))
+
+def _child(code):
+    """Run `code` in a fresh interpreter with `ss` bound to src.shared_store; returns stdout."""
+    script = f"import sys; sys.path.insert(0, {ROOT!r}); from src import shared_store as ss; NS = {NS!r}\n" + code
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+def test_publish_and_attach():
+    """Test published arrays come back as read-only views, shared by every attach in the process"""
+    df = pd.DataFrame({'timestamp': pd.date_range('2024-06-01', periods=48, freq='h'),
+                       'ghi': np.linspace(0, 900, 48), 'hour': np.arange(48) % 24})
+    arrays, meta = shared_store.pack_frame(df)
+    arrays['model'] = shared_store.pack_object({'coef': [1.0, 2.0]})
+    entry = shared_store.publish('frame', arrays, {**meta, 'mse': 0.5}, namespace=NS)
+    try:
+        again = shared_store.attach('frame', namespace=NS)
+        assert again is entry and entry.refs == 2
+        frame = entry.frame()
+        pd.testing.assert_frame_equal(frame, df)
+        assert np.shares_memory(frame['ghi'].to_numpy(), entry['col:ghi'])
+        assert not entry['col:ghi'].flags.writeable
+        assert entry.load_object('model') == {'coef': [1.0, 2.0]} and entry.meta['mse'] == 0.5
+
+        try:
+            shared_store.publish('frame', arrays, namespace=NS)
+            assert False, "published the same key twice"
+        except FileExistsError:
+            pass
+        again.release()
+        assert _exists(entry)
+    finally:
+        entry.release()
+    assert not _exists(entry)
+    assert frame['ghi'].iloc[-1] == 900.0   # views outlive the release
+    print("✓ Publish and attach test passed")
+
+def test_cross_process_refcount():
+    """Test other processes attach zero-copy and the segment goes with its last live holder"""
+    entry = shared_store.publish('matrix', {'X': np.arange(1e5).reshape(-1, 4)}, namespace=NS)
+    assert _child("e = ss.attach('matrix', NS); print(e['X'].sum())") == str(np.arange(1e5).sum())
+    assert _exists(entry)
+
+    # A holder that dies without releasing is reaped on the next release
+    _child("import os; ss.attach('matrix', NS); os._exit(0)")
+    entry.release()
+    assert not _exists(entry)
+    print("✓ Cross-process refcount test passed")
+
+def test_orphans_are_reclaimed():
+    """Test segments left by a crashed publisher are swept or replaced"""
+    _child("import os; ss.publish('orphan', {'a': ss.np.ones(8)}, namespace=NS); os._exit(0)")
+    assert _exists('orphan')
+    try:
+        shared_store.attach('orphan', namespace=NS)
+        assert False, "attached to an entry with no live holder"
+    except KeyError:
+        pass
+    assert not _exists('orphan')
+
+    _child("import os; ss.publish('orphan', {'a': ss.np.ones(8)}, namespace=NS); os._exit(0)")
+    assert shared_store.sweep() >= 1 and not _exists('orphan')
+
+    _child("import os; ss.publish('orphan', {'a': ss.np.ones(8)}, namespace=NS); os._exit(0)")
+    entry = shared_store.get_or_publish('orphan', lambda: ({'a': np.zeros(8)}, {}), namespace=NS)
+    assert entry['a'].sum() == 0
+    entry.release()
+    print("✓ Orphaned segment test passed")
+
+def test_discard_keeps_old_views():
+    """Test discarding a key leaves existing views intact and never unlinks its replacement"""
+    old = shared_store.publish('forecast', {'mean': np.full(24, 1.0)}, namespace=NS)
+    view = old['mean']
+    shared_store.discard('forecast', namespace=NS)
+    new = shared_store.publish('forecast', {'mean': np.full(24, 2.0)}, namespace=NS)
+    old.release()
+    assert _exists(new) and view.sum() == 24.0
+    assert shared_store.attach('forecast', namespace=NS)['mean'].sum() == 48.0
+    new.release()
+    new.release()
+    assert not _exists(new)
+    print("✓ Discard test passed")
+
+def test_solar_tables_shared():
+    """Test solar tables are published once per host and attached by other processes"""
+    _memory.clear()
+    table = get_solar_table(12.9716, 77.5946, step_minutes=30, use_disk=False)
+    assert not table.clearsky_ghi.flags.writeable
+    out = _child("from src.solar import get_solar_table; import numpy as np\n"
+                 "t = get_solar_table(12.9716, 77.5946, step_minutes=30, use_disk=False)\n"
+                 "print(ss.attach('solar:12.972:77.595:+5.17:30').refs, float(t.clearsky_ghi.sum()))")
+    assert out == f"2 {float(table.clearsky_ghi.sum())}"
+    print("✓ Shared solar table test passed")
+
+if __name__ == '__main__':
+    test_publish_and_attach()
+    test_cross_process_refcount()
+    test_orphans_are_reclaimed()
+    test_discard_keeps_old_views()
+    test_solar_tables_shared()
+    print("\n✅ All shared store tests passed!")
@@ -0,0 +1,89 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from src.site_optimizer import optimize_site_schedule
+from src.multi_hour_optimizer import optimize_battery_schedule
+
+def _day(steps_per_hour=1, days=1):
+    hours = (np.arange(24 * steps_per_hour * days) / steps_per_hour) % 24
+    pv = np.clip(np.sin((hours - 6) * np.pi / 12), 0, None) * 8 / steps_per_hour
+    demand = np.full(len(hours), 4.0 / steps_per_hour)
+    return pv, demand
+
+def test_matches_pulp_single_battery():
+    """Test the sparse LP reaches the same unmet demand as the PuLP model"""
+    pv, demand = _day()
+    pulp_result = optimize_battery_schedule(pv.tolist(), demand.tolist())
+    sparse_result = optimize_site_schedule(pv, demand)
+    assert sparse_result['status'] == 'success'
+    assert abs(sum(pulp_result['unmet_demand']) - sparse_result['unmet_demand'].sum()) < 1e-4
+    print("✓ PuLP parity test passed")
+
+def test_sparse_engine_result_format():
+    """Test optimize_battery_schedule(engine='sparse') keeps the PuLP result format"""
+    pv, demand = _day()
+    result = optimize_battery_schedule(pv.tolist(), demand.tolist(), engine='sparse')
+    assert result['status'] == 'success'
+    assert len(result['actions']) == 24
+    assert all(0 <= s <= 50 + 1e-6 for s in result['soc'])
+    print("✓ Sparse engine format test passed")
+
+def test_multi_battery_constraints():
+    """Test per-string capacity and rate limits with several batteries"""
+    pv, demand = _day(steps_per_hour=12)
+    step_h = 1 / 12
+    batteries = [
+        {'capacity_kwh': 10, 'initial_soc_kwh': 5, 'charge_rate_max': 3, 'discharge_rate_max': 3},
+        {'capacity_kwh': 40, 'initial_soc_kwh': 10, 'charge_rate_max': 8, 'discharge_rate_max': 6, 'min_soc_kwh': 4},
+    ]
+    result = optimize_site_schedule(pv, demand, batteries, step_hours=step_h)
+    assert result['status'] == 'success'
+    assert result['soc'].shape == (2, len(pv))
+    assert result['soc'][0].max() <= 10 + 1e-6
+    assert result['soc'][1].min() >= 4 - 1e-6
+    assert result['charge'][0].max() <= 3 * step_h + 1e-6
+    assert result['discharge'][1].max() <= 6 * step_h + 1e-6
+    print("✓ Multi-battery constraints test passed")
+
+def test_energy_balance_with_grid():
+    """Test the per-step site energy balance including grid import/export limits"""
+    pv, demand = _day()
+    result = optimize_site_schedule(pv, demand, [{'capacity_kwh': 5, 'initial_soc_kwh': 0}],
+                                    grid_import_max_kw=2, grid_export_max_kw=1,
+                                    import_price=0.3, export_price=0.1, objective='minimize_cost')
+    assert result['status'] == 'success'
+    supply = pv + result['discharge'].sum(axis=0) + result['grid_import'] + result['unmet_demand']
+    use = demand + result['charge'].sum(axis=0) + result['grid_export'] + result['curtailed']
+    assert np.allclose(supply, use, atol=1e-6)
+    assert result['grid_import'].max() <= 2 + 1e-6
+    assert result['grid_export'].max() <= 1 + 1e-6
+    print("✓ Grid energy balance test passed")
+
+def test_grid_import_before_unmet():
+    """Test every non-priced objective imports from the grid rather than leave demand unmet"""
+    pv, demand = _day()
+    for objective in ('minimize_unmet', 'maximize_self_consumption', 'balanced'):
+        result = optimize_site_schedule(pv, demand, [{'capacity_kwh': 5, 'initial_soc_kwh': 0}],
+                                        grid_import_max_kw=100, objective=objective)
+        assert result['status'] == 'success'
+        assert result['unmet_demand'].max() < 1e-6, objective
+    print("✓ Grid import before unmet test passed")
+
+def test_week_at_five_minutes():
+    """Test a 2016-step horizon solves"""
+    pv, demand = _day(steps_per_hour=12, days=7)
+    result = optimize_site_schedule(pv, demand, [{}, {}], step_hours=1 / 12)
+    assert result['status'] == 'success'
+    assert result['charge'].shape == (2, 2016)
+    print(f"✓ Week horizon test passed (build {result['timings']['build_s']:.3f}s, solve {result['timings']['solve_s']:.3f}s)")
+
+if __name__ == '__main__':
+    test_matches_pulp_single_battery()
+    test_sparse_engine_result_format()
+    test_multi_battery_constraints()
+    test_energy_balance_with_grid()
+    test_grid_import_before_unmet()
+    test_week_at_five_minutes()
+    print("\n✅ All site optimizer tests passed!")
@@ -0,0 +1,72 @@
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from src import solar
+from src.solar import compute_solar_table, get_solar_table
+from src.data_fetcher import load_sample_data
+from src.modeling import train_simple_regressor, forecast_hours, forecast_fleet
+
+def test_table_geometry():
+    """Test noon is bright, midnight dark and the daylight window follows latitude and season"""
+    table = compute_solar_table(15.3647, 75.1234, tz_offset_hours=75.1234 / 15.0)
+    assert len(table.clearsky_ghi) == 366 * 24
+    noon, midnight = table.lookup(['2024-06-21 12:00', '2024-06-21 00:00'])
+    assert 900 < noon < 1100
+    assert midnight == 0
+
+    oslo = compute_solar_table(59.9, 10.75, tz_offset_hours=10.75 / 15.0)
+    summer = oslo.lookup(pd.date_range('2024-06-21', periods=24, freq='h'), 'daylight').sum()
+    winter = oslo.lookup(pd.date_range('2024-12-21', periods=24, freq='h'), 'daylight').sum()
+    assert summer >= 17 and winter <= 7
+    print("✓ Solar table geometry test passed")
+
+def test_subhourly_table():
+    """Test tables at 15-minute resolution index by minute of day"""
+    table = compute_solar_table(15.0, 75.0, step_minutes=15)
+    assert table.steps_per_day == 96
+    values = table.lookup(pd.date_range('2024-03-20 11:00', periods=4, freq='15min'))
+    assert np.all(np.diff(values) > 0)
+    print("✓ Sub-hourly table test passed")
+
+def test_disk_cache_roundtrip():
+    """Test tables are written to and reloaded from the disk cache"""
+    saved = solar.CACHE_DIR
+    solar.CACHE_DIR = tempfile.mkdtemp()
+    try:
+        first = get_solar_table(-33.87, 151.21, 10.0)
+        assert len(os.listdir(solar.CACHE_DIR)) == 1
+        solar._memory.clear()
+        second = get_solar_table(-33.87, 151.21, 10.0)
+        assert second is not first
+        assert np.array_equal(first.clearsky_ghi, second.clearsky_ghi)
+    finally:
+        solar.CACHE_DIR = saved
+    print("✓ Disk cache test passed")
+
+def test_forecast_uses_site_daylight():
+    """Test forecasts are zero outside the table's daylight window for the requested site"""
+    df = load_sample_data()
+    df['timestamp'] = pd.Timestamp('2024-06-21') + pd.to_timedelta(df['hour'], unit='h')
+    features = ['hour', 'ghi', 'temp_c', 'cloud_pct']
+    model, mse = train_simple_regressor(df, features, 'output_kwh')
+    forecast = forecast_hours(model, df, features, n_hours=24, location=(15.3647, 75.1234))
+    stamps = pd.to_datetime(forecast['timestamps'])
+    table = get_solar_table(15.3647, 75.1234)
+    night = ~table.lookup(stamps, 'daylight')
+    assert night.any() and np.all(table.lookup(stamps)[night] == 0)
+    assert np.all(np.array(forecast['mean'])[night] == 0) and np.all(np.array(forecast['std'])[night] == 0)
+    fleet = forecast_fleet(model, {'a': df}, features, n_hours=24, locations={'a': (15.3647, 75.1234)})['a']
+    assert np.all(np.array(fleet['mean'])[night] == 0) and np.all(np.array(fleet['std'])[night] == 0)
+    assert max(forecast['mean']) > 1.0
+    print("✓ Forecast daylight test passed")
+
+if __name__ == '__main__':
+    test_table_geometry()
+    test_subhourly_table()
+    test_disk_cache_roundtrip()
+    test_forecast_uses_site_daylight()
+    print("\n✅ All solar table tests passed!")
@@ -0,0 +1,80 @@
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from src.stochastic_optimizer import sample_scenarios, optimize_stochastic_schedule, optimize_battery_schedule_stochastic
+from src.multi_hour_optimizer import optimize_battery_schedule
+
+HOURS = np.arange(24)
+MEAN = np.clip(np.sin((HOURS - 6) * np.pi / 12), 0, None) * 8
+STD = 0.15 * MEAN + 0.1
+
+def test_scenarios_shape_and_spread():
+    """Test sampled scenarios are non-negative, correlated and centred on the forecast"""
+    scenarios = sample_scenarios(MEAN, STD, n_scenarios=2000, seed=1)
+    assert scenarios.shape == (2000, 24)
+    assert scenarios.min() >= 0
+    assert np.allclose(scenarios[:, 12].mean(), MEAN[12], rtol=0.05)
+    errors = scenarios - MEAN
+    assert np.corrcoef(errors[:, 11], errors[:, 12])[0, 1] > 0.5
+    print("✓ Scenario sampling test passed")
+
+def test_single_scenario_matches_deterministic():
+    """Test one scenario reproduces the deterministic LP objective"""
+    demand = [5.0] * 24
+    result = optimize_stochastic_schedule(MEAN[None, :], demand)
+    deterministic = optimize_battery_schedule(MEAN.tolist(), demand, engine='sparse')
+    assert result['status'] == 'success'
+    assert np.isclose(sum(result['unmet_demand']), sum(deterministic['unmet_demand']), atol=1e-6)
+    assert np.allclose(result['expected_unmet_demand'], result['unmet_demand'])
+    print("✓ Single scenario test passed")
+
+def test_first_stage_shared_across_scenarios():
+    """Test the first-stage action is common and respects battery limits"""
+    result = optimize_battery_schedule_stochastic(MEAN, STD, [5.0] * 24, n_scenarios=50, seed=2,
+                                                  first_stage_steps=3, battery_capacity_kwh=30,
+                                                  charge_rate_max=4, discharge_rate_max=4)
+    assert result['status'] == 'success'
+    assert len(result['first_stage']['charge']) == 3
+    assert np.allclose(result['charge'][:3], result['first_stage']['charge'])
+    assert np.allclose(result['discharge'][:3], result['first_stage']['discharge'])
+    assert max(result['discharge']) <= 4 + 1e-6
+    assert max(result['soc']) <= 30 + 1e-6
+    assert len(result['scenario_unmet']) == 50
+    assert len(result['actions']) == 24
+    print("✓ Shared first stage test passed")
+
+def test_schedule_is_one_executable_path():
+    """Test the returned schedule is a feasible path for its scenario, with expectations kept separately"""
+    demand = np.full(24, 5.0)
+    result = optimize_battery_schedule_stochastic(MEAN, STD, demand, n_scenarios=50, seed=4, initial_soc_kwh=20,
+                                                  roundtrip_eff=0.9)
+    assert result['status'] == 'success' and 0 <= result['scenario'] < 50
+    charge, discharge, soc = (np.array(result[k]) for k in ('charge', 'discharge', 'soc'))
+    # SOC follows the plan's own charge/discharge, and the plan balances the scenario's PV and demand
+    assert np.allclose(soc, 20 + np.cumsum(0.9 * charge - discharge), atol=1e-6)
+    balance = np.array(result['scenario_pv']) + discharge - charge + np.array(result['unmet_demand']) \
+        - np.array(result['excess_energy'])
+    assert np.allclose(balance, demand, atol=1e-6)
+    assert np.all(np.minimum(charge, discharge) < 1e-6)
+    assert np.allclose(charge[:1], result['first_stage']['charge'])
+    assert len(result['expected_soc']) == 24 and not np.allclose(result['expected_soc'], soc)
+    print("✓ Executable schedule path test passed")
+
+def test_hundred_scenarios_solve_quickly():
+    """Test 100+ scenarios on a 24h horizon solve in practical time"""
+    t0 = time.perf_counter()
+    result = optimize_battery_schedule_stochastic(MEAN, STD, [5.0] * 24, n_scenarios=150, seed=3)
+    assert result['status'] == 'success'
+    assert time.perf_counter() - t0 < 5.0
+    print(f"✓ 150 scenarios solved in {time.perf_counter() - t0:.2f}s")
+
+if __name__ == '__main__':
+    test_scenarios_shape_and_spread()
+    test_single_scenario_matches_deterministic()
+    test_first_stage_shared_across_scenarios()
+    test_schedule_is_one_executable_path()
+    test_hundred_scenarios_solve_quickly()
+    print("\n✅ All stochastic optimizer tests passed!")
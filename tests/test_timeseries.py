@@ -0,0 +1,106 @@
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from src.timeseries import ensure_timestamps, infer_step, resample
+from src.csv_handler import validate_csv
+from src.data_fetcher import load_sample_data, parse_power_hourly
+from src.modeling import train_simple_regressor, forecast_hours
+from src.multi_hour_optimizer import optimize_battery_schedule
+from src.synthetic import generate_fleet
+
+FEATURES = ['hour', 'ghi', 'temp_c', 'cloud_pct']
+
+def test_legacy_hours_roll_over_days():
+    """Test that hour-only frames get increasing timestamps across midnight"""
+    df = pd.DataFrame({'hour': [22, 23, 0, 1], 'ghi': [0, 0, 0, 0]})
+    out = ensure_timestamps(df, anchor='2024-06-01')
+    assert list(out['timestamp'].dt.day) == [1, 1, 2, 2]
+    assert infer_step(out) == pd.Timedelta(hours=1)
+    print("✓ Legacy hour rollover test passed")
+
+def test_resample_conserves_energy():
+    """Test 5-minute → hourly → 15-minute resampling keeps energy totals"""
+    df = generate_fleet(1, periods=12 * 48, freq='5min').drop(columns='site_id')
+    hourly = resample(df, '1h')
+    assert len(hourly) == 48
+    assert infer_step(hourly) == pd.Timedelta(hours=1)
+    assert np.isclose(hourly['output_kwh'].sum(), df['output_kwh'].sum(), rtol=1e-5)
+    quarter = resample(hourly, '15min')
+    assert len(quarter) == 48 * 4
+    assert np.isclose(quarter['output_kwh'].sum(), hourly['output_kwh'].sum(), rtol=1e-5)
+    assert quarter['ghi'].notnull().all()
+    print("✓ Resample energy conservation test passed")
+
+def test_resample_year_at_five_minutes_is_fast():
+    """Test resampling a year of 5-minute data for a few sites"""
+    df = generate_fleet(3, periods=12 * 24 * 365, freq='5min')
+    t0 = time.perf_counter()
+    hourly = resample(df, '1h', by='site_id')
+    elapsed = time.perf_counter() - t0
+    assert len(hourly) == 3 * 24 * 365
+    assert elapsed < 5.0
+    print(f"✓ Year resample test passed ({elapsed:.2f}s)")
+
+def test_subhourly_forecast():
+    """Test forecasting at the data's own 15-minute resolution"""
+    df = resample(generate_fleet(1, periods=24 * 7).drop(columns='site_id'), '15min')
+    model, mse = train_simple_regressor(df, FEATURES, 'output_kwh')
+    forecast = forecast_hours(model, df, FEATURES, n_hours=6)
+    assert len(forecast['mean']) == 24
+    assert forecast['step_minutes'] == 15
+    stamps = pd.to_datetime(forecast['timestamps'])
+    assert stamps[0] == df['timestamp'].iloc[-1] + pd.Timedelta(minutes=15)
+    assert (np.diff(stamps.to_numpy()) == np.timedelta64(15, 'm')).all()
+    print("✓ Sub-hourly forecast test passed")
+
+def test_hourly_forecast_unchanged():
+    """Test legacy hourly frames still forecast hour-of-day integers"""
+    df = load_sample_data()
+    model, mse = train_simple_regressor(df, FEATURES, 'output_kwh')
+    forecast = forecast_hours(model, df, FEATURES, n_hours=3)
+    last = int(df.iloc[-1]['hour'])
+    assert forecast['hours'] == [(last + i + 1) % 24 for i in range(3)]
+    print("✓ Hourly forecast compatibility test passed")
+
+def test_csv_with_timestamps():
+    """Test CSV uploads may carry a timestamp instead of hour"""
+    csv_content = (b"timestamp,ghi,temp_c,cloud_pct,output_kwh\n"
+                   b"2024-06-01 12:00,950,33,3,0.95\n2024-06-01 12:15,980,34,2,1.0\n"
+                   b"2024-06-01 12:30,900,32,5,0.9\n2024-06-01 12:45,850,31,8,0.85\n2024-06-01 13:00,700,30,10,0.7")
+    df, error = validate_csv(csv_content)
+    assert error is None
+    assert infer_step(df) == pd.Timedelta(minutes=15)
+    assert df['hour'].iloc[1] == 12.25
+    print("✓ Timestamp CSV test passed")
+
+def test_power_multiday_keeps_dates():
+    """Test NASA POWER parsing keeps separate days apart"""
+    keys = [f'202406{d:02d}{h:02d}' for d in (1, 2) for h in range(24)]
+    ghi = {k: max(0, 800 - abs(12 - int(k[-2:])) * 120) for k in keys}
+    df = parse_power_hourly(ghi, {k: 25 for k in keys}, {k: 0.3 for k in keys})
+    assert df['timestamp'].dt.day.nunique() == 2
+    assert df['timestamp'].is_monotonic_increasing
+    print("✓ POWER multi-day test passed")
+
+def test_optimizer_step_hours():
+    """Test rate limits scale with the step length"""
+    result = optimize_battery_schedule([0.0] * 8, [2.0] * 8, battery_capacity_kwh=50, initial_soc_kwh=40,
+                                       charge_rate_max=4, discharge_rate_max=4, step_hours=0.25)
+    assert result['status'] == 'success'
+    assert max(result['discharge']) <= 1.0 + 1e-6
+    print("✓ Optimizer step hours test passed")
+
+if __name__ == '__main__':
+    test_legacy_hours_roll_over_days()
+    test_resample_conserves_energy()
+    test_resample_year_at_five_minutes_is_fast()
+    test_subhourly_forecast()
+    test_hourly_forecast_unchanged()
+    test_csv_with_timestamps()
+    test_power_multiday_keeps_dates()
+    test_optimizer_step_hours()
+    print("\n✅ All time series tests passed!")